@@ -0,0 +1,10 @@
+"""
+python -m Onmyoji：无界面命令行入口，见core.cli
+"""
+
+import sys
+
+from Onmyoji.core.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+无界面命令行入口
+main.py启动的GUI会导入PyQt6和全部模块，计划任务中每次运行都要付出完整的界面启动开销。
+命令行只导入截图和识别相关的模块，直接调用mode_choice，日志输出为文本或JSONL，
+结束时在标准输出的最后一行输出JSON格式的运行摘要，并以退出码表示结果。
+
+用法（在项目根目录运行）:
+    python -m Onmyoji run --mode 魂土 --sub 队长 --times 100 --window <窗口句柄或标题> [--hidden]
+                          [--engine thread|async] [--log text|jsonl] [--log-file 日志文件] [--summary 摘要文件]
+    python -m Onmyoji run --mode 魂土 --times 3 --replay 截图目录或zip    # 没有游戏窗口时用回放截图运行
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from typing import List, Optional, Tuple
+
+# 退出码
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_CANCELLED = 130
+
+
+class JsonLinesLog:
+    """替换sys.stdout，把print输出的每一行写成一条JSON记录"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._pending = ''
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        with self._lock:
+            self._pending += text
+            *lines, self._pending = self._pending.split('\n')
+            for line in lines:
+                if line.strip():
+                    self._emit({'event': 'log', 'message': line})
+        return len(text)
+
+    def emit(self, event: str, **fields) -> None:
+        """写一条指定事件的记录"""
+        with self._lock:
+            self._emit(dict(fields, event=event))
+
+    def _emit(self, record: dict) -> None:
+        record = dict(time=round(time.time(), 3), **record)
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.stream.flush()
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def parse_window(value: str):
+    """
+    --window的值，整数（十进制或0x开头的十六进制）视为窗口句柄，其他视为窗口标题
+    :return: (窗口标题, 窗口句柄)
+    """
+    try:
+        return None, int(value, 0)
+    except ValueError:
+        return value, None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m Onmyoji', description='阴阳师自动挑战（无界面）')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='运行一个模式的挑战')
+    run.add_argument('--mode', required=True, help='模式，如 魂土、业原火、觉醒')
+    run.add_argument('--sub', help='子模式，如 队长、队员')
+    run.add_argument('--times', type=int, default=1, help='挑战次数')
+    target = run.add_mutually_exclusive_group(required=True)
+    target.add_argument('--window', help='游戏窗口的句柄或标题')
+    target.add_argument('--replay', help='回放截图目录或zip压缩包，代替游戏窗口')
+    run.add_argument('--hidden', action='store_true', help='使用后台识别')
+    run.add_argument('--engine', choices=('thread', 'async'), help='挑战引擎，默认使用配置文件中的engine')
+    run.add_argument('--reset-learned-regions', action='store_true', help='清除自动学习的搜索区域')
+    run.add_argument('--log', choices=('text', 'jsonl'), default='text', help='日志格式')
+    run.add_argument('--log-file', help='日志写入该文件（UTF-8），默认输出到标准输出')
+    run.add_argument('--summary', help='把运行摘要另外写入该JSON文件')
+    return parser
+
+
+def run_mode(args, cancel_token) -> Optional[dict]:
+    """读取模式配置并调用mode_choice，只导入识别相关的模块"""
+    from ..source import get_script_dir, mode_choice
+    from ..tools.config_mannager import ConfigReader
+
+    try:
+        script_dir = get_script_dir(args.mode, args.sub)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"模式配置错误: {e}")
+        return None
+    config = ConfigReader(os.path.join(script_dir, 'config.yaml')).read_config()
+    if not config:
+        return None
+
+    frame_source = None
+    window_title, hwnd = None, None
+    if args.replay:
+        from ..tools.frame_source import ReplayFrameSource
+        frame_source = ReplayFrameSource(args.replay)
+    else:
+        window_title, hwnd = parse_window(args.window)
+    try:
+        return mode_choice(args.mode, args.sub, args.times, config, window_title, hidden_window=args.hidden,
+                           reset_learned_regions=args.reset_learned_regions, frame_source=frame_source,
+                           cancel_token=cancel_token, engine=args.engine, hwnd=hwnd)
+    finally:
+        if frame_source is not None:
+            frame_source.close()
+
+
+def run_command(args) -> Tuple[int, dict]:
+    """运行挑战，返回 (退出码, 运行摘要)"""
+    from ..tools.cancellation import CancellationToken
+
+    cancel_token = CancellationToken()
+    result = []
+    started = time.time()
+    # 挑战在工作线程中运行，主线程接收Ctrl+C后通过取消信号停止挑战，保证截图线程和窗口资源被释放
+    worker = threading.Thread(target=lambda: result.append(run_mode(args, cancel_token)), name='Challenge',
+                              daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        print("收到中断信号，正在停止挑战...")
+        cancel_token.cancel('interrupt')
+        worker.join()
+
+    summary = result[0] if result and result[0] is not None else {'ok': False, 'status': 'error',
+                                                                   'error': '模式或配置文件无效'}
+    summary = dict(summary, mode=args.mode, sub_mode=args.sub, started=round(started, 3))
+    if summary.get('status') == 'cancelled':
+        exit_code = EXIT_CANCELLED
+    elif summary.get('ok'):
+        exit_code = EXIT_OK
+    else:
+        exit_code = EXIT_ERROR
+    summary['exit_code'] = exit_code
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return exit_code, summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    stdout = sys.stdout
+    log_file = open(args.log_file, 'a', encoding='utf-8') if args.log_file else None
+    log_stream = log_file or stdout
+    log = JsonLinesLog(log_stream) if args.log == 'jsonl' else log_stream
+    sys.stdout = log
+    try:
+        exit_code, summary = run_command(args)
+    finally:
+        sys.stdout = stdout
+    # 运行摘要总是作为标准输出的最后一行
+    if isinstance(log, JsonLinesLog):
+        log.emit('summary', **summary)
+        if log_file is not None:
+            JsonLinesLog(stdout).emit('summary', **summary)
+    else:
+        if log_file is not None:
+            log_file.write(json.dumps(summary, ensure_ascii=False) + '\n')
+        print(json.dumps(summary, ensure_ascii=False))
+    if log_file is not None:
+        log_file.close()
+    return exit_code
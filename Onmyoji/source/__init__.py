@@ -26,7 +26,18 @@ MODE_MAPPING = {
     '契灵探查': 'qilingtancha'
 }
 
-__all__ = ['mode_choice']
+__all__ = ['mode_choice', 'fleet_choice']
+
+# 挑战引擎：thread为每个窗口一个阻塞线程，async为asyncio事件循环（见async_engine）
+ENGINES = ('thread', 'async')
+
+def _select_engine(config, engine=None) -> str:
+    """参数指定的引擎优先，其次是配置文件中的engine，默认thread"""
+    engine = engine or (config or {}).get('engine') or 'thread'
+    if engine not in ENGINES:
+        print(f"不支持的挑战引擎: {engine}，使用thread引擎")
+        return 'thread'
+    return engine
 
 # 带缓存的路径获取函数
 @lru_cache(maxsize=20)
@@ -50,7 +61,15 @@ def get_script_dir(mode: str, sub_mode: Optional[str] = None) -> str:
     return script_dir
 
 # 优化后的模式选择函数
-def mode_choice(mode, sub_mode, times, config, window_title, hidden_window=False):
+def mode_choice(mode, sub_mode, times, config, window_title, hidden_window=False, reset_learned_regions=False,
+                frame_source=None, cancel_token=None, engine=None, hwnd=None):
+    """
+    :param frame_source: 可选的截图源，见common_challenge
+    :param cancel_token: 可选的取消信号（CancellationToken），取消后挑战在一个轮询周期内结束
+    :param engine: 挑战引擎，thread或async，为None时使用配置文件中的engine
+    :param hwnd: 可选的窗口句柄，指定时不再按window_title查找窗口
+    :return: 运行摘要（见ChallengeRunner.summary），模式不存在时返回None
+    """
     try:
         # 调用缓存函数获取路径
         script_dir = get_script_dir(mode, sub_mode)
@@ -63,5 +82,29 @@ def mode_choice(mode, sub_mode, times, config, window_title, hidden_window=False
         return
 
     # 执行通用挑战函数（保持原有逻辑）
-    from .common_challenge import common_challenge
-    common_challenge(times, config, script_dir, window_title, hidden_window)
\ No newline at end of file
+    if _select_engine(config, engine) == 'async':
+        from .async_engine import async_challenge as challenge
+    else:
+        from .common_challenge import common_challenge as challenge
+    return challenge(times, config, script_dir, window_title, hidden_window, reset_learned_regions, frame_source,
+                     cancel_token, hwnd)
+
+def fleet_choice(mode, sub_mode, times, config, targets, hidden_window=True, workers=None, cancel_token=None,
+                 engine=None):
+    """
+    在多个窗口上同时运行同一个模式，见fleet.run_fleet
+    :param targets: 窗口句柄列表
+    :param workers: 识别线程数
+    :param engine: 挑战引擎，thread或async，为None时使用配置文件中的engine
+    """
+    try:
+        script_dir = get_script_dir(mode, sub_mode)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"模式配置错误: {e}")
+        return []
+
+    if _select_engine(config, engine) == 'async':
+        from .async_engine import run_fleet_async as run_fleet
+    else:
+        from .fleet import run_fleet
+    return run_fleet(times, config, script_dir, targets, hidden_window, workers, cancel_token)
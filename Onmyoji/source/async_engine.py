@@ -0,0 +1,174 @@
+"""
+asyncio挑战引擎
+线程引擎中每个窗口是一个阻塞的线程，轮询间隔、点击后的等待都用sleep实现，开几十个窗口就是几十个睡眠中的线程。
+异步引擎在一个事件循环中驱动所有窗口：轮询间隔、点击后的随机等待和等待画面响应都是协程中的定时器，
+截图和模板匹配交给固定大小的线程池（也可以再配合多进程匹配后端），点击通过input_sink发出。
+挑战逻辑（场景、计数、轮询调度、模板优先级）与线程引擎共用ChallengeRunner，识别、点击和等待响应的流程
+共用ChallengeRunner.steps产生的步骤，两种引擎只是执行步骤的方式不同。
+配置文件中设置 engine: async 时由mode_choice/fleet_choice选用。
+"""
+
+import asyncio
+import inspect
+import time
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List, Optional, Sequence
+
+from ..tools.OnmyojiAuto import ClickStep, WaitStep
+from ..tools.cancellation import CancellationToken
+from .common_challenge import ChallengeRunner, failed_summary
+from .fleet import DEFAULT_FLEET_WORKERS, create_runners, print_fleet_statistics
+
+# 点击的接收方 input_sink(截图源, x, y)，可以是普通函数或协程函数，默认在识别线程中调用截图源的click
+InputSink = Callable[..., object]
+
+
+class AsyncChallengeRunner:
+    """在事件循环中驱动一个ChallengeRunner，同一时间只有一个识别或点击在线程池中执行"""
+
+    def __init__(self, runner: ChallengeRunner, executor: Executor, input_sink: Optional[InputSink] = None):
+        self.runner = runner
+        self.automation_obj = runner.automation_obj
+        self.executor = executor
+        self.input_sink = input_sink
+        self._loop = None
+        self._cancelled = None
+
+    async def _call(self, func, *args, **kwargs):
+        """在线程池中执行阻塞调用（截图、匹配、发送点击）"""
+        return await self._loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def sleep(self, seconds: float) -> bool:
+        """
+        等待指定时间，期间被取消时立即返回
+        :return: 是否已被取消
+        """
+        if seconds > 0 and not self._cancelled.is_set():
+            try:
+                await asyncio.wait_for(self._cancelled.wait(), seconds)
+            except asyncio.TimeoutError:
+                pass
+        return self.runner.cancel_token.cancelled
+
+    async def click(self, source, x: int, y: int) -> None:
+        """在客户区坐标(x, y)处点击"""
+        if self.input_sink is None:
+            await self._call(self.automation_obj.send_click, source, x, y)
+            return
+        result = self.input_sink(source, x, y)
+        if inspect.isawaitable(result):
+            await result
+
+    async def execute_step(self, step):
+        """同OnmyjiAutomation.execute_step，等待不占用线程，阻塞调用交给线程池"""
+        if isinstance(step, WaitStep):
+            return await self.sleep(step.seconds)
+        if isinstance(step, ClickStep):
+            return await self.click(step.source, step.x, step.y)
+        return await self._call(step.func)
+
+    async def run_steps(self, steps):
+        """
+        同OnmyjiAutomation.run_steps，在事件循环中执行步骤生成器
+        :return: 生成器的返回值
+        """
+        result, error = None, None
+        while True:
+            try:
+                step = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                result, error = await self.execute_step(step), None
+            except Exception as e:
+                result, error = None, e
+
+    async def tick(self):
+        """
+        等到下一次轮询时间，做一次识别和操作，同ChallengeRunner.tick
+        :return: 命中的模板名，没有命中时返回None
+        """
+        runner = self.runner
+        scheduler = runner.scheduler
+        delay = scheduler.remaining()
+        if delay > 0 and await self.sleep(delay):
+            return None
+        scheduler.mark_tick(delay)
+        return await self.run_steps(runner.steps())
+
+    async def run(self) -> None:
+        """运行到挑战完成、取消或截图源结束"""
+        self._loop = asyncio.get_running_loop()
+        self._cancelled = asyncio.Event()
+        # 从其他线程（GUI的紧急停止）取消时唤醒事件循环
+        wake = partial(self._loop.call_soon_threadsafe, self._cancelled.set)
+        token = self.runner.cancel_token
+        token.add_callback(wake)
+        try:
+            while not self.runner.finished:
+                await self.tick()
+        finally:
+            token.remove_callback(wake)
+        self.runner.report()
+
+
+async def run_runners(runners: Sequence[ChallengeRunner], workers: int,
+                      input_sink: Optional[InputSink] = None) -> List[Optional[BaseException]]:
+    """
+    在当前事件循环中同时运行多个ChallengeRunner，一个窗口出错不影响其他窗口
+    :param workers: 截图和匹配的线程数
+    :return: 每个窗口的致命错误，正常结束时为None
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='AsyncWorker') as executor:
+        results = await asyncio.gather(*(AsyncChallengeRunner(runner, executor, input_sink).run()
+                                         for runner in runners), return_exceptions=True)
+    return [result if isinstance(result, BaseException) else None for result in results]
+
+
+def async_challenge(times, config, script_dir, window_title, hidden_window=False, reset_learned_regions=False,
+                    frame_source=None, cancel_token=None, hwnd=None, input_sink: Optional[InputSink] = None) -> dict:
+    """
+    用异步引擎运行挑战，参数和返回值同common_challenge
+    :param input_sink: 可选的点击接收方 input_sink(截图源, x, y)，测试时可以记录点击而不发送到窗口
+    """
+    runner = None
+    try:
+        runner = ChallengeRunner(times, config, script_dir, window_title, hidden_window, reset_learned_regions,
+                                 frame_source, cancel_token, hwnd)
+        [error] = asyncio.run(run_runners([runner], 1, input_sink))
+        if error is not None:
+            raise error
+        return runner.summary()
+    except Exception as e:
+        print(f"错误：挑战过程中发生致命错误：{str(e)}")
+        return failed_summary(runner, e)
+    finally:
+        if runner is not None:
+            runner.close()
+
+
+def run_fleet_async(times, config, script_dir, targets: Sequence, hidden_window=True, workers: Optional[int] = None,
+                    cancel_token: Optional[CancellationToken] = None,
+                    input_sink: Optional[InputSink] = None) -> List[ChallengeRunner]:
+    """用异步引擎在多个窗口上同时运行挑战，参数同fleet.run_fleet"""
+    cancel_token = cancel_token if cancel_token is not None else CancellationToken()
+    runners = create_runners(times, config, script_dir, targets, hidden_window, cancel_token)
+    if not runners:
+        print("没有可以运行的窗口")
+        return runners
+
+    workers = max(1, min(workers or DEFAULT_FLEET_WORKERS, len(runners)))
+    print(f"多窗口挑战（异步引擎）：{len(runners)} 个窗口，{workers} 个识别线程")
+    started = time.monotonic()
+    try:
+        errors = asyncio.run(run_runners(runners, workers, input_sink))
+        for runner, error in zip(runners, errors):
+            if error is not None:
+                print(f"{runner.prefix}错误：挑战过程中发生致命错误：{str(error)}")
+    finally:
+        for runner in runners:
+            runner.close()
+    print_fleet_statistics(runners, time.monotonic() - started)
+    return runners
@@ -4,51 +4,281 @@
 
 import os
 import time
-from ..tools.OnmyojiAuto import OnmyjiAutomation
+from ..tools.OnmyojiAuto import DEFAULT_CLICK_DELAY, DEFAULT_CLICK_TIMEOUT, OnmyjiAutomation
+from ..tools.cancellation import CancellationToken
+from ..tools.search_region import DEFAULT_FALLBACK_MISSES, LEARNED_REGIONS_FILE, parse_region
+from ..tools.template_matcher import DEFAULT_FALLBACK_MARGIN, MatchStrategy
+from ..tools.frame_gate import DEFAULT_CHANGE_THRESHOLD, DEFAULT_MAX_SKIPS
+from ..tools.scene_machine import parse_scenes
+from ..tools.template_priority import DEFAULT_RARE_INTERVAL, TEMPLATE_STATS_FILE, TemplatePriority
+from ..tools.poll_scheduler import DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, PollScheduler
+from ..tools.process_matcher import get_process_matcher
 
-def common_challenge(times, config, script_dir, window_title, hidden_window=False):
-    try:
-        automation_obj = OnmyjiAutomation(window_title)
+def load_image_specs(config, script_dir):
+    """
+    解析配置文件中的image_paths
+    每一项既可以直接写图片文件名，也可以写成
+    {path: 文件名, region: [left, top, width, height], method: 主算法, fallback_method: 备用算法}
+    :return: ({模板名: 图片完整路径}, {模板名: 搜索区域}, {模板名: 匹配策略})
+    """
+    image_paths = {}
+    regions = {}
+    strategies = {}
+    for k, v in config['image_paths'].items():
+        if isinstance(v, dict):
+            image_paths[k] = os.path.join(script_dir, v['path'])
+            region = parse_region(v.get('region'))
+            if region:
+                regions[k] = region
+            if 'method' in v or 'fallback_method' in v:
+                strategies[k] = MatchStrategy(v.get('method', 'ccoeff'), v.get('fallback_method'),
+                                              v.get('fallback_margin', DEFAULT_FALLBACK_MARGIN))
+        else:
+            image_paths[k] = os.path.join(script_dir, v)
+    return image_paths, regions, strategies
+
+
+def create_template_priority(config, script_dir):
+    """
+    按模式配置创建模板命中率统计，配置中没有开启template_priority时返回None
+    多窗口运行同一模式时先创建一份，再传给每个窗口的ChallengeRunner
+    """
+    if not config.get('template_priority', False):
+        return None
+    return TemplatePriority(os.path.join(script_dir, TEMPLATE_STATS_FILE),
+                            int(config.get('rare_template_interval', DEFAULT_RARE_INTERVAL)))
+
+class ChallengeRunner:
+    """
+    一个窗口上的一次挑战任务
+    初始化时完成模板预加载和各项识别设置，之后每次tick做一次截图识别和操作；
+    common_challenge在当前线程中循环调用tick，多窗口调度（fleet）在线程池中轮流调用各个窗口的tick
+    """
+
+    def __init__(self, times, config, script_dir, window_title, hidden_window=False, reset_learned_regions=False,
+                 frame_source=None, cancel_token=None, hwnd=None, template_priority=None):
+        """
+        参数同common_challenge
+        :param hwnd: 可选的窗口句柄，指定时不再按window_title查找窗口
+        :param template_priority: 多个窗口共用的模板命中率统计（create_template_priority），为None时按配置单独创建
+        """
+        self.times = times
+        self.cancel_token = cancel_token if cancel_token is not None else CancellationToken()
+        self.frame_source = frame_source
+        self.automation_obj = OnmyjiAutomation(window_title, frame_source=frame_source,
+                                               cancel_token=self.cancel_token, hwnd=hwnd)
+        automation_obj = self.automation_obj
+        self.name = automation_obj.window_title or str(automation_obj.hwnd or 'frame_source')
+        # 多窗口运行时在输出前加上窗口名，单窗口时为空
+        self.prefix = ''
+        if frame_source is not None:
+            hidden_window = True
+        self.hidden_window = hidden_window
 
         # 预先构建好所有图片路径并预加载
-        image_paths = {}
-        for k, v in config['image_paths'].items():
-            path = os.path.join(script_dir, v)
-            image_paths[k] = path
+        image_paths, regions, strategies = load_image_specs(config, script_dir)
+        for path in image_paths.values():
             # 预加载图像以提高后续识别速度
             automation_obj.preload_image(path)
+        self.image_paths = image_paths
 
         print(f"已预加载 {len(image_paths)} 张图像模板")
 
-        i = 0
-        retry_count = 0
-        max_retries = 3
-        last_error_time = 0
-        error_cooldown = 5  # 错误重试冷却时间（秒）
-
-        while i < times:
-            # 动态遍历配置文件中的所有图片键
-            for key in config['image_paths']:
-                img_path = image_paths[key]
-                try:
-                    # 尝试识别并执行操作，启用低置信度重试
-                    if automation_obj.perform_action(img_path, hidden_window=hidden_window):
-                        # 执行开始操作后，i来充当计数器
-                        if key == 'tiaozhan' or key == 'kaishi':
-                            i += 1
-                            retry_count = 0  # 成功后重置重试计数
-                            print(f"还剩{times - i}次挑战")
-                        elif key == 'xiezhu':
-                            print("注意！！！已自动为您拒绝好友的协助！！！")
-                        elif key == 'baocang':
-                            print("Warning: 您的御魂已爆仓，请注意清理御魂！！！")
-                    else:
-                        pass
-                except Exception as e:
-                    pass
-
-        print(f"挑战完成！共执行{times}次挑战")
-        return True
+        # 配置了搜索区域的模板只在区域内匹配，其余模板根据命中位置自动学习区域，连续未命中后回退全图
+        automation_obj.set_search_regions(regions, config.get('region_fallback_misses', DEFAULT_FALLBACK_MISSES),
+                                          learned_path=os.path.join(script_dir, LEARNED_REGIONS_FILE))
+        if reset_learned_regions:
+            automation_obj.reset_learned_regions()
+        if regions:
+            print(f"已为 {len(regions)} 张图像模板启用区域搜索")
+        automation_obj.set_match_strategies(strategies)
+        # 按本模式的历史命中率决定匹配顺序，第一个命中后停止，冷门模板隔几轮才匹配一次
+        # 会改变配置文件中的优先级顺序（协战、爆仓提示可能被跳过），需要在模式配置中显式开启
+        if template_priority is None:
+            template_priority = create_template_priority(config, script_dir)
+        automation_obj.template_priority = template_priority
+        # 画面未变化时复用上次的匹配结果，frame_change_threshold为0时关闭
+        automation_obj.set_frame_gate(config.get('frame_change_threshold', DEFAULT_CHANGE_THRESHOLD),
+                                      config.get('frame_change_max_skips', DEFAULT_MAX_SKIPS))
+
+        # 点击后等待画面变化再继续，click_delay为随机的最短等待时间
+        automation_obj.set_click_timing(config.get('click_delay', DEFAULT_CLICK_DELAY),
+                                        float(config.get('click_timeout', DEFAULT_CLICK_TIMEOUT)))
+
+        # 金字塔匹配层级，0为关闭，1/2表示先在1/2或1/4缩小的截图上粗定位
+        self.pyramid_level = int(config.get('pyramid_level', 0))
+
+        # 匹配进程数，大于0时模板匹配交给多进程后端，同一进程中的所有窗口共用，默认0为在当前线程中匹配
+        match_processes = int(config.get('match_processes', 0))
+        if match_processes > 0:
+            automation_obj.set_match_backend(get_process_matcher(match_processes))
+
+        # 后台截图线程的帧率，大于0时截图与识别在不同线程中进行，默认0为同步截图
+        capture_fps = float(config.get('capture_fps', 0))
+        if hidden_window and capture_fps > 0:
+            automation_obj.start_capture_worker(capture_fps)
+
+        # 配置了场景时只匹配当前场景和下一步可能出现的场景的模板，只在进入计数场景时计数
+        self.scenes = parse_scenes(config, image_paths)
+        if self.scenes is not None:
+            print(f"已启用场景状态机，共 {len(self.scenes.scenes)} 个场景")
+
+        # 没有识别到模板时逐渐拉长轮询间隔，执行操作或画面变化后恢复；回放/合成截图源不需要等待
+        if automation_obj.hwnd:
+            self.scheduler = PollScheduler(float(config.get('poll_min_interval', DEFAULT_MIN_INTERVAL)),
+                                           float(config.get('poll_max_interval', DEFAULT_MAX_INTERVAL)),
+                                           sleep=self.cancel_token.sleep)
+        else:
+            self.scheduler = PollScheduler(0, 0)
+
+        # 已完成的挑战次数
+        self.completed = 0
+        self.started = time.monotonic()
+        self.ended = None
+
+    @property
+    def finished(self) -> bool:
+        """挑战次数已完成、已取消或截图源已结束"""
+        return (self.completed >= self.times or self.cancel_token.cancelled
+                or (self.frame_source is not None and self.frame_source.exhausted))
+
+    def tick(self):
+        """
+        等到下一次轮询时间，做一次识别和操作
+        :return: 命中的模板名，没有命中时返回None
+        """
+        self.scheduler.wait()
+        return self.automation_obj.run_steps(self.steps())
+
+    def steps(self):
+        """
+        一次识别和操作的步骤生成器（不含轮询等待），线程引擎由tick执行，异步引擎在事件循环中执行
+        截图和匹配的错误由action_steps输出并视为本轮未命中，这里抛出的异常（模拟器不支持后台模式、
+        程序错误）都是致命错误，由调用方结束该窗口的挑战
+        :return: 命中的模板名，没有命中时返回None
+        """
+        if self.cancel_token.cancelled:
+            return None
+        # 一次截图匹配配置文件中的所有图片（或当前场景的候选图片），只处理优先级最高的命中项
+        templates, observe_only = self.candidates()
+        key = yield from self.automation_obj.action_steps(templates, hidden_window=self.hidden_window,
+                                                          pyramid_level=self.pyramid_level,
+                                                          observe_only=observe_only)
+        self.handle(key)
+        return key
+
+    def candidates(self):
+        """
+        本轮需要匹配的模板
+        :return: ({模板名: 图片路径}, 只识别不点击的模板名)
+        """
+        if self.scenes is None:
+            return self.image_paths, ()
+        return self.scenes.select(self.image_paths), self.scenes.observe_only()
+
+    def handle(self, key) -> None:
+        """根据本轮命中的模板更新场景、挑战计数和轮询间隔"""
+        if self.scenes is None:
+            counted = key == 'tiaozhan' or key == 'kaishi'
+        else:
+            counted = self.scenes.advance(key)
+        self.scheduler.update(key is not None, self.automation_obj.frame_gate.changed)
+        # 执行开始操作后，completed来充当计数器
+        if counted:
+            self.completed += 1
+            print(f"{self.prefix}还剩{self.times - self.completed}次挑战")
+        elif key == 'xiezhu':
+            print(f"{self.prefix}注意！！！已自动为您拒绝好友的协助！！！")
+        elif key == 'baocang':
+            print(f"{self.prefix}Warning: 您的御魂已爆仓，请注意清理御魂！！！")
+
+    def report(self) -> None:
+        """输出结束原因和统计信息"""
+        if self.ended is None:
+            self.ended = time.monotonic()
+        if self.completed >= self.times:
+            print(f"{self.prefix}挑战完成！共执行{self.times}次挑战")
+        elif self.cancel_token.cancelled:
+            print(f"{self.prefix}挑战已停止，共完成{self.completed}次挑战")
+        elif self.frame_source is not None and self.frame_source.exhausted:
+            print(f"{self.prefix}截图源已结束，共完成{self.completed}次挑战")
+        self.automation_obj.print_match_statistics()
+        if self.scenes is not None:
+            print(f"场景状态机: {self.scenes.summary()}")
+        print(f"轮询调度: {self.scheduler.summary()}")
+
+    @property
+    def elapsed(self) -> float:
+        return (self.ended or time.monotonic()) - self.started
+
+    @property
+    def status(self) -> str:
+        """结束原因：completed、cancelled、exhausted，还没有结束时为running"""
+        if self.completed >= self.times:
+            return 'completed'
+        if self.cancel_token.cancelled:
+            return 'cancelled'
+        if self.frame_source is not None and self.frame_source.exhausted:
+            return 'exhausted'
+        return 'running'
+
+    def summary(self) -> dict:
+        """机器可读的运行摘要，命令行和计划任务使用"""
+        return {
+            'ok': True,
+            'window': self.name,
+            'status': self.status,
+            'times': self.times,
+            'completed': self.completed,
+            'elapsed': round(self.elapsed, 3),
+            'ticks': self.scheduler.ticks,
+            'idle_ticks': self.scheduler.idle_ticks,
+        }
+
+    def throughput(self) -> str:
+        """识别次数和完成的挑战次数的吞吐量"""
+        elapsed = max(self.elapsed, 1e-6)
+        return (f"{self.scheduler.ticks} 次识别（{self.scheduler.ticks / elapsed:.1f} 次/秒），"
+                f"完成 {self.completed} 次挑战（{self.completed * 3600 / elapsed:.1f} 次/小时）")
+
+    def close(self) -> None:
+        """停止后台截图线程并保存模板统计"""
+        if self.ended is None:
+            self.ended = time.monotonic()
+        automation_obj = self.automation_obj
+        if automation_obj is not None:
+            automation_obj.stop_capture_worker()
+            if automation_obj.template_priority is not None:
+                automation_obj.template_priority.save()
+
+
+def failed_summary(runner, error) -> dict:
+    """发生致命错误时的运行摘要"""
+    summary = runner.summary() if runner is not None else {}
+    summary.update(ok=False, status='error', error=str(error))
+    return summary
+
+
+def common_challenge(times, config, script_dir, window_title, hidden_window=False, reset_learned_regions=False,
+                     frame_source=None, cancel_token=None, hwnd=None):
+    """
+    :param frame_source: 截图源，为None时截取window_title对应的游戏窗口；
+                         传入回放/合成截图源时强制使用后台识别，可以在没有游戏窗口的机器上运行
+    :param cancel_token: 取消信号（CancellationToken），取消后在一个轮询周期内结束挑战
+    :param hwnd: 可选的窗口句柄，指定时不再按window_title查找窗口
+    :return: 运行摘要（ChallengeRunner.summary），发生致命错误时ok为False
+    """
+    runner = None
+    try:
+        runner = ChallengeRunner(times, config, script_dir, window_title, hidden_window, reset_learned_regions,
+                                 frame_source, cancel_token, hwnd)
+        while not runner.finished:
+            runner.tick()
+        runner.report()
+        return runner.summary()
     except Exception as e:
         print(f"错误：挑战过程中发生致命错误：{str(e)}")
-        return False
+        return failed_summary(runner, e)
+    finally:
+        if runner is not None:
+            runner.close()
@@ -0,0 +1,124 @@
+"""
+多窗口挑战调度
+多开时每个窗口各开一个GUI线程运行common_challenge，各自按自己的节奏截图和匹配，窗口越多CPU占用越高。
+这里用一个调度线程驱动多个窗口的ChallengeRunner：
+所有窗口共用进程内的模板缓存（只读），识别和操作在固定大小的线程池中执行，同时进行的识别数量有上限；
+调度按轮转顺序提交已到轮询时间的窗口，刚执行完的窗口排到队尾，每个窗口都能轮到。
+结束时输出每个窗口和整体的识别次数与挑战次数吞吐量。
+"""
+
+import os
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional, Sequence
+
+from ..tools.cancellation import CancellationToken
+from ..tools.frame_source import FrameSource
+from .common_challenge import ChallengeRunner, create_template_priority
+
+# 默认的识别线程数，matchTemplate运行时会释放GIL，一半的CPU核心数足以让多个窗口并行识别
+DEFAULT_FLEET_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# 没有窗口到达轮询时间时，调度线程最长的等待时间（秒）
+IDLE_WAIT = 0.05
+
+
+def create_runners(times, config, script_dir, targets: Sequence, hidden_window: bool,
+                   cancel_token: CancellationToken) -> List[ChallengeRunner]:
+    """为每个窗口（或截图源）创建ChallengeRunner，初始化失败的窗口跳过，同一模式的模板命中率统计共用一份"""
+    runners = []
+    # 同一模式的模板命中率统计在创建窗口前建好，所有窗口共用一份
+    template_priority = create_template_priority(config, script_dir)
+    for index, target in enumerate(targets):
+        try:
+            if isinstance(target, FrameSource):
+                runner = ChallengeRunner(times, config, script_dir, None, hidden_window,
+                                         frame_source=target, cancel_token=cancel_token,
+                                         template_priority=template_priority)
+                runner.name = f"截图源{index + 1}"
+            else:
+                runner = ChallengeRunner(times, config, script_dir, None, hidden_window,
+                                         cancel_token=cancel_token, hwnd=target,
+                                         template_priority=template_priority)
+        except Exception as e:
+            print(f"错误：窗口 {target} 初始化失败：{str(e)}")
+            continue
+        runner.prefix = f"[{runner.name}] "
+        runners.append(runner)
+    return runners
+
+
+def print_fleet_statistics(runners: Sequence[ChallengeRunner], elapsed: float) -> None:
+    """输出每个窗口和整体的识别次数与挑战次数吞吐量"""
+    elapsed = max(elapsed, 1e-6)
+    print("多窗口挑战统计:")
+    for runner in runners:
+        print(f"  {runner.name}: {runner.throughput()}")
+    ticks = sum(runner.scheduler.ticks for runner in runners)
+    completed = sum(runner.completed for runner in runners)
+    print(f"  合计: {ticks} 次识别（{ticks / elapsed:.1f} 次/秒），完成 {completed} 次挑战"
+          f"（{completed * 3600 / elapsed:.1f} 次/小时），耗时 {elapsed:.1f} 秒")
+
+
+def run_fleet(times, config, script_dir, targets: Sequence, hidden_window=True, workers: Optional[int] = None,
+              cancel_token: Optional[CancellationToken] = None) -> List[ChallengeRunner]:
+    """
+    在多个窗口上同时运行同一个模式的挑战，每个窗口各自完成times次挑战
+
+    :param targets: 窗口句柄列表，也可以是截图源（回放/合成截图源，用于测试）
+    :param hidden_window: 是否使用后台识别，多开时通常只能使用后台识别
+    :param workers: 识别线程数，默认DEFAULT_FLEET_WORKERS，不超过窗口数
+    :param cancel_token: 取消信号，取消后所有窗口在一个轮询周期内结束
+    :return: 各窗口的ChallengeRunner，可以读取完成次数等统计
+    """
+    cancel_token = cancel_token if cancel_token is not None else CancellationToken()
+    runners = create_runners(times, config, script_dir, targets, hidden_window, cancel_token)
+    if not runners:
+        print("没有可以运行的窗口")
+        return runners
+
+    workers = max(1, min(workers or DEFAULT_FLEET_WORKERS, len(runners)))
+    print(f"多窗口挑战：{len(runners)} 个窗口，{workers} 个识别线程")
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='FleetWorker') as pool:
+            queue = deque(runners)
+            pending = {}
+            while queue or pending:
+                # 按轮转顺序提交已到轮询时间的窗口，线程池满时剩下的窗口下次优先
+                next_due = IDLE_WAIT
+                for _ in range(len(queue)):
+                    if len(pending) >= workers:
+                        break
+                    runner = queue.popleft()
+                    if runner.finished:
+                        runner.report()
+                        continue
+                    delay = runner.scheduler.remaining()
+                    if delay > 0:
+                        queue.append(runner)
+                        next_due = min(next_due, delay)
+                        continue
+                    pending[pool.submit(runner.tick)] = runner
+
+                if not pending:
+                    if queue:
+                        cancel_token.sleep(next_due)
+                    continue
+                done, _ = wait(pending, timeout=next_due if queue else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    runner = pending.pop(future)
+                    if future.exception() is not None:
+                        # 识别错误在tick内部已经处理，抛出的都是致命错误，只结束这个窗口
+                        print(f"{runner.prefix}错误：挑战过程中发生致命错误：{str(future.exception())}")
+                        runner.report()
+                        continue
+                    queue.append(runner)
+    finally:
+        for runner in runners:
+            runner.close()
+
+    print_fleet_statistics(runners, time.monotonic() - started)
+    return runners
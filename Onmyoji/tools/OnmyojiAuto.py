@@ -1,220 +1,602 @@
-import random
-import threading
-import time
-import win32gui
-import win32api
-import win32con
-import pyautogui
-import random
-
-from PIL import Image
-from functools import lru_cache
-from .get_DC import WindowCapture
-
-class OnmyjiAutomation:
-    def __init__(self, window_title):
-        self.window_title = window_title
-        # 窗口信息获取与初始化
-        self.hwnd = win32gui.FindWindow(None, window_title)
-        if not self.hwnd:
-            print(f"无法找到窗口 {window_title}")
-            raise Exception('无法获取游戏窗口尺寸')
-
-        self.area = self.get_window_rect()
-        self.x1, self.y1, self.width, self.height = self.area
-        self.x2, self.y2 = self.x1 + self.width, self.y1 + self.height
-
-
-        # 线程与控制变量
-        self.lock = threading.Lock()
-        self.shutdown_flag = False
-
-        # 图像识别缓存和参数
-        self.recognition_cache = {}
-        self.cache_timeout = 1.0
-        self.default_confidence = 0.85  # 默认置信度
-        self.image_templates = {}
-
-    def print_window_info(self):
-        """输出窗口信息"""
-        print('已获取到游戏窗口信息\n'
-              f'窗口左上角的位置是({self.x1},{self.y1})\n'
-              f'窗口右下角的位置是({self.x2},{self.y2})\n')
-
-    def get_window_rect(self):
-        """获取窗口矩形区域"""
-        rect = win32gui.GetWindowRect(self.hwnd)
-        x1, y1, x2, y2 = rect
-        return x1, y1, x2 - x1, y2 - y1
-
-    def preload_image(self, logo_path):
-        """预加载并缓存图像模板"""
-        if logo_path not in self.image_templates:
-            try:
-                # 读取图像并进行预处理
-                image = Image.open(logo_path)
-                # 转换为RGB模式（如果不是）
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                # 可以在这里添加缩放、增强对比度等预处理
-                self.image_templates[logo_path] = image
-            except Exception as e:
-                print(f"警告：预加载图像 {logo_path} 失败：{str(e)}")
-                return False
-        return True
-
-    @lru_cache(maxsize=32)
-    def _get_scaled_logo(self, logo, scale=1.0):
-        """缓存并返回缩放后的图像模板"""
-        # 确保先预加载图像
-        self.preload_image(logo)
-        # 这里可以添加图像预处理逻辑，如缩放、灰度化
-        return logo
-
-    def onmyji(self, logo, use_cache=True):
-        """图像识别 + 缓存机制"""
-        current_time = time.time()
-
-        # 检查缓存
-        if use_cache and logo in self.recognition_cache:
-            cached_result, cache_time = self.recognition_cache[logo]
-            if current_time - cache_time < self.cache_timeout:
-                if cached_result:
-                    x, y, width, height = cached_result
-                    self.x1 = random.randint(x, x + width)
-                    self.y1 = random.randint(y, y + height)
-                return cached_result is not None
-
-        # 预加载图像
-        self.preload_image(logo)
-
-        # 执行图像识别
-        target = None
-        try:
-            target = pyautogui.locateOnScreen(
-                logo,
-                confidence=self.default_confidence,
-                region=self.area
-            )
-        except pyautogui.ImageNotFoundException:
-            # 未找到图像时设置target为None
-            target = None
-            print(f"查找图片{logo}的可信度低于预期")
-        except OSError as e:
-            # 处理文件读取错误
-           pass
-        except Exception as e:
-            # 处理其他未预期的错误
-            pass
-
-        # 更新缓存
-        self.recognition_cache[logo] = (target, current_time)
-
-        if target:
-            x, y, width, height = target
-            self.x1 = random.randint(x, x + width)
-            self.y1 = random.randint(y, y + height)
-            return True
-        return False
-
-    def move_mouse(self, x, y):
-        """鼠标移动"""
-        # 使用绝对坐标移动，更高效
-        win32api.SetCursorPos((x, y))
-
-    def win32_double_click(self):
-        """优化的双击操作，减少延迟"""
-        # 组合鼠标事件，减少系统调用
-        flags = win32con.MOUSEEVENTF_LEFTDOWN | win32con.MOUSEEVENTF_LEFTUP
-        win32api.mouse_event(flags, 0, 0, 0, 0)
-        # 更短的双击间隔
-        time.sleep(0.03)
-        win32api.mouse_event(flags, 0, 0, 0, 0)
-        
-    def calc_relative_position(self, absolute_x, absolute_y):
-        """
-        计算绝对坐标在窗口内的相对位置
-        :param absolute_x: 屏幕绝对X坐标
-        :param absolute_y: 屏幕绝对Y坐标
-        :return: 窗口内的相对坐标(x, y)
-        """
-        rect = win32gui.GetWindowRect(self.hwnd)
-        window_left, window_top, _, _ = rect
-        relative_x = absolute_x - window_left
-        relative_y = absolute_y - window_top
-        return relative_x, relative_y
-        
-    def send_click_message(self, relative_x, relative_y):
-        """
-        向指定窗口发送点击消息
-        :param relative_x: 窗口内相对X坐标
-        :param relative_y: 窗口内相对Y坐标
-        """
-        # 将相对坐标转换为LPARAM格式
-        l_param = relative_x | (relative_y << 16)
-        # 发送鼠标移动过去的信息
-        win32gui.PostMessage(self.hwnd, win32con.WM_MOUSEMOVE, 0, l_param)
-        # 发送鼠标左键按下消息
-        win32gui.PostMessage(self.hwnd, win32con.WM_LBUTTONDOWN, win32con.MK_LBUTTON, l_param)
-        # 发送鼠标左键释放消息
-        win32gui.PostMessage(self.hwnd, win32con.WM_LBUTTONUP, 0, l_param)
-
-
-    def perform_action(self, logo, hidden_window=False, threshold=0.85, grayscale=False, enhance_contrast=False, contrast_factor=1.0, blur_level=0, skip_preprocessing=True):
-        # 先进行识别，减少锁持有时间
-        try:
-            # 如果启用隐藏窗口捕获
-            if hidden_window:
-                # print("使用隐藏窗口捕获模式进行图像识别")
-                try:
-                    # 创建WindowCapture实例
-                    wc = WindowCapture(hwnd=self.hwnd)
-                    # 使用WindowCapture查找图像，并传递预处理参数
-                    position = wc.find_image_precise(logo, threshold=threshold, grayscale=grayscale, 
-                                                    enhance_contrast=enhance_contrast, contrast_factor=contrast_factor, 
-                                                    blur_level=blur_level, use_bitblt=True, skip_preprocessing=skip_preprocessing)
-                    if position:
-                        relative_x, relative_y = position
-                        # 直接发送点击消息
-                        self.send_click_message(relative_x, relative_y)
-                        time.sleep(random.uniform(1.5, 3.0))
-                        return True
-                    else:
-                        return False
-                except Exception as e:
-                    print(f"隐藏窗口捕获发生错误: {str(e)}")
-                    # 如果是模拟器后台模式不支持的特定异常，直接抛出，不再回退到常规方法
-                    if "后台模式操作暂不支持模拟器设备" in str(e):
-                        raise
-                    # 其他错误时回退到常规方法
-                    return self.perform_action(logo, hidden_window=False, threshold=threshold, grayscale=grayscale, enhance_contrast=enhance_contrast, contrast_factor=contrast_factor, blur_level=blur_level, skip_preprocessing=skip_preprocessing)
-                 
-            # 常规方法
-            found = self.onmyji(logo)
-            if not found:
-                return False
-
-            with self.lock:  # 只在执行关键操作时持有锁
-                # 计算相对坐标
-                relative_x, relative_y = self.calc_relative_position(self.x1, self.y1)
-                if "MuMu" in self.window_title or "模拟器" in self.window_title:
-                    pyautogui.moveTo(self.x1, self.y1)
-                    pyautogui.doubleClick(self.x1, self.y1)
-                    time.sleep(random.uniform(1.5, 3.0))
-                    return True
-                # 发送点击消息
-                else:
-                    self.send_click_message(relative_x, relative_y)
-                    time.sleep(random.uniform(1.5, 3.0))
-                    return True
-        except pyautogui.FailSafeException:
-            print("警告：触发了PyAutoGUI的安全模式，操作已停止")
-            return False
-        except Exception as e:
-            print(f"警告：执行操作时发生错误：{str(e)}")
-            return False
-
-    def clear_cache(self):
-        """清除识别缓存"""
-        self.recognition_cache.clear()
-        self._get_scaled_logo.cache_clear()
+import random
+import threading
+import time
+
+from functools import partial
+from typing import Callable, NamedTuple
+
+from .get_DC import WindowCapture
+from .frame_source import FrameSource, ScreenFrameSource, WindowFrameSource
+from .preprocess import FramePreprocessor, capture_format_for
+from .template_store import get_template_store
+from .template_matcher import best_hit, match_many
+from .search_region import DEFAULT_FALLBACK_MISSES, SearchRegions, capture_region_for, offset_regions
+from .frame_gate import DEFAULT_CHANGE_THRESHOLD, DEFAULT_MAX_SKIPS, FrameChangeGate
+from .gdi_context import release_capture_context
+from .recognition_cache import RecognitionCache, frame_content_key
+from .template_priority import DEFAULT_RARE_INTERVAL, TemplatePriority
+from .capture_worker import DEFAULT_CAPTURE_FPS, CaptureWorker
+from .cancellation import CancellationToken
+
+try:
+    import win32gui
+    import win32api
+    import win32con
+except ImportError:
+    # 非Windows环境下没有pywin32，只能配合回放/合成截图源使用
+    win32gui = win32api = win32con = None
+
+try:
+    import pyautogui
+except Exception:
+    # 无桌面环境下pyautogui无法导入，模拟器的前台鼠标点击不可用
+    pyautogui = None
+
+# 点击后至少随机等待的时间范围（秒），模拟人工操作的节奏
+DEFAULT_CLICK_DELAY = (0.3, 0.8)
+
+# 点击后等待画面变化的最长时间（秒）
+DEFAULT_CLICK_TIMEOUT = 3.0
+
+# 点击后检查画面是否变化的间隔（秒）
+CLICK_POLL_INTERVAL = 0.05
+
+
+# ---------- 识别和操作的步骤 ----------
+# action_steps/response_steps以生成器的形式产生下面的步骤，由执行方执行后把结果送回：
+# 线程引擎用run_steps在当前线程中执行，异步引擎把阻塞调用交给线程池、等待交给事件循环
+
+class WaitStep(NamedTuple):
+    """等待seconds秒，结果为等待期间是否已取消"""
+    seconds: float
+
+
+class CallStep(NamedTuple):
+    """阻塞调用（截图、匹配），结果为func()的返回值，出错时异常抛回生成器中"""
+    func: Callable[[], object]
+
+
+class ClickStep(NamedTuple):
+    """在截图源的客户区坐标(x, y)处点击"""
+    source: object
+    x: int
+    y: int
+
+
+class OnmyjiAutomation:
+    def __init__(self, window_title=None, frame_source: FrameSource = None, cancel_token: CancellationToken = None,
+                 hwnd=None):
+        """
+        :param window_title: 游戏窗口标题
+        :param hwnd: 可选的窗口句柄，多个同名窗口（多开）时用句柄区分，指定时不再按标题查找
+        :param frame_source: 可选的截图源，传入回放/合成截图源时不需要真实窗口，只能使用后台识别；
+                             带有hwnd属性的截图源（窗口截图源、窗口的后台截图线程）视为对应窗口
+        :param cancel_token: 取消信号，取消后不再截图和点击，点击后的等待立即结束
+        """
+        self.window_title = window_title or ''
+        self.frame_source = frame_source
+
+        if frame_source is not None and not getattr(frame_source, 'hwnd', None):
+            # 回放/合成截图源没有窗口，也不需要点击后等待游戏响应
+            self.hwnd = None
+            self.area = (0, 0, 0, 0)
+            self.click_delay = (0.0, 0.0)
+            self.click_timeout = 0.0
+        else:
+            # 窗口信息获取与初始化
+            if frame_source is not None:
+                self.hwnd = frame_source.hwnd
+            elif hwnd:
+                self.hwnd = hwnd if win32gui.IsWindow(hwnd) else None
+                if self.hwnd and not self.window_title:
+                    self.window_title = win32gui.GetWindowText(hwnd)
+            else:
+                self.hwnd = win32gui.FindWindow(None, window_title)
+            if not self.hwnd:
+                print(f"无法找到窗口 {window_title or hwnd}")
+                raise Exception('无法获取游戏窗口尺寸')
+            self.area = self.get_window_rect()
+            # 点击后等待画面变化，最多等待click_timeout秒，至少随机等待click_delay范围内的时间
+            self.click_delay = DEFAULT_CLICK_DELAY
+            self.click_timeout = DEFAULT_CLICK_TIMEOUT
+        self.x1, self.y1, self.width, self.height = self.area
+        self.x2, self.y2 = self.x1 + self.width, self.y1 + self.height
+
+        # 后台识别长期复用的截图对象及创建时的窗口矩形，窗口移动、缩放或关闭后才重建
+        self._capture = None
+        self._capture_rect = None
+        self._window_source = frame_source if isinstance(frame_source, WindowFrameSource) else None
+        # 前台模式的屏幕截图源
+        self._screen_source = None
+        # 后台截图线程及本对象的读取方，启动后后台识别读取线程截取的最新帧
+        self._capture_worker = None
+        self._capture_reader = None
+        # 最近一次完整截图的客户区尺寸，已知时才可以只截取搜索区域
+        self._frame_size = None
+        # 最近一次识别使用的截图及截取区域，点击后与新截图比较判断画面是否变化
+        self.last_frame = None
+        self._last_capture_region = None
+
+        # 线程与控制变量
+        self.lock = threading.Lock()
+        self.cancel_token = cancel_token if cancel_token is not None else CancellationToken()
+
+        # 图像识别缓存和参数
+        # 按 (模板, 帧标识) 缓存识别结果，新的一帧到来时作废
+        self.recognition_cache = RecognitionCache()
+        # 模板搜索区域
+        self.search_regions = SearchRegions()
+        # 每个模板的匹配策略 {模板名或路径: MatchStrategy}
+        self.match_strategies = {}
+        # 按命中率排列模板的匹配顺序，为None时按配置顺序匹配全部模板
+        self.template_priority = None
+        # 画面变化检测，画面未变化时跳过模板匹配
+        self.frame_gate = FrameChangeGate()
+        # 截图预处理器，复用灰度化/对比度/模糊的输出缓冲区
+        self.preprocessor = FramePreprocessor()
+        # 匹配后端，为None时在当前线程中匹配，否则调用其match_many（如多进程匹配）
+        self.matcher = None
+
+    def print_window_info(self):
+        """输出窗口信息"""
+        print('已获取到游戏窗口信息\n'
+              f'窗口左上角的位置是({self.x1},{self.y1})\n'
+              f'窗口右下角的位置是({self.x2},{self.y2})\n')
+
+    def get_window_rect(self):
+        """获取窗口矩形区域"""
+        rect = win32gui.GetWindowRect(self.hwnd)
+        x1, y1, x2, y2 = rect
+        return x1, y1, x2 - x1, y2 - y1
+
+    def get_window_capture(self):
+        """
+        获取长期复用的WindowCapture
+        截图对象保存了客户区位置、预处理缓冲区和GDI上下文，每次操作都新建会重复这些初始化；
+        只有窗口移动、缩放时才重建，窗口关闭时抛出异常
+        """
+        if not win32gui.IsWindow(self.hwnd):
+            self.invalidate_capture()
+            raise Exception('游戏窗口已关闭')
+        rect = win32gui.GetWindowRect(self.hwnd)
+        if self._capture is None or rect != self._capture_rect:
+            if self._capture is not None:
+                print("游戏窗口位置或尺寸发生变化，重新初始化截图")
+            self._capture = WindowCapture(hwnd=self.hwnd)
+            self._capture_rect = rect
+            # 客户区尺寸可能变了，下一次先截取完整客户区
+            self._frame_size = None
+            self.area = self.get_window_rect()
+            self.x1, self.y1, self.width, self.height = self.area
+            self.x2, self.y2 = self.x1 + self.width, self.y1 + self.height
+            if self._window_source is not None:
+                # 后台截图线程可能正在用旧的截图对象截图，等它这一帧截完再替换
+                with self._window_source.capture_lock:
+                    self._window_source.capture = self._capture
+        return self._capture
+
+    def get_window_source(self):
+        """获取长期复用的窗口截图源，截图对象失效时自动更新"""
+        capture = self.get_window_capture()
+        if self._window_source is None:
+            # 截图在本次识别中用完即弃，复用同一个输出缓冲区
+            self._window_source = WindowFrameSource(self.hwnd, capture=capture, reuse_buffer=True)
+        return self._window_source
+
+    def get_screen_source(self):
+        """获取前台截图源，模拟器窗口不响应窗口消息，使用真实鼠标点击"""
+        # 检查窗口是否移动、缩放或关闭
+        self.get_window_capture()
+        if self._screen_source is None:
+            use_mouse = "MuMu" in self.window_title or "模拟器" in self.window_title
+            self._screen_source = ScreenFrameSource(self.hwnd, use_mouse=use_mouse)
+        return self._screen_source
+
+    def current_frame_source(self, hidden_window=True):
+        """
+        识别使用的截图源：后台截图线程 > 传入的截图源 > 游戏窗口
+        游戏窗口在后台模式下用BitBlt截取，前台模式下从屏幕截取
+        """
+        if self._capture_reader is None and (self.frame_source is None
+                                             or isinstance(self.frame_source, WindowFrameSource)):
+            return self.get_window_source() if hidden_window else self.get_screen_source()
+        if self.hwnd:
+            # 检查窗口是否移动、缩放或关闭
+            self.get_window_capture()
+        return self._capture_reader or self.frame_source
+
+    def start_capture_worker(self, fps=DEFAULT_CAPTURE_FPS, color_format='bgr'):
+        """
+        启动后台截图线程，之后的后台识别不再同步截图，而是读取线程截取的最新帧
+        :param fps: 截图帧率
+        :param color_format: 窗口截图的格式，只做灰度匹配时可以使用gray
+        :return: CaptureWorker，GUI预览、录制等可以通过其reader()共用同一个截图线程
+        """
+        if self._capture_worker is None:
+            source = self.current_frame_source()
+            if isinstance(source, WindowFrameSource):
+                source.color_format = color_format
+            self._capture_worker = CaptureWorker(source, fps).start()
+            self._capture_reader = self._capture_worker.reader()
+            print(f"已启动后台截图线程，帧率 {fps}")
+        return self._capture_worker
+
+    def stop_capture_worker(self):
+        """停止后台截图线程，恢复同步截图"""
+        if self._capture_worker is not None:
+            self._capture_worker.stop()
+            self._capture_worker = None
+            self._capture_reader = None
+
+    def invalidate_capture(self):
+        """丢弃截图对象并释放该窗口的GDI资源，下次截图时重建"""
+        self._capture = None
+        self._capture_rect = None
+        if self.hwnd:
+            if self._window_source is not None:
+                # 不在后台截图线程截图的过程中释放GDI资源
+                with self._window_source.capture_lock:
+                    release_capture_context(self.hwnd)
+            else:
+                release_capture_context(self.hwnd)
+
+    def set_search_regions(self, regions, fallback_misses=DEFAULT_FALLBACK_MISSES, learned_path=None):
+        """
+        设置模板搜索区域
+        :param regions: {模板名: (left, top, width, height)}，坐标相对于窗口客户区
+        :param fallback_misses: 区域内连续未命中多少次后回退一次全图搜索
+        :param learned_path: 根据命中位置自动学习区域，并保存到该文件，为None时不学习
+        """
+        self.search_regions = SearchRegions(regions, fallback_misses, learned_path=learned_path)
+
+    def set_match_strategies(self, strategies):
+        """
+        设置模板的匹配策略，未设置的模板使用默认策略
+        :param strategies: {模板名: MatchStrategy}
+        """
+        self.match_strategies = dict(strategies)
+
+    def set_frame_gate(self, threshold=DEFAULT_CHANGE_THRESHOLD, max_skips=DEFAULT_MAX_SKIPS):
+        """
+        设置画面变化检测的灵敏度
+        :param threshold: 缩略图中发生变化的像素占比，低于该值视为画面未变化，0表示关闭
+        :param max_skips: 最多连续跳过的帧数
+        """
+        self.frame_gate = FrameChangeGate(threshold, max_skips=max_skips)
+
+    def set_template_priority(self, stats_path=None, rare_interval=DEFAULT_RARE_INTERVAL):
+        """
+        按命中率决定模板的匹配顺序，第一个命中后停止匹配，冷门模板每隔几轮才匹配一次
+        启用后命中的优先级由命中率决定，不再是配置文件中的顺序
+        :param stats_path: 统计结果的保存路径，为None时不保存
+        :param rare_interval: 每隔多少轮匹配一次冷门模板，1表示每轮都匹配
+        """
+        self.template_priority = TemplatePriority(stats_path, rare_interval)
+
+    def set_match_backend(self, matcher=None):
+        """
+        设置匹配后端，接口与template_matcher.match_many相同
+        :param matcher: 如process_matcher.ProcessMatcher，None表示在当前线程中匹配
+        """
+        self.matcher = matcher
+
+    def set_click_timing(self, click_delay=DEFAULT_CLICK_DELAY, click_timeout=DEFAULT_CLICK_TIMEOUT):
+        """
+        设置点击后的等待方式，回放/合成截图源不等待
+        :param click_delay: (最短, 最长) 点击后至少随机等待的时间（秒），(0, 0)表示画面一变化就继续
+        :param click_timeout: 等待画面变化的最长时间（秒），0表示只按click_delay等待
+        """
+        if self.hwnd:
+            self.click_delay = tuple(click_delay)
+            self.click_timeout = click_timeout
+
+    def print_match_statistics(self):
+        """输出每个模板的主备算法和胜出次数，以及画面未变化跳过的帧数"""
+        for name, strategy in self.match_strategies.items():
+            if strategy.wins:
+                print(f"{name} 匹配算法统计: 主算法 {strategy.primary}，胜出次数 {strategy.wins}")
+        if self.frame_gate.frames_checked:
+            print(f"画面变化检测: {self.frame_gate.summary()}")
+        if self.recognition_cache.hits or self.recognition_cache.misses:
+            print(f"识别结果缓存: {self.recognition_cache.summary()}")
+        if self.template_priority is not None and self.template_priority.stats:
+            print(f"模板命中率: {self.template_priority.summary()}")
+
+    def reset_learned_regions(self):
+        """客户端布局变化后清空自动学习的搜索区域"""
+        self.search_regions.reset_learned()
+        print("已清空自动学习的搜索区域")
+
+    def preload_image(self, logo_path):
+        """预加载并缓存图像模板"""
+        if get_template_store().get(logo_path, grayscale=False) is None:
+            print(f"警告：预加载图像 {logo_path} 失败")
+            return False
+        return True
+
+    def move_mouse(self, x, y):
+        """鼠标移动"""
+        # 使用绝对坐标移动，更高效
+        win32api.SetCursorPos((x, y))
+
+    def win32_double_click(self):
+        """优化的双击操作，减少延迟"""
+        # 组合鼠标事件，减少系统调用
+        flags = win32con.MOUSEEVENTF_LEFTDOWN | win32con.MOUSEEVENTF_LEFTUP
+        win32api.mouse_event(flags, 0, 0, 0, 0)
+        # 更短的双击间隔
+        time.sleep(0.03)
+        win32api.mouse_event(flags, 0, 0, 0, 0)
+        
+    def calc_relative_position(self, absolute_x, absolute_y):
+        """
+        计算绝对坐标在窗口内的相对位置
+        :param absolute_x: 屏幕绝对X坐标
+        :param absolute_y: 屏幕绝对Y坐标
+        :return: 窗口内的相对坐标(x, y)
+        """
+        rect = win32gui.GetWindowRect(self.hwnd)
+        window_left, window_top, _, _ = rect
+        relative_x = absolute_x - window_left
+        relative_y = absolute_y - window_top
+        return relative_x, relative_y
+        
+    def send_click_message(self, relative_x, relative_y):
+        """
+        向指定窗口发送点击消息
+        :param relative_x: 窗口内相对X坐标
+        :param relative_y: 窗口内相对Y坐标
+        """
+        # 将相对坐标转换为LPARAM格式
+        l_param = relative_x | (relative_y << 16)
+        # 发送鼠标移动过去的信息
+        win32gui.PostMessage(self.hwnd, win32con.WM_MOUSEMOVE, 0, l_param)
+        # 发送鼠标左键按下消息
+        win32gui.PostMessage(self.hwnd, win32con.WM_LBUTTONDOWN, win32con.MK_LBUTTON, l_param)
+        # 发送鼠标左键释放消息
+        win32gui.PostMessage(self.hwnd, win32con.WM_LBUTTONUP, 0, l_param)
+
+
+    def perform_action(self, logo, hidden_window=False, threshold=0.85, grayscale=False, enhance_contrast=False, contrast_factor=1.0, blur_level=0, skip_preprocessing=True, pyramid_level=0):
+        """
+        识别单个模板并点击，参数同perform_best_action
+        :return: 是否找到并点击了模板
+        """
+        return self.perform_best_action({logo: logo}, hidden_window=hidden_window, threshold=threshold, grayscale=grayscale, enhance_contrast=enhance_contrast, contrast_factor=contrast_factor, blur_level=blur_level, skip_preprocessing=skip_preprocessing, pyramid_level=pyramid_level) is not None
+
+    def perform_best_action(self, templates, hidden_window=False, threshold=0.85, grayscale=False, enhance_contrast=False, contrast_factor=1.0, blur_level=0, skip_preprocessing=True, pyramid_level=0, observe_only=(), expect=None):
+        """
+        一次截图匹配全部模板，只点击优先级最高的命中项
+        前台和后台模式使用同一套识别流程（模板缓存、搜索区域、画面变化检测和统计），只有截图源不同：
+        后台模式用BitBlt截取窗口，前台模式从屏幕截取窗口客户区，指定了截图源时总是使用该截图源
+        :param templates: {模板名: 模板图片路径}，字典顺序即优先级
+        :param pyramid_level: 金字塔匹配层级，0为关闭
+        :param observe_only: 只识别不点击的模板名
+        :param expect: 可选的 {模板名: 模板图片路径}，点击后等待这些模板出现，不指定时等待画面变化
+        :return: 命中（并点击）的模板名，没有命中时返回None
+        """
+        return self.run_steps(self.action_steps(templates, hidden_window=hidden_window, threshold=threshold, grayscale=grayscale, enhance_contrast=enhance_contrast, contrast_factor=contrast_factor, blur_level=blur_level, skip_preprocessing=skip_preprocessing, pyramid_level=pyramid_level, observe_only=observe_only, expect=expect))
+
+    def action_steps(self, templates, hidden_window=False, threshold=0.85, grayscale=False, enhance_contrast=False, contrast_factor=1.0, blur_level=0, skip_preprocessing=True, pyramid_level=0, observe_only=(), expect=None):
+        """
+        perform_best_action的步骤生成器，参数和返回值同perform_best_action
+        截图匹配、点击和等待都以步骤产生，线程引擎和异步引擎共用这一套流程
+        """
+        if self.cancel_token.cancelled:
+            return None
+        match_options = dict(threshold=threshold, grayscale=grayscale, enhance_contrast=enhance_contrast,
+                             contrast_factor=contrast_factor, blur_level=blur_level,
+                             skip_preprocessing=skip_preprocessing, pyramid_level=pyramid_level)
+        source = None
+        try:
+            source = yield CallStep(partial(self.current_frame_source, hidden_window))
+            hit = yield CallStep(partial(self.find_best_hit, source, templates, **match_options))
+            if hit is None:
+                return None
+            if hit.name in observe_only:
+                return hit.name
+
+            relative_x, relative_y = self.click_position(hit)
+            before = self.response_snapshot()
+            if self.cancel_token.cancelled:
+                return None
+            yield ClickStep(source, relative_x, relative_y)
+            yield from self.response_steps(source, before, expect, **match_options)
+            return hit.name
+        except Exception as e:
+            print(f"识别发生错误: {str(e)}")
+            # 如果是模拟器后台模式不支持的特定异常，直接抛出，不再回退到前台截图
+            if "后台模式操作暂不支持模拟器设备" in str(e):
+                raise
+            if source is not None and source is self._window_source and not self.cancel_token.cancelled:
+                # 后台截图出错时回退到前台截图
+                return (yield from self.action_steps(templates, hidden_window=False, observe_only=observe_only,
+                                                     expect=expect, **match_options))
+            return None
+
+    def run_steps(self, steps):
+        """
+        在当前线程中执行步骤生成器（action_steps、response_steps等）
+        :return: 生成器的返回值
+        """
+        result, error = None, None
+        while True:
+            try:
+                step = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                result, error = self.execute_step(step), None
+            except Exception as e:
+                result, error = None, e
+
+    def execute_step(self, step):
+        """在当前线程中执行一个步骤，返回送回生成器的结果"""
+        if isinstance(step, WaitStep):
+            return self.cancel_token.sleep(step.seconds)
+        if isinstance(step, ClickStep):
+            return self.send_click(step.source, step.x, step.y)
+        return step.func()
+
+    def send_click(self, source, relative_x, relative_y):
+        """通过截图源点击，已取消时不再点击"""
+        with self.lock:  # 只在执行点击时持有锁
+            if not self.cancel_token.cancelled:
+                source.click(relative_x, relative_y)
+
+    def find_best_hit(self, source, templates, threshold=0.85, **match_options):
+        """
+        从截图源取一帧，返回优先级最高的命中项，不点击
+        启用了模板优先级时按命中率排列匹配顺序，第一个命中后停止
+        :param match_options: 匹配参数，同recognize
+        :return: MatchResult，没有命中或截图失败时返回None
+        """
+        prioritized = self.template_priority is not None
+        if prioritized:
+            # 命中率高的模板先匹配，冷门模板隔几轮才匹配一次
+            templates = self.template_priority.order(templates)
+        results = self.recognize(source, templates, threshold=threshold, first_hit=prioritized, **match_options)
+        return best_hit(results, threshold) if results else None
+
+    @staticmethod
+    def click_position(hit):
+        """命中区域中心加轻微的随机偏移，避免总是点击完全相同的位置"""
+        relative_x, relative_y = hit.center
+        return relative_x + random.randint(-2, 2), relative_y + random.randint(-2, 2)
+
+    def response_snapshot(self):
+        """点击前的画面缩略图，用于判断游戏是否已经响应；不等待画面变化时返回None"""
+        return self.frame_gate.thumbnail(self.last_frame.image) if self.click_timeout > 0 else None
+
+    def check_response(self, source, before, expect=None, **match_options):
+        """
+        截取一帧，检查游戏是否已经响应点击
+        :param before: 点击前截图的缩略图（response_snapshot）
+        :param expect: 可选的 {模板名: 模板图片路径}，出现即视为已响应，不指定时检查画面是否变化
+        :return: 是否已经响应
+        """
+        if expect:
+            results = self.recognize(source, expect, **match_options)
+            return bool(results) and best_hit(results, match_options.get('threshold', 0.85)) is not None
+        # 与点击前截取相同的区域
+        frame = source.grab(region=self._last_capture_region)
+        threshold = self.frame_gate.threshold if self.frame_gate.threshold > 0 else DEFAULT_CHANGE_THRESHOLD
+        return frame is not None and self.frame_gate.change_ratio(
+            before, self.frame_gate.thumbnail(frame.image)) >= threshold
+
+    def wait_for_response(self, source, before, expect=None, **match_options):
+        """
+        点击后等待游戏响应：画面发生变化（或expect中的模板出现）后返回，最多等待click_timeout秒
+        取代固定的随机等待，过场快时立即继续；click_delay作为随机的最短等待时间保留
+        :param before: 点击前截图的缩略图（FrameChangeGate.thumbnail）
+        :param expect: 可选的 {模板名: 模板图片路径}
+        :param match_options: 识别expect时的匹配参数，同recognize
+        :return: 是否在超时前检测到响应
+        """
+        return self.run_steps(self.response_steps(source, before, expect, **match_options))
+
+    def response_steps(self, source, before, expect=None, **match_options):
+        """wait_for_response的步骤生成器，参数和返回值同wait_for_response"""
+        started = time.monotonic()
+        min_wait = random.uniform(*self.click_delay)
+        responded = False
+        while time.monotonic() - started < self.click_timeout:
+            if (yield WaitStep(CLICK_POLL_INTERVAL)):
+                return False
+            responded = yield CallStep(partial(self.check_response, source, before, expect, **match_options))
+            if responded or source.exhausted:
+                break
+        # 画面已经变化但还没到最短等待时间时补足
+        yield WaitStep(min_wait - (time.monotonic() - started))
+        return responded
+
+    def recognize(self, source, templates, threshold=0.85, grayscale=False, enhance_contrast=False, contrast_factor=1.0, blur_level=0, skip_preprocessing=True, pyramid_level=0, first_hit=False):
+        """
+        从截图源取一帧并匹配全部模板，不点击
+        :param source: 截图源，通常由current_frame_source获得
+        :param first_hit: 按顺序匹配，第一个命中后不再匹配剩余模板
+        :return: {模板名: MatchResult}，坐标相对于客户区；截图失败时返回None
+        """
+        if source is self._window_source or source is self._screen_source:
+            # 灰度匹配时截图层直接输出灰度图
+            source.color_format = capture_format_for(grayscale, skip_preprocessing)
+
+        # 本轮所有模板都有搜索区域（手动配置或自动学习）时，只截取这些区域的外接矩形
+        regions = self.search_regions.regions_for(templates)
+        capture_region = capture_region_for(templates, regions, self._frame_size)
+        frame = source.grab(region=capture_region)
+        if frame is None:
+            if not source.exhausted:
+                print("无法捕获窗口图像")
+            return None
+        self.last_frame = frame
+        self._last_capture_region = capture_region
+        image = frame.image
+        if capture_region is None:
+            # 完整截图时记录客户区尺寸，尺寸变化时丢弃旧的学习结果
+            self._frame_size = (image.shape[1], image.shape[0])
+            self.search_regions.check_frame_size(self._frame_size)
+            regions = self.search_regions.regions_for(templates)
+        frame_size = self._frame_size
+
+        # 画面内容完全相同的帧上已经识别过的模板直接使用缓存的结果
+        # 每次截图序号都会变化，所以按截图区域和内容哈希判断是否为同一画面
+        frame_key = (capture_region, frame_content_key(image))
+        self.recognition_cache.new_frame(frame_key)
+        cached = {}
+        pending = {}
+        for name, path in templates.items():
+            found, result = self.recognition_cache.get(name, frame_key)
+            if found:
+                cached[name] = result
+            else:
+                pending[name] = path
+        # 命中缓存的模板同样计入区域未命中次数和命中率统计，否则缓存有效期内搜索区域不会回退全图
+        for name, result in cached.items():
+            self._record_result(name, name in regions, result.score >= threshold)
+        if not pending:
+            # 画面内容与上一帧完全相同，记为画面未变化，轮询调度据此拉长间隔
+            self.frame_gate.mark_unchanged()
+            return cached
+
+        # 画面和上一帧几乎一样时直接复用上次的匹配结果
+        gate_key = (tuple(pending), threshold, capture_region, first_hit)
+        if self.frame_gate.should_skip(image, gate_key):
+            matched = self.frame_gate.results
+        else:
+            # 截图预处理只做一次，有搜索区域的模板只在区域内匹配，局部截图上使用局部坐标
+            matcher = self.matcher.match_many if self.matcher is not None else match_many
+            matched = matcher(image, pending, grayscale=grayscale, enhance_contrast=enhance_contrast,
+                              contrast_factor=contrast_factor, blur_level=blur_level,
+                              skip_preprocessing=skip_preprocessing,
+                              regions=offset_regions(regions, frame.origin),
+                              pyramid_level=pyramid_level, strategies=self.match_strategies,
+                              threshold=threshold, preprocessor=self.preprocessor, first_hit=first_hit)
+            if frame.origin != (0, 0):
+                # 匹配坐标换算回整个客户区
+                origin_x, origin_y = frame.origin
+                matched = {name: result._replace(x=result.x + origin_x, y=result.y + origin_y)
+                           for name, result in matched.items()}
+            self.frame_gate.update(matched, gate_key)
+            for name, result in matched.items():
+                hit_found = result.score >= threshold
+                self._record_result(name, name in regions, hit_found)
+                if hit_found:
+                    # 记录命中位置，逐步收窄该模板的搜索区域
+                    self.search_regions.learn(name, result.x, result.y, result.width, result.height,
+                                              frame_size)
+        for name, result in matched.items():
+            self.recognition_cache.put(name, frame_key, result)
+        results = dict(cached, **matched)
+        # 按模板优先级排序
+        return {name: results[name] for name in templates if name in results}
+
+    def _record_result(self, name, in_region, hit_found):
+        """记录一个模板本轮是否命中：区域内连续未命中次数和模板命中率"""
+        self.search_regions.record(name, in_region, hit_found)
+        if self.template_priority is not None:
+            self.template_priority.record(name, hit_found)
+
+    def clear_cache(self):
+        """清除识别缓存"""
+        self.recognition_cache.clear()
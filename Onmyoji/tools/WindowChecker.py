@@ -8,12 +8,16 @@
 """
 
 
-import win32gui
-import win32con
-import pywintypes
-
 from typing import Optional, Tuple
 
+try:
+    import win32gui
+    import win32con
+    import pywintypes
+except ImportError:
+    # 非Windows环境下没有pywin32，只能使用回放/合成截图源（见frame_source.py）
+    win32gui = win32con = pywintypes = None
+
 class WindowChecker:
     """窗口状态检查与操作类"""
 
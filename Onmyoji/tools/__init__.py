@@ -1,12 +1,27 @@
 """
 将util的所有功能都打包到一起
+按需导入：只用到识别模块（如在Linux上用回放截图源做性能测试）时，不会连带导入win32和PyQt6
 """
-from .WindowChecker import WindowChecker
-from .OnmyojiAuto import OnmyjiAutomation
-from .GUI import Ui_Dialog
+import importlib
+
+# 对外导出的名称 -> 所在模块
+_EXPORTS = {
+    'WindowChecker': '.WindowChecker',
+    'OnmyjiAutomation': '.OnmyojiAuto',
+    'Ui_Dialog': '.GUI',
+}
 
 __all__ = [
     'WindowChecker',
     'OnmyjiAutomation',
     'Ui_Dialog'
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,61 @@
+"""
+协作式取消
+挑战在后台线程中运行，Python无法从外部强制结束线程，紧急停止只能等线程自己退出。
+CancellationToken由发起方（GUI、命令行、多窗口调度）创建，沿 mode_choice -> common_challenge -> OnmyjiAutomation 传递，
+挑战循环在每次截图前检查，所有等待都通过token.sleep进行，取消后在一个轮询周期内退出并释放窗口。
+"""
+
+import threading
+
+from typing import Callable, List, Optional
+
+
+class CancellationToken:
+    """取消信号，线程安全，取消后不可恢复"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+        self._callbacks: List[Callable[[], object]] = []
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: Optional[str] = None) -> None:
+        """发出取消信号，正在sleep的线程会立即醒来，已注册的回调在调用cancel的线程中执行"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], object]) -> None:
+        """注册取消时的回调（如唤醒asyncio事件循环），已经取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], object]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def sleep(self, seconds: float) -> bool:
+        """
+        等待指定时间，期间被取消时立即返回
+        :return: 是否已被取消
+        """
+        if seconds > 0:
+            return self._event.wait(seconds)
+        return self._event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待取消信号，返回是否已被取消"""
+        return self._event.wait(timeout)
@@ -0,0 +1,200 @@
+"""
+后台截图线程
+同步截图时，每次识别都要先等截图完成，截图耗时直接叠加在识别耗时上。
+CaptureWorker在后台线程中按固定帧率截图，写入预先分配的环形缓冲区，
+识别和点击逻辑读取最新的一帧（带时间戳和序号），截图耗时与识别耗时互不影响。
+
+多个使用方（挑战循环、GUI预览、录制）可以共用同一个截图线程，每个使用方通过reader()
+获得自己的CaptureReader，读取时把最新帧拷贝到自己的缓冲区，不会被后续截图覆盖。
+"""
+
+import threading
+import time
+import numpy as np
+
+from typing import List, Optional
+
+from .frame_source import Frame, FrameSource, crop_frame
+
+# 默认截图帧率
+DEFAULT_CAPTURE_FPS = 10
+
+# 环形缓冲区的槽位数
+DEFAULT_RING_SLOTS = 3
+
+
+class CaptureWorker:
+    """单个截图源的后台截图线程"""
+
+    def __init__(self, source: FrameSource, fps: float = DEFAULT_CAPTURE_FPS, slots: int = DEFAULT_RING_SLOTS):
+        """
+        :param source: 截图源，只在截图线程中调用其grab方法
+        :param fps: 截图帧率，0表示不限速
+        :param slots: 环形缓冲区槽位数，至少为2
+        """
+        self.source = source
+        self.fps = fps
+        self._slots: List[Optional[np.ndarray]] = [None] * max(2, slots)
+        # 最新一帧所在的槽位及其时间戳、序号
+        self._latest = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._finished = False
+        # 统计
+        self.frames_captured = 0
+        self.capture_errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def hwnd(self):
+        return getattr(self.source, 'hwnd', None)
+
+    def start(self) -> 'CaptureWorker':
+        """启动截图线程"""
+        if self.running:
+            return self
+        self._stop_event.clear()
+        self._finished = False
+        self._thread = threading.Thread(target=self._run, name='CaptureWorker', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """停止截图线程"""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _slot_for(self, index: int, image: np.ndarray) -> np.ndarray:
+        """获取槽位缓冲区，截图尺寸变化时重新分配"""
+        slot = self._slots[index]
+        if slot is None or slot.shape != image.shape or slot.dtype != image.dtype:
+            slot = np.empty_like(image)
+            self._slots[index] = slot
+        return slot
+
+    def _run(self) -> None:
+        interval = 1.0 / self.fps if self.fps > 0 else 0.0
+        next_index = 0
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                # 支持输出缓冲区的截图源（窗口截图）直接把截图转换写入槽位
+                frame = self.source.grab(dst=self._slots[next_index])
+            except Exception as e:
+                self.capture_errors += 1
+                print(f"后台截图发生错误: {str(e)}")
+                frame = None
+
+            if frame is None:
+                if self.source.exhausted:
+                    break
+            else:
+                # 写入的槽位永远不是最新帧所在的槽位，读取方拷贝最新帧时持有锁，
+                # 写完下一帧前无法发布，因此正在被拷贝的槽位不会被覆盖
+                if frame.image is not self._slots[next_index]:
+                    np.copyto(self._slot_for(next_index, frame.image), frame.image)
+                with self._condition:
+                    self._latest = (next_index, frame.timestamp, frame.sequence)
+                    self._condition.notify_all()
+                self.frames_captured += 1
+                next_index = (next_index + 1) % len(self._slots)
+
+            delay = interval - (time.monotonic() - started)
+            if delay > 0:
+                self._stop_event.wait(delay)
+
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    @property
+    def exhausted(self) -> bool:
+        """截图源已结束且线程已退出"""
+        return self._finished
+
+    @property
+    def latest_sequence(self) -> int:
+        with self._condition:
+            return self._latest[2] if self._latest is not None else 0
+
+    def latest(self, dst: Optional[np.ndarray] = None, after_sequence: int = 0,
+               timeout: Optional[float] = None, region=None) -> Optional[Frame]:
+        """
+        获取最新一帧的拷贝
+
+        参数:
+            dst: 输出缓冲区，形状不符时分配新数组
+            region: 可选的区域 (left, top, width, height)，只拷贝该区域
+            after_sequence: 只返回序号大于该值的帧，没有时等待新帧
+            timeout: 等待新帧的最长时间（秒），None表示一直等待
+
+        返回:
+            Frame，超时、线程已停止或截图源已结束时返回None
+        """
+        with self._condition:
+            ready = self._condition.wait_for(
+                lambda: (self._latest is not None and self._latest[2] > after_sequence)
+                        or self._finished or self._stop_event.is_set(),
+                timeout)
+            if not ready or self._latest is None or self._latest[2] <= after_sequence:
+                return None
+            index, timestamp, sequence = self._latest
+            slot, origin = crop_frame(self._slots[index], region)
+            if dst is None or dst.shape != slot.shape or dst.dtype != slot.dtype:
+                dst = np.empty_like(slot)
+            np.copyto(dst, slot)
+        return Frame(dst, timestamp, sequence, origin)
+
+    def reader(self, timeout: Optional[float] = 5.0) -> 'CaptureReader':
+        """创建一个读取方，每个使用方各自持有一个"""
+        return CaptureReader(self, timeout)
+
+
+class CaptureReader(FrameSource):
+    """
+    CaptureWorker的读取方，本身也是截图源，可以直接交给OnmyjiAutomation使用
+    每次grab返回比上一次更新的一帧，拷贝到自己复用的缓冲区中；
+    返回的图像在下一次grab时会被覆盖，需要长期保存时请自行拷贝。
+    """
+
+    def __init__(self, worker: CaptureWorker, timeout: Optional[float] = 5.0):
+        """
+        :param timeout: 等待新帧的最长时间（秒）
+        """
+        super().__init__()
+        self.worker = worker
+        self.timeout = timeout
+        self._buffer = None
+
+    @property
+    def hwnd(self):
+        return self.worker.hwnd
+
+    def grab(self, dst: Optional[np.ndarray] = None, region=None) -> Optional[Frame]:
+        frame = self.worker.latest(dst if dst is not None else self._buffer,
+                                   after_sequence=self.sequence, timeout=self.timeout, region=region)
+        if frame is None:
+            return None
+        if dst is None:
+            self._buffer = frame.image
+        # 沿用截图线程的序号，便于多个读取方对齐同一帧
+        self.sequence = frame.sequence
+        return frame
+
+    def click(self, x: int, y: int) -> None:
+        # 点击记录由被包装的截图源负责
+        self.worker.source.click(x, y)
+        # 点击前已开始截取的帧可能还是点击前的画面，跳过它，避免对旧画面重复点击
+        self.sequence = max(self.sequence, self.worker.latest_sequence + 1)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.worker.exhausted and self.worker.latest_sequence <= self.sequence
@@ -0,0 +1,124 @@
+"""
+画面变化检测
+战斗动画期间画面几乎不变，每帧都对所有模板做matchTemplate是浪费。
+这里把截图缩成很小的灰度缩略图，和上一帧比较发生变化的像素占比，
+画面没有明显变化时直接复用上一次的匹配结果，跳过全部模板匹配。
+使用变化像素占比而不是平均差，是为了让按钮这类小面积的变化也能被检测到。
+"""
+
+import cv2
+import numpy as np
+
+from typing import Tuple
+
+# 缩略图单个像素的灰度差超过该值才算该像素发生了变化
+DEFAULT_PIXEL_DELTA = 12
+
+# 默认的变化阈值：发生变化的缩略图像素占比低于该值视为画面未变化，
+# 一个100x80左右的按钮出现时约占缩略图的0.7%
+DEFAULT_CHANGE_THRESHOLD = 0.002
+
+# 缩略图尺寸，保持与1404x834客户区相近的宽高比
+DEFAULT_THUMB_SIZE = (64, 38)
+
+# 连续跳过这么多帧后强制重新匹配一次，防止缓慢渐变的画面一直被判定为未变化
+DEFAULT_MAX_SKIPS = 20
+
+
+class FrameChangeGate:
+    """截图变化检测器，记录上一帧的缩略图和匹配结果"""
+
+    def __init__(self, threshold: float = DEFAULT_CHANGE_THRESHOLD,
+                 thumb_size: Tuple[int, int] = DEFAULT_THUMB_SIZE,
+                 max_skips: int = DEFAULT_MAX_SKIPS, pixel_delta: int = DEFAULT_PIXEL_DELTA):
+        """
+        :param threshold: 变化像素占比阈值，越小越敏感，0表示关闭检测
+        :param thumb_size: 缩略图尺寸 (width, height)
+        :param max_skips: 最多连续跳过的帧数
+        :param pixel_delta: 单个像素的灰度差超过该值才算变化
+        """
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.thumb_size = thumb_size
+        self.max_skips = max_skips
+        self.results = None
+        self._results_key = None
+        self._thumb = None
+        self._consecutive_skips = 0
+        # 统计
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.last_change_ratio = 0.0
+        # 最近一次检测的画面是否发生了明显变化，检测关闭时为False
+        self.changed = False
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        """生成用于比较的灰度缩略图"""
+        small = cv2.resize(frame, self.thumb_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def change_ratio(self, previous: np.ndarray, thumb: np.ndarray) -> float:
+        """两张缩略图之间发生变化的像素占比"""
+        diff = cv2.absdiff(previous, thumb)
+        return np.count_nonzero(diff > self.pixel_delta) / diff.size
+
+    def should_skip(self, frame: np.ndarray, key=None) -> bool:
+        """
+        判断这一帧是否可以复用上一次的匹配结果
+
+        参数:
+            frame: 当前截图
+            key: 本次要匹配的内容标识（如模板名元组），与上次不同时不复用
+
+        返回:
+            True表示画面未变化且有可复用的结果，调用方直接使用self.results
+        """
+        self.frames_checked += 1
+        if self.threshold <= 0:
+            self.changed = False
+            return False
+        thumb = self.thumbnail(frame)
+        previous, self._thumb = self._thumb, thumb
+
+        # 与上一帧比较，即使本次不能复用结果（要匹配的内容不同）也更新changed，供轮询调度使用
+        self.changed = True
+        if previous is not None and previous.shape == thumb.shape:
+            self.last_change_ratio = self.change_ratio(previous, thumb)
+            self.changed = self.last_change_ratio >= self.threshold
+        if self.changed or self._consecutive_skips >= self.max_skips:
+            self._consecutive_skips = 0
+            return False
+        if self.results is None or key != self._results_key:
+            return False
+
+        self._consecutive_skips += 1
+        self.frames_skipped += 1
+        return True
+
+    def mark_unchanged(self) -> None:
+        """调用方已经确认这一帧与上一帧内容完全相同（如命中识别缓存），不比较缩略图，直接记为未变化"""
+        self.frames_checked += 1
+        self.frames_skipped += 1
+        self.last_change_ratio = 0.0
+        self.changed = False
+
+    def update(self, results, key=None) -> None:
+        """保存本帧的匹配结果，供后续未变化的帧复用"""
+        self.results = results
+        self._results_key = key
+
+    def reset(self) -> None:
+        """丢弃上一帧，下一帧必定重新匹配"""
+        self.results = None
+        self._results_key = None
+        self._thumb = None
+        self._consecutive_skips = 0
+
+    @property
+    def skip_ratio(self) -> float:
+        return self.frames_skipped / self.frames_checked if self.frames_checked else 0.0
+
+    def summary(self) -> str:
+        return f"共检测 {self.frames_checked} 帧，画面未变化跳过匹配 {self.frames_skipped} 帧（{self.skip_ratio:.0%}）"
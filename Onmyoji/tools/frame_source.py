@@ -0,0 +1,436 @@
+"""
+截图源
+识别流程只关心"拿到一帧截图"和"在某个位置点击"，不关心截图从哪里来。
+这里把截图来源抽象为FrameSource，提供以下实现：
+1. WindowFrameSource：真实窗口，复用WindowCapture的BitBlt/PrintWindow截图，点击通过PostMessage发送
+2. ScreenFrameSource：前台模式，截取屏幕上窗口客户区所在的区域，窗口必须可见
+3. ReplayFrameSource：回放录制好的PNG/NPY截图（目录或zip压缩包），可按录制时间戳还原节奏
+4. SyntheticFrameSource：把模板图片贴到背景上合成截图，点击模板后切换到下一个场景
+
+前两种截图得到的都是客户区坐标，两种模式共用同一套识别流程、搜索区域和统计。
+后两种不依赖Windows，可以在无桌面的Linux机器上跑识别性能测试和场景逻辑测试。
+"""
+
+import csv
+import io
+import os
+import threading
+import time
+import zipfile
+import cv2
+import numpy as np
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .search_region import clip_region
+
+# 回放目录/压缩包中记录时间戳的文件，每行: 文件名,时间戳(秒)
+TIMESTAMPS_FILE = 'timestamps.csv'
+
+# 支持回放的截图格式
+FRAME_EXTENSIONS = ('.png', '.npy')
+
+
+class Frame(NamedTuple):
+    """
+    一帧截图，image为BGR图像，timestamp为截图时间(秒)，sequence为截图源内递增的序号，
+    只截取了部分区域时origin为该区域左上角在客户区中的坐标
+    """
+    image: np.ndarray
+    timestamp: float
+    sequence: int
+    origin: Tuple[int, int] = (0, 0)
+
+
+def crop_frame(image: np.ndarray, region) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """按 (left, top, width, height) 截取图像，返回视图和实际的左上角坐标，区域为空时返回整张图"""
+    if region is None:
+        return image, (0, 0)
+    left, top, width, height = region
+    right = min(left + width, image.shape[1])
+    bottom = min(top + height, image.shape[0])
+    left, top = max(left, 0), max(top, 0)
+    if right <= left or bottom <= top:
+        return image, (0, 0)
+    return image[top:bottom, left:right], (left, top)
+
+
+class FrameSource:
+    """截图源基类"""
+
+    def __init__(self):
+        self.sequence = 0
+        # 发往该截图源的点击 [(x, y)]，回放和合成截图源用于检查场景逻辑
+        self.clicks = []
+
+    def grab(self, dst: Optional[np.ndarray] = None, region=None) -> Optional[Frame]:
+        """
+        获取一帧截图，失败或截图源已结束时返回None
+        :param dst: 可选的输出缓冲区，截图源支持时结果直接写入，不支持时忽略
+        :param region: 可选的截取区域 (left, top, width, height)，返回帧的origin为区域左上角
+        """
+        raise NotImplementedError
+
+    def click(self, x: int, y: int) -> None:
+        """在客户区坐标(x, y)处点击"""
+        self.clicks.append((x, y))
+
+    @property
+    def exhausted(self) -> bool:
+        """截图源是否已经没有更多的截图"""
+        return False
+
+    def close(self) -> None:
+        """释放截图源占用的资源"""
+        pass
+
+    def _next_frame(self, image: np.ndarray, timestamp: Optional[float] = None,
+                    region=None, origin: Tuple[int, int] = (0, 0)) -> Frame:
+        """生成下一帧，指定region时截取该区域（视图，不复制数据），已经截取过的图像直接传入origin"""
+        self.sequence += 1
+        if region is not None:
+            image, origin = crop_frame(image, region)
+        return Frame(image, time.time() if timestamp is None else timestamp, self.sequence, origin)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class WindowFrameSource(FrameSource):
+    """真实窗口截图源，截图复用WindowCapture，点击通过PostMessage发送到窗口"""
+
+    def __init__(self, hwnd: int, use_bitblt: bool = True, capture=None, color_format: str = 'bgr',
+                 reuse_buffer: bool = False):
+        """
+        :param capture: 已有的WindowCapture，为None时新建
+        :param color_format: 截图格式，bgr/gray/b/g/r/bgra，灰度匹配时使用gray可省去一次整图转换
+        :param reuse_buffer: 为True时每次截图写入同一个缓冲区，返回的图像在下一次grab时被覆盖
+        """
+        super().__init__()
+        if capture is None:
+            # 延迟导入，非Windows环境下使用其他截图源时不需要win32
+            from .get_DC import WindowCapture
+            capture = WindowCapture(hwnd=hwnd)
+        self.hwnd = hwnd
+        self.use_bitblt = use_bitblt
+        self.capture = capture
+        self.color_format = color_format
+        self.reuse_buffer = reuse_buffer
+        self._buffer = None
+        # 截图线程在grab时，其他线程替换capture或释放窗口的GDI资源需要先持有该锁
+        self.capture_lock = threading.Lock()
+
+    def grab(self, dst: Optional[np.ndarray] = None, region=None) -> Optional[Frame]:
+        if dst is None and self.reuse_buffer:
+            dst = self._buffer
+        with self.capture_lock:
+            capture = self.capture
+            if self.use_bitblt:
+                if region is not None:
+                    # 只从位图中复制区域内的像素
+                    region = clip_region(region, capture.client_width, capture.client_height)
+                image = capture.capture_window_bitblt(region, color_format=self.color_format, dst=dst)
+            else:
+                image = capture.capture_window(self.color_format, dst)
+        if image is None:
+            return None
+        if self.reuse_buffer:
+            self._buffer = image
+        if self.use_bitblt and region is not None and image.shape[:2] == (region[3], region[2]):
+            # BitBlt已经只复制了区域内的像素
+            return self._next_frame(image, origin=region[:2])
+        # 没有指定区域，或窗口最小化、客户区尺寸无效时BitBlt回退为截取整个客户区，按实际图像截取区域
+        return self._next_frame(image, region=region)
+
+    def click(self, x: int, y: int) -> None:
+        _post_click(self.hwnd, x, y)
+
+
+def _post_click(hwnd: int, x: int, y: int) -> None:
+    """向窗口发送客户区坐标(x, y)处的点击消息"""
+    import win32con
+    import win32gui
+    # 将相对坐标转换为LPARAM格式
+    l_param = x | (y << 16)
+    win32gui.PostMessage(hwnd, win32con.WM_MOUSEMOVE, 0, l_param)
+    win32gui.PostMessage(hwnd, win32con.WM_LBUTTONDOWN, win32con.MK_LBUTTON, l_param)
+    win32gui.PostMessage(hwnd, win32con.WM_LBUTTONUP, 0, l_param)
+
+
+class ScreenFrameSource(FrameSource):
+    """
+    前台截图源：从屏幕上截取窗口客户区，窗口被遮挡时截到的是遮挡物
+    点击默认通过PostMessage发送；模拟器不响应窗口消息，use_mouse为True时移动真实鼠标双击
+    """
+
+    def __init__(self, hwnd: int, use_mouse: bool = False, color_format: str = 'bgr'):
+        """
+        :param use_mouse: 是否用真实鼠标点击（模拟器窗口）
+        :param color_format: 截图格式，bgr或gray
+        """
+        super().__init__()
+        self.hwnd = hwnd
+        self.use_mouse = use_mouse
+        self.color_format = color_format
+
+    def client_origin(self) -> Tuple[int, int]:
+        """客户区左上角的屏幕坐标"""
+        import win32gui
+        return win32gui.ClientToScreen(self.hwnd, (0, 0))
+
+    def grab(self, dst: Optional[np.ndarray] = None, region=None) -> Optional[Frame]:
+        import win32gui
+        from PIL import ImageGrab
+        left, top = self.client_origin()
+        _, _, width, height = win32gui.GetClientRect(self.hwnd)
+        if region is not None:
+            region = clip_region(region, width, height)
+        offset_x, offset_y, width, height = region if region is not None else (0, 0, width, height)
+        if width <= 0 or height <= 0:
+            return None
+        bbox = (left + offset_x, top + offset_y, left + offset_x + width, top + offset_y + height)
+        rgb = np.asarray(ImageGrab.grab(bbox=bbox, all_screens=True))
+        code = cv2.COLOR_RGB2GRAY if self.color_format == 'gray' else cv2.COLOR_RGB2BGR
+        image = cv2.cvtColor(rgb, code, dst=dst)
+        return self._next_frame(image, origin=(offset_x, offset_y))
+
+    def click(self, x: int, y: int) -> None:
+        if not self.use_mouse:
+            _post_click(self.hwnd, x, y)
+            return
+        import pyautogui
+        left, top = self.client_origin()
+        pyautogui.moveTo(left + x, top + y)
+        pyautogui.doubleClick(left + x, top + y)
+
+
+def _decode_frame(name: str, data: bytes) -> Optional[np.ndarray]:
+    """把PNG/NPY文件内容解码为BGR图像"""
+    if name.lower().endswith('.npy'):
+        image = np.load(io.BytesIO(data), allow_pickle=False)
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        return image
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _read_timestamps(text: str) -> Dict[str, float]:
+    timestamps = {}
+    for row in csv.reader(io.StringIO(text)):
+        if len(row) >= 2:
+            try:
+                timestamps[row[0].strip()] = float(row[1])
+            except ValueError:
+                continue  # 跳过表头等无法解析的行
+    return timestamps
+
+
+class ReplayFrameSource(FrameSource):
+    """
+    回放录制的截图
+    path可以是目录或zip压缩包，里面的PNG/NPY按文件名排序回放，
+    如果有timestamps.csv则使用其中的时间戳，否则按fps生成时间戳。
+    """
+
+    def __init__(self, path: str, loop: bool = False, realtime: bool = False, fps: float = 10.0,
+                 preload: bool = True):
+        """
+        :param path: 截图目录或zip压缩包
+        :param loop: 回放结束后是否从头开始
+        :param realtime: 是否按时间戳的间隔等待，False时尽可能快地回放（用于性能测试）
+        :param fps: 没有时间戳文件时使用的帧率
+        :param preload: 是否一次性把所有截图解码到内存，性能测试时避免把解码时间算进去
+        """
+        super().__init__()
+        self.path = path
+        self.loop = loop
+        self.realtime = realtime
+        self._archive = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+
+        names = self._list_names()
+        if not names:
+            raise FileNotFoundError(f"回放路径中没有可用的截图: {path}")
+        timestamps = self._load_timestamps()
+        self.names = names
+        self.timestamps = [timestamps.get(os.path.basename(name), index / fps)
+                           for index, name in enumerate(names)]
+        self._cache = [self._load(name) for name in names] if preload else None
+        self._index = 0
+        self._started_at = None
+
+    def _list_names(self) -> List[str]:
+        if self._archive is not None:
+            names = self._archive.namelist()
+        else:
+            names = os.listdir(self.path)
+        return sorted(name for name in names if name.lower().endswith(FRAME_EXTENSIONS))
+
+    def _read(self, name: str) -> bytes:
+        if self._archive is not None:
+            return self._archive.read(name)
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+    def _load_timestamps(self) -> Dict[str, float]:
+        try:
+            return _read_timestamps(self._read(TIMESTAMPS_FILE).decode('utf-8'))
+        except (KeyError, OSError):
+            return {}
+
+    def _load(self, name: str) -> np.ndarray:
+        image = _decode_frame(name, self._read(name))
+        if image is None:
+            raise ValueError(f"无法解码截图: {name}")
+        return image
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.loop and self._index >= len(self.names)
+
+    def grab(self, dst: Optional[np.ndarray] = None, region=None) -> Optional[Frame]:
+        if self._index >= len(self.names):
+            if not self.loop:
+                return None
+            self._index = 0
+            self._started_at = None
+
+        index = self._index
+        self._index += 1
+        timestamp = self.timestamps[index]
+
+        if self.realtime:
+            # 按录制时的时间间隔等待
+            if self._started_at is None:
+                self._started_at = time.monotonic()
+            delay = self._started_at + (timestamp - self.timestamps[0]) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        image = self._cache[index] if self._cache is not None else self._load(self.names[index])
+        return self._next_frame(image, timestamp, region)
+
+    def close(self) -> None:
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+
+class SyntheticFrameSource(FrameSource):
+    """
+    合成截图源
+    按场景列表依次生成截图：每个场景是 {模板名: (x, y)}，把对应模板贴到背景的(x, y)处。
+    点击到当前场景中的模板后切换到下一个场景；空场景（如战斗中）在idle_frames帧后自动切换。
+    """
+
+    def __init__(self, templates: Dict[str, str], scenes: Sequence[Dict[str, Tuple[int, int]]],
+                 size: Tuple[int, int] = (1404, 834), idle_frames: int = 3,
+                 noise: int = 0, seed: int = 0, loop: bool = True):
+        """
+        :param templates: {模板名: 模板图片路径}
+        :param scenes: 场景列表，每个场景为 {模板名: 模板左上角坐标}
+        :param size: 截图尺寸 (width, height)
+        :param idle_frames: 空场景持续的帧数
+        :param noise: 每帧叠加的随机噪声幅度，0为不加噪声
+        :param seed: 随机种子
+        :param loop: 最后一个场景结束后是否回到第一个场景
+        """
+        super().__init__()
+        self.size = size
+        self.idle_frames = idle_frames
+        self.noise = noise
+        self.loop = loop
+        self.scene_index = 0
+        self.scenes_completed = 0
+        self._idle_count = 0
+        self._rng = np.random.default_rng(seed)
+
+        width, height = size
+        background = self._rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        self.background = cv2.GaussianBlur(background, (9, 9), 0)
+
+        self.templates = {}
+        for name, path in templates.items():
+            image = cv2.imread(path)
+            if image is None:
+                raise FileNotFoundError(f"无法读取模板图像: {path}")
+            self.templates[name] = image
+
+        self.scenes = [dict(scene) for scene in scenes]
+        self._rendered = [self._render(scene) for scene in self.scenes]
+
+    def _render(self, scene: Dict[str, Tuple[int, int]]) -> np.ndarray:
+        image = self.background.copy()
+        for name, (x, y) in scene.items():
+            template = self.templates[name]
+            h, w = template.shape[:2]
+            image[y:y + h, x:x + w] = template
+        return image
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.loop and self.scene_index >= len(self.scenes)
+
+    def _advance(self) -> None:
+        self.scene_index += 1
+        self.scenes_completed += 1
+        self._idle_count = 0
+        if self.loop and self.scene_index >= len(self.scenes):
+            self.scene_index = 0
+
+    def grab(self, dst: Optional[np.ndarray] = None, region=None) -> Optional[Frame]:
+        if self.exhausted:
+            return None
+        scene = self.scenes[self.scene_index]
+        image = self._rendered[self.scene_index]
+        if not scene:
+            self._idle_count += 1
+            if self._idle_count >= self.idle_frames:
+                self._advance()
+        if self.noise:
+            noise = self._rng.integers(-self.noise, self.noise + 1, image.shape, dtype=np.int16)
+            image = np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        return self._next_frame(image, region=region)
+
+    def click(self, x: int, y: int) -> None:
+        super().click(x, y)
+        if self.exhausted:
+            return
+        for name, (left, top) in self.scenes[self.scene_index].items():
+            h, w = self.templates[name].shape[:2]
+            if left <= x < left + w and top <= y < top + h:
+                self._advance()
+                return
+
+
+class FrameRecorder:
+    """把截图保存为PNG并记录时间戳，生成的目录可以直接交给ReplayFrameSource回放"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.count = 0
+        self._timestamps = open(os.path.join(directory, TIMESTAMPS_FILE), 'a', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._timestamps)
+
+    def write(self, frame: Frame) -> str:
+        """保存一帧截图，返回文件名"""
+        name = f"{frame.sequence:06d}.png"
+        cv2.imwrite(os.path.join(self.directory, name), frame.image)
+        self._writer.writerow([name, f"{frame.timestamp:.6f}"])
+        self.count += 1
+        return name
+
+    def close(self) -> None:
+        self._timestamps.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,252 @@
+"""
+GDI截图上下文
+每次截图都调用GetDC、CreateDCFromHandle、CreateCompatibleDC、CreateBitmap再全部释放，
+多窗口高频轮询时这些创建/销毁既浪费时间，也容易因为异常路径漏释放而泄漏GDI句柄。
+这里为每个窗口句柄保留一份设备上下文和位图，客户区尺寸不变时一直复用，
+尺寸变化时才重建，窗口销毁或截图出错时释放。
+只截取搜索区域时位图按区域尺寸创建（每种尺寸保留一张），读取位图数据的拷贝量与区域大小成正比。
+位图数据不再先拷贝成BGRA数组，而是直接包装GetBitmapBits返回的字节，
+一次转换成匹配需要的格式（BGR、灰度或单通道），可以写入调用方复用的缓冲区。
+
+所有GDI调用都经过Win32Gdi，测试时可以换成不依赖Windows的替身实现。
+"""
+
+import atexit
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .preprocess import convert_frame
+from .search_region import Region, clip_region
+
+try:
+    import win32api
+    import win32con
+    import win32gui
+    import win32ui
+except ImportError:
+    win32api = win32con = win32gui = win32ui = None
+
+# 每个窗口最多保留的位图数（不同的截取区域尺寸），超过时删除最久未使用的
+MAX_BITMAPS = 4
+
+
+class Win32Gdi:
+    """pywin32实现的GDI调用层"""
+
+    def is_window(self, hwnd: int) -> bool:
+        return bool(win32gui.IsWindow(hwnd))
+
+    def acquire(self, hwnd: int):
+        """获取窗口DC并创建兼容的内存DC，返回 (窗口DC句柄, 窗口DC对象, 内存DC对象)"""
+        hwnd_dc = win32gui.GetDC(hwnd)
+        try:
+            src_dc = win32ui.CreateDCFromHandle(hwnd_dc)
+            mem_dc = src_dc.CreateCompatibleDC()
+        except Exception:
+            win32gui.ReleaseDC(hwnd, hwnd_dc)
+            raise
+        return hwnd_dc, src_dc, mem_dc
+
+    def release(self, hwnd: int, handles) -> None:
+        hwnd_dc, src_dc, mem_dc = handles
+        try:
+            mem_dc.DeleteDC()
+            src_dc.DeleteDC()
+        finally:
+            win32gui.ReleaseDC(hwnd, hwnd_dc)
+
+    def create_bitmap(self, handles, width: int, height: int):
+        """创建与窗口DC兼容的位图"""
+        _, src_dc, _ = handles
+        bitmap = win32ui.CreateBitmap()
+        bitmap.CreateCompatibleBitmap(src_dc, width, height)
+        return bitmap
+
+    def select_bitmap(self, handles, bitmap) -> None:
+        """把位图选入内存DC，之后的BitBlt/PrintWindow写入该位图"""
+        _, _, mem_dc = handles
+        mem_dc.SelectObject(bitmap)
+
+    def delete_bitmap(self, bitmap) -> None:
+        win32gui.DeleteObject(bitmap.GetHandle())
+
+    def bitblt(self, handles, left: int, top: int, width: int, height: int) -> None:
+        """把窗口客户区(left, top)起width x height的内容复制到位图左上角"""
+        _, src_dc, mem_dc = handles
+        mem_dc.BitBlt((0, 0), (width, height), src_dc, (left, top), win32con.SRCCOPY)
+
+    def print_window(self, hwnd: int, handles, flags: int = 0) -> bool:
+        """用PrintWindow把窗口绘制到位图，win32gui没有PrintWindow时改发WM_PRINT"""
+        _, _, mem_dc = handles
+        try:
+            return bool(win32gui.PrintWindow(hwnd, mem_dc.GetSafeHdc(), flags))
+        except AttributeError:
+            win32api.SendMessage(hwnd, win32con.WM_PRINT, mem_dc.GetSafeHdc(),
+                                 win32con.PRF_CLIENT | win32con.PRF_NONCLIENT | win32con.PRF_ERASEBKGND)
+            return True
+
+    def bitmap_view(self, bitmap, width: int, height: int) -> np.ndarray:
+        """把位图数据（BGRX）包装为 (height, width, 4) 的只读数组，不拷贝数据"""
+        return np.frombuffer(bitmap.GetBitmapBits(True), dtype=np.uint8).reshape((height, width, 4))
+
+
+class GdiCaptureContext:
+    """单个窗口的持久截图上下文，线程安全"""
+
+    def __init__(self, hwnd: int, gdi=None):
+        self.hwnd = hwnd
+        self.gdi = gdi if gdi is not None else Win32Gdi()
+        # 创建DC时的客户区（或窗口）尺寸 (width, height)，变化时全部重建
+        self.size = None
+        self._handles = None
+        # 按尺寸保存的位图 {(width, height): bitmap}，最近使用的在最后
+        self._bitmaps = OrderedDict()
+        # 当前选入内存DC的位图尺寸
+        self._selected = None
+        self._lock = threading.Lock()
+        # 统计
+        self.captures = 0
+        self.rebuilds = 0
+
+    def _ensure(self, size: Tuple[int, int], bitmap_size: Tuple[int, int]) -> None:
+        """
+        准备DC和bitmap_size大小的位图并选入内存DC（调用方需持有锁）
+        :param size: 客户区（或窗口）尺寸，与创建DC时不同时全部重建
+        :param bitmap_size: 位图尺寸，截取区域时为区域尺寸
+        """
+        if self._handles is None or self.size != size:
+            self._release()
+            self._handles = self.gdi.acquire(self.hwnd)
+            self.size = size
+            self.rebuilds += 1
+        bitmap = self._bitmaps.get(bitmap_size)
+        if bitmap is None:
+            bitmap = self.gdi.create_bitmap(self._handles, *bitmap_size)
+            self._bitmaps[bitmap_size] = bitmap
+        self._bitmaps.move_to_end(bitmap_size)
+        if self._selected != bitmap_size:
+            self.gdi.select_bitmap(self._handles, bitmap)
+            self._selected = bitmap_size
+        # 删除最久未使用的位图，当前选入的位图在最后，不会被删除
+        while len(self._bitmaps) > MAX_BITMAPS:
+            _, old = self._bitmaps.popitem(last=False)
+            self.gdi.delete_bitmap(old)
+
+    def _release(self) -> None:
+        """释放DC和位图（调用方需持有锁），先删除DC，位图不再被选入时才能删除"""
+        bitmaps, handles = list(self._bitmaps.values()), self._handles
+        self._bitmaps.clear()
+        self._handles = None
+        self._selected = None
+        self.size = None
+        try:
+            if handles is not None:
+                self.gdi.release(self.hwnd, handles)
+        finally:
+            for bitmap in bitmaps:
+                self.gdi.delete_bitmap(bitmap)
+
+    def _read(self, width: int, height: int, color_format: str, dst: Optional[np.ndarray]) -> np.ndarray:
+        """读取当前位图（尺寸为width x height）并转换为目标格式"""
+        bgra = self.gdi.bitmap_view(self._bitmaps[self._selected], width, height)
+        self.captures += 1
+        # 从位图直接转换为目标格式，dst为None时返回新数组，调用方可以长期持有
+        return convert_frame(bgra, color_format, dst)
+
+    def bitblt(self, width: int, height: int, region: Optional[Region] = None,
+               color_format: str = 'bgr', dst: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        用BitBlt截取客户区
+
+        参数:
+            width, height: 当前客户区尺寸，与上次不同时重建位图
+            region: 可选的捕获区域 (left, top, width, height)，相对于窗口客户区
+            color_format: 输出格式，见preprocess.CAPTURE_FORMATS
+            dst: 可选的输出缓冲区
+
+        返回:
+            指定格式的图像，窗口已销毁或区域为空时返回None
+        """
+        with self._lock:
+            if not self.gdi.is_window(self.hwnd):
+                self._release()
+                return None
+            if region is not None:
+                region = clip_region(region, width, height)
+                if region is None:
+                    return None
+            left, top, w, h = region if region is not None else (0, 0, width, height)
+            try:
+                # 位图与截取区域一样大，BitBlt和读取位图数据都只涉及区域内的像素
+                self._ensure((width, height), (w, h))
+                self.gdi.bitblt(self._handles, left, top, w, h)
+                return self._read(w, h, color_format, dst)
+            except Exception:
+                # DC可能已经失效，释放后下次截图时重建
+                self._release()
+                raise
+
+    def print_window(self, width: int, height: int, flags: int = 0, color_format: str = 'bgr',
+                     dst: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """用PrintWindow截取整个窗口，width/height为窗口尺寸，失败时返回None"""
+        with self._lock:
+            if not self.gdi.is_window(self.hwnd):
+                self._release()
+                return None
+            try:
+                self._ensure((width, height), (width, height))
+                if not self.gdi.print_window(self.hwnd, self._handles, flags):
+                    print("PrintWindow调用失败")
+                    return None
+                return self._read(width, height, color_format, dst)
+            except Exception:
+                self._release()
+                raise
+
+    def release(self) -> None:
+        """释放DC和位图"""
+        with self._lock:
+            self._release()
+
+
+# 每个窗口句柄的截图上下文 {(hwnd, 是否PrintWindow): GdiCaptureContext}
+# BitBlt使用客户区尺寸、PrintWindow使用整窗尺寸，分开保存避免两者交替使用时反复重建
+_contexts: Dict[Tuple[int, bool], GdiCaptureContext] = {}
+_contexts_lock = threading.Lock()
+
+
+def get_capture_context(hwnd: int, print_window: bool = False, gdi=None) -> GdiCaptureContext:
+    """获取窗口的截图上下文，不存在时创建"""
+    key = (hwnd, print_window)
+    with _contexts_lock:
+        context = _contexts.get(key)
+        if context is None:
+            context = GdiCaptureContext(hwnd, gdi)
+            _contexts[key] = context
+        return context
+
+
+def release_capture_context(hwnd: int) -> None:
+    """释放窗口的截图上下文，窗口关闭或不再使用时调用"""
+    with _contexts_lock:
+        contexts = [_contexts.pop(key) for key in list(_contexts) if key[0] == hwnd]
+    for context in contexts:
+        context.release()
+
+
+def release_all_capture_contexts() -> None:
+    """释放所有截图上下文"""
+    with _contexts_lock:
+        contexts = list(_contexts.values())
+        _contexts.clear()
+    for context in contexts:
+        try:
+            context.release()
+        except Exception:
+            pass
+
+
+atexit.register(release_all_capture_contexts)
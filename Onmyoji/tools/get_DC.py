@@ -1,15 +1,25 @@
-import win32gui
-import win32ui
-import win32con
-import win32api
 import numpy as np
 import cv2
-import pyautogui
 import random
-from PIL import Image, ImageEnhance, ImageFilter
-from typing import Optional, Tuple, Union, List
+from PIL import Image
+from typing import Dict, Optional, Tuple, Union, List
 from .WindowChecker import WindowChecker
 
+try:
+    import win32gui
+    import win32ui
+    import win32con
+    import win32api
+except ImportError:
+    # 非Windows环境下没有pywin32，只能使用回放/合成截图源（见frame_source.py）
+    win32gui = win32ui = win32con = win32api = None
+from .gdi_context import get_capture_context
+from .preprocess import FramePreprocessor, capture_format_for, convert_frame, preprocess_gray
+from .template_store import TemplateEntry, downscale, get_template_store
+from .search_region import Region
+from .template_matcher import (MatchResult, MatchStrategy, match_coarse_to_fine,
+                               match_many as match_templates, match_prepared, prepare_frame)
+
 class WindowCapture:
     def __init__(self, window_title: Optional[str] = None, hwnd: Optional[int] = None):
         # 复用WindowChecker类获取窗口信息
@@ -42,6 +52,9 @@ class WindowCapture:
         
         # 初始化窗口状态标志
         self._minimized_manually_restored = False
+        
+        # 截图预处理器，复用灰度化/对比度/模糊的输出缓冲区
+        self.preprocessor = FramePreprocessor()
     
     def get_window_info(self) -> Optional[Tuple[Tuple[int, int], Tuple[int, int], Tuple[int, int]]]:
         """
@@ -165,13 +178,16 @@ class WindowCapture:
             except:
                 pass
     
-    def capture_window_bitblt(self, region: Optional[Tuple[int, int, int, int]] = None) -> Optional[np.ndarray]:
+    def capture_window_bitblt(self, region: Optional[Tuple[int, int, int, int]] = None,
+                              color_format: str = 'bgr', dst: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
         """
         使用BitBlt方法捕获窗口图像，即使窗口被遮挡或在后台
         
         参数:
             region: 可选的捕获区域 (left, top, width, height)，相对于窗口客户区
-                    如果为None，则捕获整个客户区
+                    如果为None，则捕获整个客户区；窗口最小化或客户区尺寸无效时忽略，返回整个客户区
+            color_format: 输出格式，bgr/gray/b/g/r/bgra，从位图直接转换，灰度匹配时可省去一次整图转换
+            dst: 可选的输出缓冲区，尺寸和格式相符时结果直接写入
         
         返回:
             如果捕获成功，返回窗口的OpenCV图像数据
@@ -184,7 +200,7 @@ class WindowCapture:
                 # 首先尝试不恢复窗口的方法
                 result = self.capture_minimized_window()
                 if result is not None:
-                    return result
+                    return convert_frame(result, color_format, dst)
                 
                 # 如果不恢复窗口的方法失败，再使用传统的临时恢复窗口方法
                 print("窗口处于最小化状态，临时恢复窗口...")
@@ -204,54 +220,11 @@ class WindowCapture:
             # 检查窗口尺寸是否有效
             if self.client_width <= 0 or self.client_height <= 0:
                 print("窗口客户区尺寸无效，尝试使用PrintWindow方法")
-                return self.capture_window()
+                return self.capture_window(color_format, dst)
                 
-            # 确定捕获区域
-            if region:
-                left, top, width, height = region
-            else:
-                left, top = 0, 0
-                width, height = self.client_width, self.client_height
-            
-            # 获取窗口的设备上下文
-            hWndDC = win32gui.GetDC(self.hwnd)
-            mfcDC = win32ui.CreateDCFromHandle(hWndDC)
-            saveDC = mfcDC.CreateCompatibleDC()
-            
-            # 创建位图对象
-            saveBitMap = win32ui.CreateBitmap()
-            saveBitMap.CreateCompatibleBitmap(mfcDC, width, height)
-            
-            # 将位图选入设备上下文
-            saveDC.SelectObject(saveBitMap)
-            
-            # 使用BitBlt复制图像
-            saveDC.BitBlt(
-                (0, 0),
-                (width, height),
-                mfcDC,
-                (left, top),
-                win32con.SRCCOPY,
-            )
-            
-            # 获取位图信息
-            bmpinfo = saveBitMap.GetInfo()
-            bmpstr = saveBitMap.GetBitmapBits(True)
-            
-            # 生成图像（注意：Windows位图是BGRX格式）
-            try:
-                img = np.frombuffer(
-                    bmpstr,
-                    dtype='uint8'
-                ).reshape((height, width, 4))
-            except ValueError as e:
-                print(f"图像数据重塑失败: {str(e)}")
-                return None
-            
-            # 转换为RGB格式（丢弃Alpha通道）
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-            
-            return img
+            # 复用该窗口的设备上下文和位图，客户区尺寸变化时才重建；指定region时只复制该区域
+            return get_capture_context(self.hwnd).bitblt(self.client_width, self.client_height, region,
+                                                         color_format, dst)
         except Exception as e:
             print(f"使用BitBlt捕获窗口图像时发生错误: {str(e)}")
             return None
@@ -260,15 +233,6 @@ class WindowCapture:
             if self._minimized_manually_restored:
                 win32gui.ShowWindow(self.hwnd, win32con.SW_MINIMIZE)
                 self._minimized_manually_restored = False
-            
-            # 清理资源
-            try:
-                win32gui.DeleteObject(saveBitMap.GetHandle())
-                saveDC.DeleteDC()
-                mfcDC.DeleteDC()
-                win32gui.ReleaseDC(self.hwnd, hWndDC)
-            except:
-                pass
     
     def is_window_minimized(self) -> bool:
         """
@@ -300,10 +264,13 @@ class WindowCapture:
         
         return False
     
-    def capture_window(self) -> Optional[np.ndarray]:
+    def capture_window(self, color_format: str = 'bgr', dst: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
         """
         捕获窗口的完整图像，即使窗口被最小化或被遮挡
         
+        参数:
+            color_format, dst: 同capture_window_bitblt
+        
         返回:
             如果捕获成功，返回窗口的OpenCV图像数据
             如果捕获失败，返回None
@@ -325,53 +292,14 @@ class WindowCapture:
             time.sleep(0.1)  # 短暂延迟以确保窗口完全恢复
         
         try:
-            # 获取窗口的设备上下文
-            hdc = win32gui.GetDC(self.hwnd)
-            dc_obj = win32ui.CreateDCFromHandle(hdc)
-            mem_dc = dc_obj.CreateCompatibleDC()
-            
-            # 创建位图对象
-            bmp = win32ui.CreateBitmap()
-            bmp.CreateCompatibleBitmap(dc_obj, width, height)
-            mem_dc.SelectObject(bmp)
-            
-            # 使用更兼容的方式调用PrintWindow
-            try:
-                # 尝试从win32gui调用PrintWindow
-                result = win32gui.PrintWindow(self.hwnd, mem_dc.GetSafeHdc(), 0)
-                if not result:
-                    print("PrintWindow调用失败")
-                    return None
-            except AttributeError:
-                # 如果win32gui没有PrintWindow，尝试使用win32api的SendMessage
-                try:
-                    # 使用win32api的方式
-                    result = win32api.SendMessage(self.hwnd, win32con.WM_PRINT, mem_dc.GetSafeHdc(), win32con.PRF_CLIENT | win32con.PRF_NONCLIENT | win32con.PRF_ERASEBKGND)
-                except Exception as e:
-                    print(f"使用替代方法捕获窗口失败: {str(e)}")
-                    return None
-            
-            # 将位图转换为OpenCV图像
-            signed_ints_array = bmp.GetBitmapBits(True)
-            img = np.frombuffer(signed_ints_array, dtype='uint8')
-            img.shape = (height, width, 4)
-            
-            # 转换为RGB格式（丢弃Alpha通道）
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-            
-            return img
+            # 复用该窗口的设备上下文和位图，窗口尺寸变化时才重建
+            return get_capture_context(self.hwnd, print_window=True).print_window(width, height,
+                                                                                  color_format=color_format,
+                                                                                  dst=dst)
         except Exception as e:
             print(f"捕获窗口图像时发生错误: {str(e)}")
             return None
         finally:
-            # 清理资源
-            try:
-                mem_dc.DeleteDC()
-                dc_obj.DeleteDC()
-                win32gui.ReleaseDC(self.hwnd, hdc)
-            except:
-                pass
-            
             # 如果窗口原本是最小化的，恢复最小化状态
             if is_minimized:
                 win32gui.ShowWindow(self.hwnd, win32con.SW_MINIMIZE)
@@ -395,7 +323,9 @@ class WindowCapture:
     def find_image_precise(self, target_image: Union[str, Image.Image], threshold: float = 0.8, 
                          grayscale: bool = True, confidence: float = None, 
                          enhance_contrast: bool = True, contrast_factor: float = 1.2, 
-                         blur_level: int = 0, use_bitblt: bool = True, skip_preprocessing: bool = False) -> Optional[Tuple[int, int]]:
+                         blur_level: int = 0, use_bitblt: bool = True, skip_preprocessing: bool = False,
+                         pyramid_level: int = 0, strategy: Optional[MatchStrategy] = None,
+                         frame: Optional[np.ndarray] = None) -> Optional[Tuple[int, int]]:
         """
         基于pyautogui底层逻辑的精确图像识别函数
         优化了模板匹配算法，增加了图像预处理选项，提高识别准确性
@@ -410,6 +340,10 @@ class WindowCapture:
             blur_level: 模糊程度，0表示不模糊，>0表示应用高斯模糊（减少噪声干扰）
             use_bitblt: 是否使用BitBlt方法进行截图（支持后台窗口）
             skip_preprocessing: 是否完全跳过图像预处理（使用原始RGB图像进行匹配）
+            pyramid_level: 金字塔匹配层级，0为关闭，1/2表示先在1/2或1/4缩小的截图上粗定位，
+                           再只在峰值附近用原分辨率确认，可大幅减少计算量
+            strategy: 匹配策略，默认只跑相关系数匹配、不复核；指定了备用算法时分数接近阈值才用备用算法复核
+            frame: 已有的BGR截图（如后台截图线程的最新帧），为None时同步截取当前窗口
         
         返回:
             如果找到匹配，返回一个元组(x, y)表示目标图像在窗口中的中心相对位置
@@ -419,101 +353,56 @@ class WindowCapture:
         if confidence is not None:
             threshold = confidence
             
-        # 根据use_bitblt参数选择截图方法
-        if use_bitblt:
-            window_image = self.capture_window_bitblt()
+        # 根据use_bitblt参数选择截图方法，灰度匹配时截图层直接输出灰度图
+        color_format = capture_format_for(grayscale, skip_preprocessing)
+        if frame is not None:
+            window_image = frame
+        elif use_bitblt:
+            window_image = self.capture_window_bitblt(color_format=color_format)
         else:
-            window_image = self.capture_window()
+            window_image = self.capture_window(color_format)
             
         if window_image is None:
             print("无法捕获窗口图像")
             return None
         
-        # 读取目标图像
+        # 读取目标图像，文件路径走进程级模板缓存，只在首次使用时解码和预处理
+        use_gray = grayscale and not skip_preprocessing
         if isinstance(target_image, str):
-            target = cv2.imread(target_image)
+            entry = get_template_store().get(target_image, grayscale=use_gray,
+                                             enhance_contrast=enhance_contrast,
+                                             contrast_factor=contrast_factor, blur_level=blur_level)
+            if entry is None:
+                raise Exception("无法读取目标图像")
         elif isinstance(target_image, Image.Image):
             # 转换PIL Image到OpenCV格式
-            target = cv2.cvtColor(np.array(target_image), cv2.COLOR_RGB2BGR)
+            target_bgr = cv2.cvtColor(np.array(target_image), cv2.COLOR_RGB2BGR)
+            target_gray = cv2.cvtColor(target_bgr, cv2.COLOR_BGR2GRAY)
+            processed = target_bgr
+            if use_gray:
+                processed = preprocess_gray(target_gray, enhance_contrast, contrast_factor, blur_level)
+            entry = TemplateEntry('', target_bgr, target_gray, processed)
         else:
             raise TypeError("target_image必须是文件路径或PIL Image对象")
         
-        # 检查目标图像是否有效
-        if target is None:
-            raise Exception("无法读取目标图像")
+        target = entry.processed
         
         # 检查窗口图像尺寸是否大于目标图像
         if window_image.shape[0] < target.shape[0] or window_image.shape[1] < target.shape[1]:
             print("窗口图像尺寸小于目标图像，无法进行匹配")
             return None
         
-        # 如果跳过预处理，直接使用原始RGB图像进行匹配
-        if skip_preprocessing:
-            # 直接使用彩色图进行匹配
-            result = cv2.matchTemplate(window_image, target, cv2.TM_CCOEFF_NORMED)
-            min_val, best_max_val, min_loc, best_max_loc = cv2.minMaxLoc(result)
+        # 预处理截图并匹配（模板一侧已在缓存中处理完毕）
+        prepared = prepare_frame(window_image, grayscale, enhance_contrast, contrast_factor,
+                                 blur_level, skip_preprocessing, self.preprocessor)
+        if pyramid_level > 0:
+            best_max_val, best_max_loc, method = match_coarse_to_fine(prepared, downscale(prepared, pyramid_level),
+                                                                      entry, pyramid_level, strategy=strategy,
+                                                                      threshold=threshold)
         else:
-            # 图像预处理
-            # 1. 转为灰度图
-            if grayscale:
-                window_image_gray = cv2.cvtColor(window_image, cv2.COLOR_BGR2GRAY)
-                target_gray = cv2.cvtColor(target, cv2.COLOR_BGR2GRAY)
-                
-                # 2. 增强对比度，但限制增强强度以避免图像失真
-                if enhance_contrast and contrast_factor > 1.0:
-                    # 确保对比度因子在合理范围内
-                    contrast_factor = max(1.0, min(1.5, contrast_factor))
-                    
-                    # 转换为PIL Image进行对比度增强
-                    pil_window = Image.fromarray(window_image_gray)
-                    enhancer = ImageEnhance.Contrast(pil_window)
-                    pil_window_enhanced = enhancer.enhance(contrast_factor)
-                    window_image_gray = np.array(pil_window_enhanced)
-                    
-                    pil_target = Image.fromarray(target_gray)
-                    enhancer = ImageEnhance.Contrast(pil_target)
-                    pil_target_enhanced = enhancer.enhance(contrast_factor)
-                    target_gray = np.array(pil_target_enhanced)
-                
-                # 3. 应用高斯模糊
-                if blur_level > 0:
-                    ksize = (blur_level * 2 + 1, blur_level * 2 + 1)  # 确保核大小为奇数
-                    window_image_gray = cv2.GaussianBlur(window_image_gray, ksize, 0)
-                    target_gray = cv2.GaussianBlur(target_gray, ksize, 0)
-                
-                # 尝试多种匹配算法
-                methods = [
-                    cv2.TM_CCOEFF_NORMED,  # 相关系数归一化匹配
-                    cv2.TM_CCORR_NORMED,   # 相关匹配
-                    cv2.TM_SQDIFF_NORMED   # 平方差匹配
-                ]
-                
-                best_max_val = -1
-                best_max_loc = (0, 0)
-                
-                for method in methods:
-                    if method == cv2.TM_SQDIFF_NORMED:
-                        # 对于平方差匹配，最小值表示最佳匹配
-                        result = cv2.matchTemplate(window_image_gray, target_gray, method)
-                        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-                        # 转换为类似其他方法的值范围（越高越好）
-                        current_score = 1 - min_val
-                        current_loc = min_loc
-                    else:
-                        # 对于其他方法，最大值表示最佳匹配
-                        result = cv2.matchTemplate(window_image_gray, target_gray, method)
-                        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-                        current_score = max_val
-                        current_loc = max_loc
-                    
-                    # 更新最佳匹配
-                    if current_score > best_max_val:
-                        best_max_val = current_score
-                        best_max_loc = current_loc
-            else:
-                # 不使用灰度图，直接使用彩色图
-                result = cv2.matchTemplate(window_image, target, cv2.TM_CCOEFF_NORMED)
-                min_val, best_max_val, min_loc, best_max_loc = cv2.minMaxLoc(result)
+            best_max_val, best_max_loc, method = match_prepared(prepared, target, strategy, threshold)
+        if strategy is not None and best_max_val >= threshold:
+            strategy.record(method)
         
         # 如果匹配度大于阈值，返回匹配位置
         if best_max_val >= threshold:
@@ -531,6 +420,42 @@ class WindowCapture:
         # print(f"未找到图像，最高匹配度: {best_max_val:.2f} 低于阈值: {threshold}")
         return None
 
+    def match_many(self, frame: Optional[np.ndarray], templates: Dict[str, str],
+                   grayscale: bool = True, enhance_contrast: bool = True, contrast_factor: float = 1.2,
+                   blur_level: int = 0, use_bitblt: bool = True, skip_preprocessing: bool = False,
+                   regions: Optional[Dict[str, Region]] = None, pyramid_level: int = 0,
+                   strategies: Optional[Dict[str, MatchStrategy]] = None,
+                   threshold: float = 0.8) -> Dict[str, MatchResult]:
+        """
+        一次截图匹配多个模板
+        截图和截图预处理只做一次，每个模板只额外付出一次matchTemplate的开销
+        
+        参数:
+            frame: 已有的BGR截图，为None时自动截取当前窗口
+            templates: {模板名: 模板图片路径}，字典顺序即优先级
+            regions: {模板名: (left, top, width, height)}，有区域的模板只在该区域内匹配
+            pyramid_level: 金字塔匹配层级，缩小的截图每帧只生成一次
+            strategies: {模板名: MatchStrategy}，每个模板的匹配策略，命中时记录胜出的算法
+            threshold: 匹配阈值，分数接近阈值时才使用备用算法复核
+            其余参数同find_image_precise
+        
+        返回:
+            {模板名: MatchResult}，截图失败时返回空字典
+        """
+        if frame is None:
+            color_format = capture_format_for(grayscale, skip_preprocessing)
+            frame = (self.capture_window_bitblt(color_format=color_format) if use_bitblt
+                     else self.capture_window(color_format))
+        if frame is None:
+            print("无法捕获窗口图像")
+            return {}
+        
+        return match_templates(frame, templates, grayscale=grayscale, enhance_contrast=enhance_contrast,
+                               contrast_factor=contrast_factor, blur_level=blur_level,
+                               skip_preprocessing=skip_preprocessing, regions=regions,
+                               pyramid_level=pyramid_level, strategies=strategies, threshold=threshold,
+                               preprocessor=self.preprocessor)
+
 # 示例用法
 if __name__ == "__main__":
     try:
@@ -16,6 +16,7 @@ from .WindowSynchronizer import WindowSynchronizer
 from ..source import *
 from ..tools import *
 from .config_mannager import ConfigReader
+from .cancellation import CancellationToken
 
 # 创建 logs 文件夹
 LOGS_DIR = 'logs'
@@ -175,6 +176,8 @@ class MainWindow(QtWidgets.QDialog):
         # 线程管理
         self.active_threads = []
         self.shutdown_flag = False
+        # 所有挑战共用的取消信号，紧急停止时发出，挑战在一个轮询周期内退出
+        self.cancel_token = CancellationToken()
 
         # 创建线程锁
         self.lock = threading.Lock()
@@ -339,7 +342,8 @@ class MainWindow(QtWidgets.QDialog):
                 sub_config_reader = ConfigReader(sub_config_path)
                 sub_config = sub_config_reader.read_config()
                 if sub_config:
-                    mode_choice(mode, sub_mode, times, config=sub_config, window_title=window_title, hidden_window=hidden_window)
+                    mode_choice(mode, sub_mode, times, config=sub_config, window_title=window_title, hidden_window=hidden_window,
+                                cancel_token=self.cancel_token)
                 else:
                     print(f"读取 {sub_config_path} 配置文件失败。")
             else:
@@ -390,6 +394,8 @@ class MainWindow(QtWidgets.QDialog):
 
     # 紧急停止函数
     def emergency_stop(self):
+        # 先通知所有挑战停止截图和点击，再等待线程退出
+        self.cancel_token.cancel("紧急停止")
         for thread in self.active_threads[:]:
             if thread.is_alive():
                 thread.join(timeout=0.5)
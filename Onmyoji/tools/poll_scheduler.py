@@ -0,0 +1,110 @@
+"""
+自适应轮询调度
+挑战循环没有识别到任何模板时不会等待，会以CPU允许的最快速度反复截图和匹配，每个运行中的模式占满一个核心。
+PollScheduler控制两次识别之间的间隔：没有识别到模板时间隔按倍数增长，直到上限；
+刚执行过操作或检测到画面变化时恢复到下限，让游戏响应后的新画面能被尽快识别。
+"""
+
+import time
+
+from typing import Callable
+
+# 默认最短轮询间隔（秒）
+DEFAULT_MIN_INTERVAL = 0.05
+
+# 默认最长轮询间隔（秒）
+DEFAULT_MAX_INTERVAL = 1.0
+
+# 默认每次未识别到模板后间隔增长的倍数
+DEFAULT_BACKOFF = 1.5
+
+# 计算轮询频率时新一次间隔所占的权重
+RATE_SMOOTHING = 0.2
+
+
+class PollScheduler:
+    """挑战循环的轮询间隔调度器"""
+
+    def __init__(self, min_interval: float = DEFAULT_MIN_INTERVAL, max_interval: float = DEFAULT_MAX_INTERVAL,
+                 backoff: float = DEFAULT_BACKOFF, sleep: Callable[[float], object] = time.sleep):
+        """
+        :param min_interval: 最短间隔（秒），0表示执行操作后立即开始下一次识别
+        :param max_interval: 最长间隔（秒），小于min_interval时按min_interval处理
+        :param backoff: 未识别到模板时间隔增长的倍数
+        :param sleep: 等待函数，传入CancellationToken.sleep时取消后立即结束等待
+        """
+        self.sleep = sleep
+        self.min_interval = max(0.0, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        # 当前的轮询间隔
+        self.interval = self.min_interval
+        self._last_tick = None
+        self._average_period = None
+        # 统计
+        self.ticks = 0
+        self.idle_ticks = 0
+        self.slept = 0.0
+
+    def remaining(self) -> float:
+        """距离下一次识别还需要等待的时间（秒）"""
+        if self._last_tick is None:
+            return 0.0
+        return max(0.0, self.interval - (time.monotonic() - self._last_tick))
+
+    def wait(self) -> None:
+        """距上一次识别不足当前间隔时等待，在每次识别之前调用"""
+        delay = self.remaining()
+        if delay > 0:
+            self.sleep(delay)
+        self.mark_tick(delay)
+
+    def mark_tick(self, slept: float = 0.0) -> None:
+        """
+        记录一次识别开始，不等待；异步引擎在事件循环中等待remaining()秒后调用
+        :param slept: 调用前已经等待的时间（秒），计入统计
+        """
+        now = time.monotonic()
+        self.slept += slept
+        if self._last_tick is not None:
+            period = now - self._last_tick
+            if self._average_period is None:
+                self._average_period = period
+            else:
+                self._average_period += RATE_SMOOTHING * (period - self._average_period)
+        self._last_tick = now
+        self.ticks += 1
+
+    def on_action(self) -> None:
+        """识别到模板并执行了操作"""
+        self.interval = self.min_interval
+
+    def on_change(self) -> None:
+        """没有识别到模板，但画面发生了变化"""
+        self.interval = self.min_interval
+
+    def on_idle(self) -> None:
+        """没有识别到模板，画面也没有变化"""
+        self.idle_ticks += 1
+        # 最短间隔为0时从10毫秒开始增长
+        self.interval = min(max(self.interval, 0.01) * self.backoff, self.max_interval)
+
+    def update(self, acted: bool, changed: bool) -> None:
+        """根据本次识别的结果调整间隔"""
+        if acted:
+            self.on_action()
+        elif changed:
+            self.on_change()
+        else:
+            self.on_idle()
+
+    @property
+    def tick_rate(self) -> float:
+        """当前的轮询频率（次/秒），按最近几次识别的间隔平滑计算"""
+        if not self._average_period:
+            return 0.0
+        return 1.0 / self._average_period
+
+    def summary(self) -> str:
+        return (f"共轮询 {self.ticks} 次，其中未识别到模板 {self.idle_ticks} 次，累计等待 {self.slept:.1f} 秒，"
+                f"当前间隔 {self.interval:.2f} 秒（{self.tick_rate:.1f} 次/秒）")
@@ -0,0 +1,150 @@
+"""
+图像预处理工具
+窗口截图和模板图片共用同一套灰度化、对比度增强和模糊流程，
+保证两边的处理方式完全一致，匹配分数才有可比性。
+
+对比度增强使用查找表实现，结果与PIL的ImageEnhance.Contrast逐像素一致，
+但不需要在numpy和PIL之间来回转换；截图一侧可以使用FramePreprocessor复用输出缓冲区。
+截图层可以直接从BGRA位图转换出匹配需要的格式（见convert_frame），灰度匹配时省去一次整图转换。
+"""
+
+import cv2
+import numpy as np
+
+from typing import Optional
+
+# 查找表的输入值 0-255
+_LEVELS = np.arange(256, dtype=np.float32)
+
+# 截图格式：bgr为三通道彩色，gray为灰度，b/g/r为单个颜色通道，bgra为原始位图
+CAPTURE_FORMATS = ('bgr', 'gray', 'b', 'g', 'r', 'bgra')
+
+_CHANNEL_INDEX = {'b': 0, 'g': 1, 'r': 2}
+
+# (输入通道数, 输出格式) -> cvtColor转换码
+_CONVERT_CODES = {
+    (4, 'bgr'): cv2.COLOR_BGRA2BGR,
+    (4, 'gray'): cv2.COLOR_BGRA2GRAY,
+    (3, 'gray'): cv2.COLOR_BGR2GRAY,
+    (3, 'bgra'): cv2.COLOR_BGR2BGRA,
+}
+
+
+def convert_frame(image: np.ndarray, color_format: str = 'bgr',
+                  dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    把BGRA位图或BGR截图直接转换为需要的格式，只做一次转换
+
+    参数:
+        image: BGRA或BGR图像，可以是只读的位图视图
+        color_format: 输出格式，见CAPTURE_FORMATS
+        dst: 输出缓冲区，形状不符时OpenCV会重新分配
+
+    返回:
+        转换后的图像，格式与输入相同且未指定dst时直接返回输入
+    """
+    channels = image.shape[2] if image.ndim == 3 else 1
+    if color_format in _CHANNEL_INDEX and channels >= 3:
+        return cv2.extractChannel(image, _CHANNEL_INDEX[color_format], dst=dst)
+    code = _CONVERT_CODES.get((channels, color_format))
+    if code is not None:
+        return cv2.cvtColor(image, code, dst=dst)
+    if (channels, color_format) in ((4, 'bgra'), (3, 'bgr'), (1, 'gray')):
+        if dst is None or dst.shape != image.shape:
+            return image if dst is None else image.copy()
+        np.copyto(dst, image)
+        return dst
+    raise ValueError(f"无法把{channels}通道的截图转换为{color_format}格式")
+
+
+def capture_format_for(grayscale: bool = True, skip_preprocessing: bool = False) -> str:
+    """匹配参数对应的截图格式，灰度匹配时截图层直接输出灰度图"""
+    return 'gray' if grayscale and not skip_preprocessing else 'bgr'
+
+
+def clamp_contrast_factor(contrast_factor: float) -> float:
+    """确保对比度因子在合理范围内，避免图像失真"""
+    return max(1.0, min(1.5, contrast_factor))
+
+
+def contrast_lut(mean: int, contrast_factor: float) -> np.ndarray:
+    """
+    生成对比度增强的查找表
+    与PIL一致：以整图均值为中心线性拉伸，out = mean + factor * (v - mean)，截断到0-255后取整
+    """
+    values = mean + np.float32(contrast_factor) * (_LEVELS - mean)
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def enhance_contrast_gray(gray: np.ndarray, contrast_factor: float,
+                          dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """对灰度图做对比度增强，dst不为None时结果写入dst"""
+    mean = int(cv2.mean(gray)[0] + 0.5)
+    return cv2.LUT(gray, contrast_lut(mean, contrast_factor), dst=dst)
+
+
+def blur_ksize(blur_level: int):
+    """高斯模糊的核大小，确保为奇数"""
+    return blur_level * 2 + 1, blur_level * 2 + 1
+
+
+def preprocess_gray(gray: np.ndarray, enhance_contrast: bool = True,
+                    contrast_factor: float = 1.2, blur_level: int = 0) -> np.ndarray:
+    """
+    对灰度图执行对比度增强和高斯模糊
+
+    参数:
+        gray: 单通道灰度图
+        enhance_contrast: 是否增强对比度
+        contrast_factor: 对比度增强因子，会被限制在1.0-1.5之间
+        blur_level: 模糊程度，0表示不模糊
+
+    返回:
+        处理后的灰度图
+    """
+    if enhance_contrast and contrast_factor > 1.0:
+        gray = enhance_contrast_gray(gray, clamp_contrast_factor(contrast_factor))
+
+    if blur_level > 0:
+        gray = cv2.GaussianBlur(gray, blur_ksize(blur_level), 0)
+
+    return gray
+
+
+class FramePreprocessor:
+    """
+    截图预处理器
+    灰度化、对比度增强和模糊的结果写入预先分配的缓冲区，截图尺寸不变时每帧不再分配新内存。
+    返回的图像会在下一次调用时被覆盖，且不是线程安全的，每个截图对象持有自己的实例。
+    """
+
+    def __init__(self):
+        self._gray = None
+        self._contrast = None
+        self._blur = None
+
+    @staticmethod
+    def _buffer(buffer: Optional[np.ndarray], shape) -> np.ndarray:
+        if buffer is None or buffer.shape != shape:
+            return np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    def __call__(self, frame: np.ndarray, enhance_contrast: bool = True,
+                 contrast_factor: float = 1.2, blur_level: int = 0) -> np.ndarray:
+        """BGR截图或截图层已转换好的灰度图 -> 预处理后的灰度图"""
+        shape = frame.shape[:2]
+        if frame.ndim == 2:
+            gray = frame
+        else:
+            self._gray = self._buffer(self._gray, shape)
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+        if enhance_contrast and contrast_factor > 1.0:
+            self._contrast = self._buffer(self._contrast, shape)
+            gray = enhance_contrast_gray(gray, clamp_contrast_factor(contrast_factor), dst=self._contrast)
+
+        if blur_level > 0:
+            self._blur = self._buffer(self._blur, shape)
+            gray = cv2.GaussianBlur(gray, blur_ksize(blur_level), 0, dst=self._blur)
+
+        return gray
@@ -0,0 +1,178 @@
+"""
+多进程匹配后端
+多开很多窗口时，截图预处理、逐个模板调用matchTemplate、整理结果这些Python代码都要在同一个进程里争抢GIL。
+ProcessMatcher把匹配交给一组工作进程：截图通过共享内存传给工作进程（不经过pickle拷贝），
+每个工作进程有自己的模板缓存和预处理器，结果以 (模板名, 分数, x, y, 宽, 高, 算法) 的元组返回。
+
+接口与template_matcher.match_many相同，OnmyjiAutomation.set_match_backend设置后识别流程不需要改动；
+同一进程中的所有窗口共用get_process_matcher返回的一个实例。
+"""
+
+import atexit
+import os
+import queue
+import threading
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+from .preprocess import FramePreprocessor
+from .search_region import Region
+from .template_matcher import MatchResult, MatchStrategy, match_many
+
+# 默认的工作进程数
+DEFAULT_MATCH_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+
+# 工作进程最多同时打开的共享内存块数，超过时关闭最早打开的
+WORKER_ATTACH_LIMIT = 16
+
+
+# ---------- 工作进程 ----------
+
+# 工作进程中已打开的共享内存块 {名称: SharedMemory}
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+# 工作进程是单线程的，整个进程复用一个预处理器
+_preprocessor: Optional[FramePreprocessor] = None
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    block = _attached.get(name)
+    if block is None:
+        if len(_attached) >= WORKER_ATTACH_LIMIT:
+            oldest = next(iter(_attached))
+            _attached.pop(oldest).close()
+        block = shared_memory.SharedMemory(name=name)
+        _attached[name] = block
+    return block
+
+
+def _match_in_worker(block_name: str, shape: Tuple[int, ...], templates: Dict[str, str], options: dict,
+                     strategies: Dict[str, tuple]) -> Dict[str, tuple]:
+    """在工作进程中匹配共享内存中的截图，模板缓存使用工作进程自己的get_template_store"""
+    global _preprocessor
+    if _preprocessor is None:
+        _preprocessor = FramePreprocessor()
+    block = _attach(block_name)
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+    strategies = {name: MatchStrategy(*spec) for name, spec in strategies.items()}
+    results = match_many(frame, templates, strategies=strategies, preprocessor=_preprocessor, **options)
+    return {name: tuple(result)[1:] for name, result in results.items()}
+
+
+# ---------- 主进程 ----------
+
+class _FrameSlot:
+    """主进程中的一块共享内存，截图尺寸变大时重新分配"""
+
+    def __init__(self):
+        self.block: Optional[shared_memory.SharedMemory] = None
+
+    def write(self, frame: np.ndarray) -> str:
+        if self.block is None or self.block.size < frame.nbytes:
+            self.release()
+            self.block = shared_memory.SharedMemory(create=True, size=max(frame.nbytes, 1))
+        np.copyto(np.ndarray(frame.shape, dtype=np.uint8, buffer=self.block.buf), frame)
+        return self.block.name
+
+    def release(self) -> None:
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+
+class ProcessMatcher:
+    """多进程匹配后端，线程安全，多个窗口的识别线程可以同时调用match_many"""
+
+    def __init__(self, processes: int = DEFAULT_MATCH_PROCESSES):
+        """
+        :param processes: 工作进程数，同时进行的匹配数不超过该值
+        """
+        self.processes = max(1, processes)
+        self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        # 每个进行中的匹配占用一块共享内存，用完放回
+        self._slots = queue.Queue()
+        for _ in range(self.processes):
+            self._slots.put(_FrameSlot())
+        self._closed = False
+        # 统计
+        self.frames = 0
+
+    def match_many(self, frame: np.ndarray, templates: Dict[str, str], grayscale: bool = True,
+                   enhance_contrast: bool = True, contrast_factor: float = 1.2, blur_level: int = 0,
+                   skip_preprocessing: bool = False, regions: Optional[Dict[str, Region]] = None,
+                   pyramid_level: int = 0, strategies: Optional[Dict[str, MatchStrategy]] = None,
+                   threshold: float = 0.8, preprocessor=None, first_hit: bool = False) -> Dict[str, MatchResult]:
+        """
+        参数和返回值同template_matcher.match_many
+        preprocessor在工作进程中没有意义，会被忽略；命中时在调用方的strategies中记录胜出的算法
+        """
+        if self._closed:
+            raise RuntimeError("匹配进程池已关闭")
+        if frame.dtype != np.uint8:
+            raise ValueError("截图必须是uint8格式")
+        strategies = strategies if strategies is not None else {}
+        for name in templates:
+            strategies.setdefault(name, MatchStrategy())
+        options = dict(grayscale=grayscale, enhance_contrast=enhance_contrast, contrast_factor=contrast_factor,
+                       blur_level=blur_level, skip_preprocessing=skip_preprocessing, regions=regions,
+                       pyramid_level=pyramid_level, threshold=threshold, first_hit=first_hit)
+        specs = {name: (strategies[name].primary, strategies[name].fallback, strategies[name].margin)
+                 for name in templates}
+
+        slot = self._slots.get()
+        try:
+            block_name = slot.write(frame)
+            future = self._executor.submit(_match_in_worker, block_name, frame.shape, templates, options, specs)
+            raw = future.result()
+        finally:
+            self._slots.put(slot)
+
+        self.frames += 1
+        results = {}
+        for name, values in raw.items():
+            result = MatchResult(name, *values)
+            if result.score >= threshold:
+                strategies[name].record(result.method)
+            results[name] = result
+        return results
+
+    def close(self) -> None:
+        """关闭工作进程并释放共享内存"""
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._slots.get_nowait().release()
+            except queue.Empty:
+                break
+
+
+_default_matcher: Optional[ProcessMatcher] = None
+_default_lock = threading.Lock()
+
+
+def get_process_matcher(processes: int = DEFAULT_MATCH_PROCESSES) -> ProcessMatcher:
+    """获取进程共用的多进程匹配后端，首次调用时启动工作进程"""
+    global _default_matcher
+    with _default_lock:
+        if _default_matcher is None:
+            _default_matcher = ProcessMatcher(processes)
+        return _default_matcher
+
+
+def shutdown_process_matcher() -> None:
+    """关闭进程共用的多进程匹配后端"""
+    global _default_matcher
+    with _default_lock:
+        matcher, _default_matcher = _default_matcher, None
+    if matcher is not None:
+        matcher.close()
+
+
+atexit.register(shutdown_process_matcher)
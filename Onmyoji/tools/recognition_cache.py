@@ -0,0 +1,102 @@
+"""
+识别结果缓存
+识别结果只对识别时的那一帧画面有效，按固定时间缓存可能在画面已经变化后返回过期的坐标。
+这里按 (模板, 帧标识) 缓存：帧标识是截图内容的哈希，画面静止、截图线程还没有新帧时连续截到的相同画面可以直接复用，
+画面内容变化时整个缓存作废，同时按条目数和存活时间淘汰，内存占用保持稳定。
+"""
+
+import threading
+import time
+import zlib
+import numpy as np
+
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+# 默认最多缓存的条目数
+DEFAULT_MAX_ENTRIES = 256
+
+# 默认的条目存活时间（秒）
+DEFAULT_TTL = 1.0
+
+
+def frame_content_key(image: np.ndarray) -> Tuple:
+    """用截图内容的CRC32和尺寸作为帧标识，每次截图的序号都不同，内容相同的画面标识相同"""
+    return image.shape, zlib.crc32(np.ascontiguousarray(image).data)
+
+
+class RecognitionCache:
+    """按 (模板, 帧标识) 缓存识别结果的TTL+LRU缓存，线程安全"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        """
+        :param max_entries: 最多缓存的条目数，超过时淘汰最久未使用的条目
+        :param ttl: 条目存活时间（秒），0表示不按时间淘汰
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.frame_key = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def new_frame(self, frame_key: Hashable) -> None:
+        """截图源给出了一帧截图，画面内容与缓存中的不同时清空缓存"""
+        with self._lock:
+            if frame_key != self.frame_key:
+                self.evictions += len(self._entries)
+                self._entries.clear()
+                self.frame_key = frame_key
+
+    def get(self, template: Hashable, frame_key: Hashable) -> Tuple[bool, Any]:
+        """
+        查询缓存
+
+        返回:
+            (是否命中, 缓存的识别结果)，识别结果可以是None（表示该帧中没有找到模板）
+        """
+        key = (template, frame_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self.ttl or time.monotonic() - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, template: Hashable, frame_key: Hashable, value: Any) -> None:
+        """保存一次识别结果，帧标识不是当前帧时忽略"""
+        with self._lock:
+            if frame_key != self.frame_key:
+                return
+            key = (template, frame_key)
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.frame_key = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self) -> str:
+        return (f"命中 {self.hits} 次，未命中 {self.misses} 次（命中率 {self.hit_ratio:.0%}），"
+                f"淘汰 {self.evictions} 条，当前 {len(self._entries)} 条")
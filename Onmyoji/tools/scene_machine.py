@@ -0,0 +1,189 @@
+"""
+场景状态机
+不区分当前画面时，每次识别都要匹配模式下的所有模板，而且同一个按钮点击没有生效、被再次识别到时会被重复计数。
+模式配置文件可以声明场景：每个场景由哪些模板识别、识别到后做什么、之后可能进入哪些场景。
+状态机记住当前所在的场景，每次只匹配下一步可能出现的场景的模板，
+当前场景的模板每隔一段时间复查一次（点击可能没有生效），只有从其他场景进入计数场景时才计一次挑战。
+
+配置格式（写在模式的config.yaml中）:
+    scenes:
+      lobby: {templates: [tiaozhan, kaishi], next: [battle], count: true}
+      battle: {next: [end]}
+      end: {templates: [jieshu], next: [reward]}
+      reward: {templates: [zuihou], next: [lobby]}
+    scene_retry_interval: 3     # 每隔该时间（秒）复查一次当前场景的模板
+    scene_lost_timeout: 30      # 超过该时间（秒）没有识别到任何候选模板时，临时改为匹配全部模板
+
+不属于任何场景的模板（如协战邀请这类任何时候都可能出现的弹窗）每次都匹配，识别到后不改变当前场景。
+
+场景的action为click（默认，点击识别到的模板）或none（只识别不点击，用于跟踪场景）；
+没有模板的场景（如战斗中）只起连接作用，其next中的场景会直接成为候选。
+"""
+
+import time
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# 默认超过这么多秒没有识别到候选模板时，改为匹配全部模板
+DEFAULT_LOST_TIMEOUT = 30.0
+
+# 默认每隔这么多秒复查一次当前场景的模板，与点击后的等待时间相当
+DEFAULT_RETRY_INTERVAL = 3.0
+
+SCENE_ACTIONS = ('click', 'none')
+
+
+class Scene(NamedTuple):
+    name: str
+    # 识别该场景的模板名，按优先级排列
+    templates: Tuple[str, ...]
+    # 之后可能进入的场景
+    next: Tuple[str, ...]
+    # 识别到后的操作: click 或 none
+    action: str = 'click'
+    # 进入该场景时是否计为一次挑战
+    count: bool = False
+
+
+class SceneMachine:
+    """根据当前场景决定本次需要匹配的模板"""
+
+    def __init__(self, scenes: Iterable[Scene], always: Iterable[str] = (),
+                 lost_timeout: float = DEFAULT_LOST_TIMEOUT, retry_interval: float = DEFAULT_RETRY_INTERVAL):
+        """
+        :param scenes: 场景列表
+        :param always: 任何场景中都要匹配的模板（不属于任何场景的弹窗等）
+        :param lost_timeout: 超过该时间（秒）没有识别到候选模板时匹配全部模板，0表示不回退
+        :param retry_interval: 复查当前场景模板的间隔（秒），0表示每次都匹配当前场景的模板
+        """
+        self.scenes: Dict[str, Scene] = {scene.name: scene for scene in scenes}
+        self.always = tuple(always)
+        self.lost_timeout = lost_timeout
+        self.retry_interval = retry_interval
+        # 模板名 -> 所属场景
+        self._owner = {name: scene for scene in self.scenes.values() for name in scene.templates}
+        # 当前场景，None表示还未识别到任何场景
+        self.current: Optional[Scene] = None
+        self._last_seen = time.monotonic()
+        self._last_retry = self._last_seen
+        # 统计
+        self.transitions = 0
+        self.lost_count = 0
+
+    def _reachable(self, names: Iterable[str]) -> List[Scene]:
+        """展开没有模板的场景，返回这些场景之后第一批有模板的场景"""
+        result = []
+        visited = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop(0)
+            if name in visited or name not in self.scenes:
+                continue
+            visited.add(name)
+            scene = self.scenes[name]
+            if scene.templates:
+                result.append(scene)
+            else:
+                pending.extend(scene.next)
+        return result
+
+    @property
+    def lost(self) -> bool:
+        """太久没有识别到候选模板，可能漏掉了场景切换"""
+        return bool(self.lost_timeout) and time.monotonic() - self._last_seen > self.lost_timeout
+
+    def candidates(self) -> Optional[List[str]]:
+        """
+        本次需要匹配的模板名，None表示匹配全部模板
+        候选为下一步可能进入的场景和always中的模板，每隔retry_interval秒加上一次当前场景的模板
+        """
+        if self.current is None or self.lost:
+            return None
+        scenes = self._reachable(self.current.next)
+        now = time.monotonic()
+        if now - self._last_retry >= self.retry_interval:
+            self._last_retry = now
+            scenes.insert(0, self.current)
+        names = list(self.always)
+        for scene in scenes:
+            names.extend(name for name in scene.templates if name not in names)
+        return names
+
+    def select(self, image_paths: Dict[str, str]) -> Dict[str, str]:
+        """从模式的全部模板中选出本次需要匹配的模板，保持配置文件中的优先级顺序"""
+        names = self.candidates()
+        if names is None:
+            return image_paths
+        return {name: path for name, path in image_paths.items() if name in names}
+
+    def observe_only(self) -> Tuple[str, ...]:
+        """只识别、不点击的模板"""
+        return tuple(name for name, scene in self._owner.items() if scene.action == 'none')
+
+    def advance(self, template: Optional[str]) -> bool:
+        """
+        根据本次识别到的模板更新当前场景
+        :param template: 识别到的模板名，没有识别到时为None
+        :return: 是否进入了一个计数场景（即完成了一次挑战的开始）
+        """
+        if template is None:
+            return False
+        self._last_seen = time.monotonic()
+        scene = self._owner.get(template)
+        if scene is None:
+            # 不属于任何场景的弹窗，不改变当前场景
+            return False
+        # 刚点击过当前场景的模板，推迟下一次复查
+        self._last_retry = self._last_seen
+        if scene is self.current:
+            return False
+        if self.current is not None and self.lost:
+            self.lost_count += 1
+        self.current = scene
+        self.transitions += 1
+        return scene.count
+
+    def reset(self) -> None:
+        self.current = None
+        self._last_seen = self._last_retry = time.monotonic()
+
+    def summary(self) -> str:
+        current = self.current.name if self.current is not None else '未知'
+        return f"当前场景 {current}，场景切换 {self.transitions} 次，丢失场景后重新定位 {self.lost_count} 次"
+
+
+def parse_scenes(config: dict, image_paths: Dict[str, str]) -> Optional[SceneMachine]:
+    """
+    解析配置文件中的scenes，没有配置或配置无效时返回None（每次匹配全部模板）
+    :param image_paths: {模板名: 图片完整路径}，用于检查场景引用的模板是否存在
+    """
+    value = config.get('scenes')
+    if not value:
+        return None
+    if not isinstance(value, dict):
+        print(f"警告：无效的场景配置 {value}，将匹配全部模板")
+        return None
+
+    scenes = []
+    for name, spec in value.items():
+        spec = spec or {}
+        templates = tuple(spec.get('templates') or ())
+        next_scenes = tuple(spec.get('next') or ())
+        action = spec.get('action', 'click')
+        unknown = [t for t in templates if t not in image_paths]
+        if unknown:
+            print(f"警告：场景 {name} 引用了不存在的模板 {unknown}，将匹配全部模板")
+            return None
+        missing = [n for n in next_scenes if n not in value]
+        if missing:
+            print(f"警告：场景 {name} 的next中有不存在的场景 {missing}，将匹配全部模板")
+            return None
+        if action not in SCENE_ACTIONS:
+            print(f"警告：场景 {name} 的action {action} 无效，可选 {SCENE_ACTIONS}，将匹配全部模板")
+            return None
+        scenes.append(Scene(name, templates, next_scenes, action, bool(spec.get('count', False))))
+
+    owned = {t for scene in scenes for t in scene.templates}
+    always = [t for t in image_paths if t not in owned]
+    return SceneMachine(scenes, always, float(config.get('scene_lost_timeout', DEFAULT_LOST_TIMEOUT)),
+                        float(config.get('scene_retry_interval', DEFAULT_RETRY_INTERVAL)))
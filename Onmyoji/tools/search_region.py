@@ -0,0 +1,290 @@
+"""
+模板搜索区域（ROI）
+按钮在1404x834的客户区里位置基本固定，只在对应区域内匹配可以大幅减少matchTemplate的计算量。
+区域既可以在配置文件中手动指定，也可以根据历史命中位置自动学习，学习结果保存在模式目录下。
+区域内连续多次未命中时（例如窗口布局变化），自动回退一次全图搜索。
+"""
+
+import os
+import threading
+import yaml
+
+from typing import Dict, Iterable, Optional, Tuple
+
+# 区域格式：(left, top, width, height)，相对于窗口客户区
+Region = Tuple[int, int, int, int]
+
+# 默认连续未命中多少次后回退全图搜索
+DEFAULT_FALLBACK_MISSES = 5
+
+# 学习到的区域向外扩展的像素数，容纳按钮动画和轻微的位置抖动
+DEFAULT_LEARN_PADDING = 20
+
+# 命中位置超出已学习的范围时，需要在同一位置附近累计命中这么多次才扩展区域，
+# 一次误识别不会永久扩大区域（学习结果会保存并被同一模式的所有窗口共用）
+DEFAULT_LEARN_CONFIRM_HITS = 3
+
+# 学习结果的文件名，保存在模式目录下
+LEARNED_REGIONS_FILE = 'learned_regions.yaml'
+
+# 多个窗口同时运行同一模式时会写同一个学习文件，读取合并和写文件时串行
+_save_lock = threading.Lock()
+
+# 搜索区域的外接矩形不超过客户区的这个比例时，才只截取外接矩形
+REGION_CAPTURE_MAX_RATIO = 0.6
+
+
+def parse_region(value) -> Optional[Region]:
+    """把配置文件中的 [left, top, width, height] 转换为区域元组，格式不对时返回None"""
+    if value is None:
+        return None
+    try:
+        left, top, width, height = (int(v) for v in value)
+    except (TypeError, ValueError):
+        print(f"警告：无效的搜索区域配置 {value}，将使用全图搜索")
+        return None
+    if width <= 0 or height <= 0:
+        print(f"警告：搜索区域尺寸无效 {value}，将使用全图搜索")
+        return None
+    return left, top, width, height
+
+
+def clip_region(region: Region, frame_width: int, frame_height: int) -> Optional[Region]:
+    """把区域裁剪到截图范围内，裁剪后为空时返回None"""
+    left, top, width, height = region
+    right = min(left + width, frame_width)
+    bottom = min(top + height, frame_height)
+    left, top = max(left, 0), max(top, 0)
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right - left, bottom - top
+
+
+def union_region(regions: Iterable[Region]) -> Optional[Region]:
+    """多个区域的外接矩形，没有区域时返回None"""
+    regions = list(regions)
+    if not regions:
+        return None
+    left = min(region[0] for region in regions)
+    top = min(region[1] for region in regions)
+    right = max(region[0] + region[2] for region in regions)
+    bottom = max(region[1] + region[3] for region in regions)
+    return left, top, right - left, bottom - top
+
+
+def capture_region_for(names: Iterable[str], regions: Dict[str, Region],
+                       frame_size: Optional[Tuple[int, int]],
+                       max_ratio: float = REGION_CAPTURE_MAX_RATIO) -> Optional[Region]:
+    """
+    计算只需截取的区域：本轮所有模板都在区域内搜索时，返回这些区域的外接矩形
+
+    :param names: 本轮要匹配的模板名
+    :param regions: regions_for返回的搜索区域
+    :param frame_size: 完整客户区尺寸，未知时返回None
+    :param max_ratio: 外接矩形占客户区的比例超过该值时截取整个客户区更划算
+    :return: 截取区域，需要截取整个客户区时返回None
+    """
+    if frame_size is None:
+        return None
+    names = list(names)
+    if not names or any(name not in regions for name in names):
+        return None
+    box = union_region(regions[name] for name in names)
+    box = clip_region(box, *frame_size)
+    if box is None or box[2] * box[3] > max_ratio * frame_size[0] * frame_size[1]:
+        return None
+    return box
+
+
+def _contains(bounds: Tuple[int, int, int, int], box: Tuple[int, int, int, int]) -> bool:
+    """范围 (left, top, right, bottom) 是否包含box"""
+    return bounds[0] <= box[0] and bounds[1] <= box[1] and box[2] <= bounds[2] and box[3] <= bounds[3]
+
+
+def _is_near(bounds: Tuple[int, int, int, int], box: Tuple[int, int, int, int], distance: int) -> bool:
+    """box与向外扩展distance像素后的范围是否相交"""
+    return (box[0] <= bounds[2] + distance and bounds[0] - distance <= box[2]
+            and box[1] <= bounds[3] + distance and bounds[1] - distance <= box[3])
+
+
+def _union_bounds(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def offset_regions(regions: Dict[str, Region], origin: Tuple[int, int]) -> Dict[str, Region]:
+    """把区域坐标换算到以origin为左上角的局部截图中"""
+    if origin == (0, 0):
+        return regions
+    origin_x, origin_y = origin
+    return {name: (left - origin_x, top - origin_y, width, height)
+            for name, (left, top, width, height) in regions.items()}
+
+
+class SearchRegions:
+    """记录每个模板的搜索区域以及区域内连续未命中的次数"""
+
+    def __init__(self, regions: Optional[Dict[str, Region]] = None,
+                 fallback_misses: int = DEFAULT_FALLBACK_MISSES,
+                 learned_path: Optional[str] = None, padding: int = DEFAULT_LEARN_PADDING,
+                 confirm_hits: int = DEFAULT_LEARN_CONFIRM_HITS):
+        """
+        :param regions: 配置文件中手动指定的区域，优先于学习到的区域
+        :param fallback_misses: 区域内连续未命中多少次后回退一次全图搜索
+        :param learned_path: 学习结果的保存路径，为None时不学习
+        :param padding: 学习到的区域向外扩展的像素数
+        :param confirm_hits: 超出已学习范围的命中在同一位置附近累计多少次后才扩展区域
+        """
+        self.regions = dict(regions or {})
+        self.fallback_misses = max(1, int(fallback_misses))
+        self.misses = {}
+        self.learned_path = learned_path
+        self.padding = padding
+        # 学习到的命中范围 {模板名: (left, top, right, bottom)}，不含padding
+        self.learned = {}
+        self.confirm_hits = max(1, int(confirm_hits))
+        # 还没有确认的命中范围 {模板名: ((left, top, right, bottom), 命中次数)}，不保存
+        self.candidates = {}
+        # 学习时的截图尺寸，尺寸变化说明客户端布局变了，旧的学习结果作废
+        self.frame_size = None
+        if learned_path:
+            self.load()
+
+    def region_of(self, name: str) -> Optional[Region]:
+        """获取模板当前的搜索区域，手动配置优先，其次是学习到的区域"""
+        region = self.regions.get(name)
+        if region is not None:
+            return region
+        bounds = self.learned.get(name)
+        if bounds is None:
+            return None
+        left, top, right, bottom = bounds
+        left, top = max(left - self.padding, 0), max(top - self.padding, 0)
+        return left, top, right + self.padding - left, bottom + self.padding - top
+
+    def regions_for(self, names: Iterable[str]) -> Dict[str, Region]:
+        """返回本轮需要使用区域搜索的模板，未配置区域或需要回退全图的模板不在结果中"""
+        active = {}
+        for name in names:
+            region = self.region_of(name)
+            if region is None:
+                continue
+            if self.misses.get(name, 0) >= self.fallback_misses:
+                continue
+            active[name] = region
+        return active
+
+    def record(self, name: str, used_region: bool, hit: bool) -> None:
+        """记录一次匹配结果，全图搜索后无论是否命中都重新计数"""
+        if name not in self.regions and name not in self.learned:
+            return
+        if hit or not used_region:
+            self.misses[name] = 0
+        else:
+            self.misses[name] = self.misses.get(name, 0) + 1
+
+    def learn(self, name: str, x: int, y: int, width: int, height: int,
+              frame_size: Tuple[int, int]) -> None:
+        """
+        根据命中位置扩展模板的学习区域，区域有变化时写回文件
+        超出已学习范围的命中先作为候选，同一位置附近累计命中confirm_hits次后才并入学习区域
+
+        :param x, y: 命中区域左上角，相对于窗口客户区
+        :param width, height: 模板尺寸
+        :param frame_size: 截图尺寸 (width, height)
+        """
+        if self.learned_path is None:
+            return
+        self.check_frame_size(frame_size)
+
+        box = (x, y, x + width, y + height)
+        bounds = self.learned.get(name)
+        if bounds is not None and _contains(bounds, box):
+            return
+        candidate = self.candidates.get(name)
+        if candidate is not None and _is_near(candidate[0], box, self.padding):
+            box, count = _union_bounds(candidate[0], box), candidate[1] + 1
+        else:
+            # 与候选位置相距较远时重新计数
+            count = 1
+        if count < self.confirm_hits:
+            self.candidates[name] = (box, count)
+            return
+        self.candidates.pop(name, None)
+        self.learned[name] = box if bounds is None else _union_bounds(bounds, box)
+        self.save()
+
+    def check_frame_size(self, frame_size: Tuple[int, int]) -> None:
+        """截图尺寸和学习时不同说明客户端布局变了，丢弃旧的学习结果"""
+        frame_size = tuple(frame_size)
+        if self.frame_size == frame_size:
+            return
+        if self.learned:
+            print(f"客户区尺寸由 {self.frame_size} 变为 {frame_size}，已清空学习到的搜索区域")
+            self.learned.clear()
+            self.misses.clear()
+        self.candidates.clear()
+        self.frame_size = frame_size
+
+    def _read_file(self) -> Tuple[Optional[Tuple[int, int]], Dict[str, Tuple[int, int, int, int]]]:
+        """读取学习文件，返回 (截图尺寸, {模板名: 命中范围})，文件不存在时返回 (None, {})"""
+        if not self.learned_path or not os.path.exists(self.learned_path):
+            return None, {}
+        with open(self.learned_path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+        frame_size = tuple(data['frame_size']) if data.get('frame_size') else None
+        learned = {name: tuple(int(v) for v in bounds) for name, bounds in (data.get('regions') or {}).items()}
+        return frame_size, learned
+
+    def load(self) -> None:
+        """从文件读取学习结果，文件不存在或格式不对时忽略"""
+        try:
+            self.frame_size, self.learned = self._read_file()
+        except Exception as e:
+            print(f"读取学习区域文件 {self.learned_path} 失败：{e}")
+            self.learned = {}
+            self.frame_size = None
+
+    def save(self) -> None:
+        """
+        把学习结果写入文件
+        同一模式的多个窗口各自学习、写同一个文件，写入前先与文件中的结果合并（取外接范围），
+        合并结果也同步回本窗口，避免后写入的窗口覆盖其他窗口学习到的区域；
+        文件中的截图尺寸与本窗口不同时以本窗口为准
+        """
+        if not self.learned_path:
+            return
+        try:
+            with _save_lock:
+                try:
+                    frame_size, learned = self._read_file()
+                except Exception as e:
+                    print(f"读取学习区域文件 {self.learned_path} 失败，将覆盖该文件：{e}")
+                    frame_size, learned = None, {}
+                if frame_size is not None and frame_size == self.frame_size:
+                    for name, bounds in learned.items():
+                        mine = self.learned.get(name)
+                        self.learned[name] = bounds if mine is None else _union_bounds(mine, bounds)
+                data = {
+                    'frame_size': list(self.frame_size) if self.frame_size else None,
+                    'regions': {name: list(bounds) for name, bounds in self.learned.items()},
+                }
+                with open(self.learned_path, 'w', encoding='utf-8') as f:
+                    yaml.safe_dump(data, f, allow_unicode=True)
+        except OSError as e:
+            print(f"保存学习区域文件 {self.learned_path} 失败：{e}")
+
+    def reset_learned(self) -> None:
+        """清空学习结果并删除文件，客户端布局变化后调用"""
+        self.learned.clear()
+        self.candidates.clear()
+        self.frame_size = None
+        self.misses.clear()
+        if self.learned_path and os.path.exists(self.learned_path):
+            try:
+                os.remove(self.learned_path)
+            except OSError as e:
+                print(f"删除学习区域文件 {self.learned_path} 失败：{e}")
+
+    def reset(self) -> None:
+        """清空未命中计数"""
+        self.misses.clear()
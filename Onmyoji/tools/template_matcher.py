@@ -0,0 +1,270 @@
+"""
+模板匹配核心
+把截图的预处理和模板匹配从截图逻辑中拆出来，一张截图只预处理一次，
+然后对多个模板依次匹配，返回每个模板的最佳分数和位置。
+可选的金字塔模式先在缩小的截图上粗定位，再只在峰值附近用原分辨率确认。
+"""
+
+import cv2
+import numpy as np
+
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from .preprocess import FramePreprocessor, preprocess_gray
+from .search_region import Region, clip_region
+from .template_store import TemplateEntry, downscale, get_template_store
+
+# 缩小后模板的最小边长，再小就没有足够的特征做粗定位，直接使用原分辨率匹配
+MIN_PYRAMID_TEMPLATE_SIZE = 12
+
+
+class MatchResult(NamedTuple):
+    """单个模板的匹配结果，(x, y)为匹配区域左上角在截图中的坐标，method为给出结果的算法"""
+    name: str
+    score: float
+    x: int
+    y: int
+    width: int
+    height: int
+    method: str = ''
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        return self.x + self.width // 2, self.y + self.height // 2
+
+
+def prepare_frame(frame: np.ndarray, grayscale: bool = True, enhance_contrast: bool = True,
+                  contrast_factor: float = 1.2, blur_level: int = 0,
+                  skip_preprocessing: bool = False,
+                  preprocessor: Optional[FramePreprocessor] = None) -> np.ndarray:
+    """
+    按与模板相同的参数预处理截图，返回用于匹配的图像
+    传入preprocessor时结果写入其复用的缓冲区，下一次调用前有效
+    """
+    if skip_preprocessing or not grayscale:
+        return frame
+    if preprocessor is not None:
+        return preprocessor(frame, enhance_contrast, contrast_factor, blur_level)
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return preprocess_gray(gray, enhance_contrast, contrast_factor, blur_level)
+
+
+# 可选的匹配算法，分数统一转换为越高越好
+METHODS = {
+    'ccoeff': cv2.TM_CCOEFF_NORMED,  # 相关系数归一化匹配
+    'ccorr': cv2.TM_CCORR_NORMED,    # 相关匹配
+    'sqdiff': cv2.TM_SQDIFF_NORMED,  # 平方差匹配
+}
+
+# 主算法分数低于阈值但差距在此范围内时，才使用备用算法复核
+DEFAULT_FALLBACK_MARGIN = 0.1
+
+# 备用算法累计胜出这么多次且多于主算法时，交换主备算法
+PROMOTE_AFTER_WINS = 10
+
+
+def run_method(image: np.ndarray, template: np.ndarray, method: str) -> Tuple[float, Tuple[int, int]]:
+    """执行一次matchTemplate，返回 (分数, 左上角坐标)"""
+    result = cv2.matchTemplate(image, template, METHODS[method])
+    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+    if method == 'sqdiff':
+        # 对于平方差匹配，最小值表示最佳匹配，转换为越高越好
+        return 1 - min_val, min_loc
+    return max_val, max_loc
+
+
+class MatchStrategy:
+    """
+    单个模板的匹配策略
+    常规情况下只跑一次主算法；配置了备用算法时，主算法分数接近阈值才用备用算法复核，
+    同时记录每种算法的胜出次数，备用算法明显更准时自动升为主算法。
+    不同算法的分数不在同一个尺度上（sqdiff在纹理丰富的非目标区域也能得到高分），
+    与主算法共用一个阈值容易误判，所以默认不使用备用算法，只在配置文件中为个别模板显式开启
+    """
+
+    def __init__(self, primary: str = 'ccoeff', fallback: Optional[str] = None,
+                 margin: float = DEFAULT_FALLBACK_MARGIN):
+        if primary not in METHODS:
+            raise ValueError(f"不支持的匹配算法: {primary}")
+        if fallback is not None and fallback not in METHODS:
+            raise ValueError(f"不支持的匹配算法: {fallback}")
+        self.primary = primary
+        self.fallback = fallback if fallback != primary else None
+        self.margin = margin
+        # {算法名: 命中时由该算法给出结果的次数}
+        self.wins = {}
+
+    def record(self, method: str) -> None:
+        """记录一次命中由哪种算法给出"""
+        self.wins[method] = self.wins.get(method, 0) + 1
+        if self.fallback is None or method != self.fallback:
+            return
+        fallback_wins = self.wins[method]
+        if fallback_wins >= PROMOTE_AFTER_WINS and fallback_wins > self.wins.get(self.primary, 0):
+            print(f"匹配算法 {self.fallback} 胜出次数更多，已替换 {self.primary} 作为主算法")
+            self.primary, self.fallback = self.fallback, self.primary
+
+    def __repr__(self) -> str:
+        return f"MatchStrategy(primary={self.primary!r}, fallback={self.fallback!r}, wins={self.wins})"
+
+
+def match_prepared(prepared: np.ndarray, template: np.ndarray, strategy: Optional[MatchStrategy] = None,
+                   threshold: float = 0.8) -> Tuple[float, Tuple[int, int], str]:
+    """
+    在预处理后的截图上匹配单个模板
+
+    参数:
+        strategy: 匹配策略，为None时使用默认策略
+        threshold: 匹配阈值，用于判断是否需要备用算法复核
+
+    返回:
+        (最佳分数, 左上角坐标, 给出结果的算法名)
+    """
+    if prepared.shape[0] < template.shape[0] or prepared.shape[1] < template.shape[1]:
+        return -1.0, (0, 0), ''
+    if strategy is None:
+        strategy = MatchStrategy()
+
+    method = strategy.primary
+    score, loc = run_method(prepared, template, method)
+    if strategy.fallback and threshold - strategy.margin <= score < threshold:
+        fallback_score, fallback_loc = run_method(prepared, template, strategy.fallback)
+        if fallback_score > score:
+            score, loc, method = fallback_score, fallback_loc, strategy.fallback
+    return score, loc, method
+
+
+def match_in_region(prepared: np.ndarray, template: np.ndarray, region: Optional[Region],
+                    strategy: Optional[MatchStrategy] = None,
+                    threshold: float = 0.8) -> Tuple[float, Tuple[int, int], str]:
+    """
+    只在指定区域内匹配模板，返回的坐标已换算回整张截图
+
+    区域为None、超出截图或小于模板时退化为全图匹配
+    """
+    if region is not None:
+        region = clip_region(region, prepared.shape[1], prepared.shape[0])
+    if region is None:
+        return match_prepared(prepared, template, strategy, threshold)
+
+    left, top, width, height = region
+    if width < template.shape[1] or height < template.shape[0]:
+        return match_prepared(prepared, template, strategy, threshold)
+
+    # 切片只是视图，不会复制截图数据
+    score, (x, y), method = match_prepared(prepared[top:top + height, left:left + width], template,
+                                           strategy, threshold)
+    return score, (x + left, y + top), method
+
+
+def match_coarse_to_fine(prepared: np.ndarray, small_frame: np.ndarray, entry: TemplateEntry,
+                         level: int, region: Optional[Region] = None,
+                         strategy: Optional[MatchStrategy] = None,
+                         threshold: float = 0.8) -> Tuple[float, Tuple[int, int], str]:
+    """
+    金字塔匹配：先在缩小的截图上找到峰值，再在原分辨率的峰值附近确认
+
+    参数:
+        prepared: 原分辨率的预处理截图
+        small_frame: 按level缩小后的预处理截图
+        entry: 模板缓存项
+        level: 金字塔层级，1为1/2，2为1/4
+        region: 可选的搜索区域，原分辨率坐标
+        strategy, threshold: 原分辨率确认时使用的匹配策略和阈值
+
+    返回:
+        (原分辨率下的最佳分数, 左上角坐标, 给出结果的算法名)
+    """
+    template = entry.processed
+    small_template = entry.pyramid(level)
+    if min(small_template.shape[:2]) < MIN_PYRAMID_TEMPLATE_SIZE:
+        return match_in_region(prepared, template, region, strategy, threshold)
+
+    factor = 2 ** level
+    offset_x, offset_y = 0, 0
+    coarse = small_frame
+    if region is not None:
+        region = clip_region(region, prepared.shape[1], prepared.shape[0])
+        if region is not None:
+            left, top, width, height = region
+            offset_x, offset_y = left // factor, top // factor
+            coarse = small_frame[offset_y:(top + height) // factor, offset_x:(left + width) // factor]
+    if coarse.shape[0] < small_template.shape[0] or coarse.shape[1] < small_template.shape[1]:
+        return match_in_region(prepared, template, region, strategy, threshold)
+
+    # 粗定位只用一种算法，分数不作为最终结果
+    result = cv2.matchTemplate(coarse, small_template, cv2.TM_CCOEFF_NORMED)
+    _, _, _, (coarse_x, coarse_y) = cv2.minMaxLoc(result)
+
+    # 峰值换算回原分辨率，四周各留出两个缩放单位的余量用于精确定位
+    margin = factor * 2
+    fine_region = ((coarse_x + offset_x) * factor - margin, (coarse_y + offset_y) * factor - margin,
+                   template.shape[1] + margin * 2, template.shape[0] + margin * 2)
+    return match_in_region(prepared, template, fine_region, strategy, threshold)
+
+
+def match_many(frame: np.ndarray, templates: Dict[str, str], grayscale: bool = True,
+               enhance_contrast: bool = True, contrast_factor: float = 1.2, blur_level: int = 0,
+               skip_preprocessing: bool = False, regions: Optional[Dict[str, Region]] = None,
+               pyramid_level: int = 0, strategies: Optional[Dict[str, MatchStrategy]] = None,
+               threshold: float = 0.8,
+               preprocessor: Optional[FramePreprocessor] = None,
+               first_hit: bool = False) -> Dict[str, MatchResult]:
+    """
+    一张截图匹配多个模板
+
+    参数:
+        frame: BGR截图，灰度匹配时也可以是截图层直接输出的灰度图
+        templates: {模板名: 模板图片路径}，字典顺序即优先级
+        regions: {模板名: (left, top, width, height)}，有区域的模板只在区域内匹配
+        pyramid_level: 金字塔层级，0为关闭，1为先在1/2截图上粗定位，2为1/4
+        strategies: {模板名: MatchStrategy}，缺少的模板会自动补上默认策略，命中时记录胜出的算法
+        threshold: 匹配阈值，用于决定是否用备用算法复核以及记录胜出算法
+        preprocessor: 可选的截图预处理器，复用输出缓冲区
+        first_hit: 为True时按顺序匹配，第一个达到阈值的模板之后的模板不再匹配
+        其余参数同 WindowCapture.find_image_precise
+
+    返回:
+        {模板名: MatchResult}，无法读取的模板和first_hit时未匹配的模板不会出现在结果中
+    """
+    use_gray = grayscale and not skip_preprocessing
+    if frame.ndim == 2 and not use_gray:
+        raise ValueError("灰度截图只能用于灰度匹配")
+    prepared = prepare_frame(frame, grayscale, enhance_contrast, contrast_factor,
+                             blur_level, skip_preprocessing, preprocessor)
+    store = get_template_store()
+    regions = regions or {}
+    strategies = strategies if strategies is not None else {}
+    # 缩小的截图每帧只生成一次，所有模板共用
+    small_frame = downscale(prepared, pyramid_level) if pyramid_level > 0 else None
+
+    results = {}
+    for name, path in templates.items():
+        entry: Optional[TemplateEntry] = store.get(path, grayscale=use_gray,
+                                                   enhance_contrast=enhance_contrast,
+                                                   contrast_factor=contrast_factor,
+                                                   blur_level=blur_level)
+        if entry is None:
+            print(f"无法读取模板图像: {path}")
+            continue
+        strategy = strategies.setdefault(name, MatchStrategy())
+        if small_frame is not None:
+            score, (x, y), method = match_coarse_to_fine(prepared, small_frame, entry, pyramid_level,
+                                                         regions.get(name), strategy, threshold)
+        else:
+            score, (x, y), method = match_in_region(prepared, entry.processed, regions.get(name),
+                                                    strategy, threshold)
+        results[name] = MatchResult(name, score, x, y, entry.width, entry.height, method)
+        if score >= threshold:
+            strategy.record(method)
+            if first_hit:
+                break
+    return results
+
+
+def best_hit(results: Dict[str, MatchResult], threshold: float) -> Optional[MatchResult]:
+    """按结果字典的顺序（即模板优先级）返回第一个达到阈值的匹配"""
+    for result in results.values():
+        if result.score >= threshold:
+            return result
+    return None
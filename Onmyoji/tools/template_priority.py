@@ -0,0 +1,117 @@
+"""
+模板优先级学习
+挑战循环按配置文件中的顺序匹配模板，爆仓、协战邀请这类很少出现的模板和每轮都会出现的模板一样每次都要匹配。
+TemplatePriority按模式记录每个模板被匹配和命中的次数：
+命中率高的模板排在前面，配合match_many的first_hit在第一个命中后停止匹配；
+命中率很低的模板每隔几轮才匹配一次。统计结果保存在模式目录下，下次启动时继续使用。
+"""
+
+import os
+import threading
+import yaml
+
+from typing import Dict, Optional
+
+# 统计结果的文件名，保存在模式目录下
+TEMPLATE_STATS_FILE = 'template_stats.yaml'
+
+# 默认每隔这么多轮匹配一次冷门模板，0或1表示每轮都匹配
+DEFAULT_RARE_INTERVAL = 5
+
+# 命中率低于该值的模板视为冷门模板
+RARE_HIT_RATE = 0.02
+
+# 至少匹配过这么多次才判断是否为冷门模板
+MIN_CHECKS = 50
+
+# 匹配次数超过该值时统计减半，让优先级跟随最近的情况变化
+MAX_CHECKS = 1000
+
+# 每记录这么多次写一次文件
+SAVE_EVERY = 200
+
+
+class TemplatePriority:
+    """按命中率排列模板的匹配顺序，线程安全，多窗口运行同一模式时共用一份"""
+
+    def __init__(self, stats_path: Optional[str] = None, rare_interval: int = DEFAULT_RARE_INTERVAL):
+        """
+        :param stats_path: 统计结果的保存路径，为None时不保存
+        :param rare_interval: 每隔多少轮匹配一次冷门模板
+        """
+        self.stats_path = stats_path
+        self.rare_interval = max(1, int(rare_interval))
+        # {模板名: [匹配次数, 命中次数]}
+        self.stats: Dict[str, list] = {}
+        self._rounds = 0
+        self._unsaved = 0
+        self._lock = threading.RLock()
+        if stats_path:
+            self.load()
+
+    def hit_rate(self, name: str) -> float:
+        """平滑后的命中率，没有统计的模板视为0.5，排在冷门模板之前"""
+        checks, hits = self.stats.get(name, (0, 0))
+        return (hits + 1) / (checks + 2)
+
+    def is_rare(self, name: str) -> bool:
+        checks, hits = self.stats.get(name, (0, 0))
+        return checks >= MIN_CHECKS and hits / checks < RARE_HIT_RATE
+
+    def order(self, templates: Dict[str, str]) -> Dict[str, str]:
+        """
+        返回本轮的匹配顺序，命中率相同时保持原来的顺序
+        冷门模板只在每rare_interval轮中的一轮参与匹配，全部都是冷门模板时不跳过
+        """
+        with self._lock:
+            self._rounds += 1
+            names = list(templates)
+            if self.rare_interval > 1 and self._rounds % self.rare_interval:
+                common = [name for name in names if not self.is_rare(name)]
+                if common:
+                    names = common
+            names.sort(key=self.hit_rate, reverse=True)
+        return {name: templates[name] for name in names}
+
+    def record(self, name: str, hit: bool) -> None:
+        """记录一次匹配结果"""
+        with self._lock:
+            stat = self.stats.setdefault(name, [0, 0])
+            stat[0] += 1
+            if hit:
+                stat[1] += 1
+            if stat[0] > MAX_CHECKS:
+                stat[0] //= 2
+                stat[1] //= 2
+            self._unsaved += 1
+            if self._unsaved >= SAVE_EVERY:
+                self.save()
+
+    def load(self) -> None:
+        """从文件读取统计结果，文件不存在或格式不对时忽略"""
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f) or {}
+            self.stats = {name: [int(checks), int(hits)] for name, (checks, hits) in data.items()}
+        except Exception as e:
+            print(f"读取模板统计文件 {self.stats_path} 失败：{e}")
+            self.stats = {}
+
+    def save(self) -> None:
+        """把统计结果写入文件"""
+        with self._lock:
+            self._unsaved = 0
+            if not self.stats_path:
+                return
+            try:
+                with open(self.stats_path, 'w', encoding='utf-8') as f:
+                    yaml.safe_dump(self.stats, f, allow_unicode=True)
+            except OSError as e:
+                print(f"保存模板统计文件 {self.stats_path} 失败：{e}")
+
+    def summary(self) -> str:
+        ranked = sorted(self.stats, key=self.hit_rate, reverse=True)
+        return '，'.join(f"{name} {self.hit_rate(name):.0%}" + ('（冷门）' if self.is_rare(name) else '')
+                        for name in ranked)
@@ -0,0 +1,158 @@
+"""
+模板图片缓存
+source目录下的模板图片在运行期间不会变化，没必要每次识别都重新读取和预处理。
+这里按 (路径, 文件修改时间, 预处理参数) 缓存解码后的BGR图、灰度图和预处理后的图，
+整个进程共用一份，超过内存上限时按LRU淘汰最久未使用的模板。
+"""
+
+import os
+import threading
+import cv2
+import numpy as np
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .preprocess import preprocess_gray
+
+# 默认内存上限：64MB，足够容纳所有模式的模板
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def downscale(image: np.ndarray, level: int) -> np.ndarray:
+    """按金字塔层级缩小图像，每一层边长减半，截图和模板必须使用同一个函数缩放"""
+    if level <= 0:
+        return image
+    factor = 2 ** level
+    size = (max(1, image.shape[1] // factor), max(1, image.shape[0] // factor))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+class TemplateEntry:
+    """单个模板在某组预处理参数下的全部数据"""
+
+    def __init__(self, path: str, bgr: np.ndarray, gray: np.ndarray, processed: np.ndarray):
+        self.path = path
+        self.bgr = bgr
+        self.gray = gray
+        self.processed = processed
+        # 金字塔各层缩小后的模板 {层级: 图像}，首次使用时生成
+        self._pyramid = {}
+
+    def pyramid(self, level: int) -> np.ndarray:
+        """获取缩小后的预处理模板，每个层级只生成一次"""
+        image = self._pyramid.get(level)
+        if image is None:
+            image = downscale(self.processed, level)
+            self._pyramid[level] = image
+        return image
+
+    @property
+    def width(self) -> int:
+        return self.bgr.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.bgr.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.bgr.nbytes + self.gray.nbytes + self.processed.nbytes
+
+
+class TemplateStore:
+    """进程级模板缓存，线程安全"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_params(grayscale: bool = True, enhance_contrast: bool = True,
+                    contrast_factor: float = 1.2, blur_level: int = 0) -> Tuple:
+        """把预处理参数整理成可哈希的缓存键，不做灰度处理时其余参数没有意义"""
+        if not grayscale:
+            return (False,)
+        return (True, bool(enhance_contrast), float(contrast_factor), int(blur_level))
+
+    def get(self, path: str, grayscale: bool = True, enhance_contrast: bool = True,
+            contrast_factor: float = 1.2, blur_level: int = 0) -> Optional[TemplateEntry]:
+        """
+        获取模板，缓存未命中时读取并预处理
+
+        返回:
+            TemplateEntry，图片无法读取时返回None
+        """
+        path = os.path.abspath(path)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        params = self.make_params(grayscale, enhance_contrast, contrast_factor, blur_level)
+        key = (path, mtime, params)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            decoded = self._find_decoded(path, mtime)
+
+        # 解码和预处理放在锁外进行，避免阻塞其他线程
+        if decoded is not None:
+            bgr, gray = decoded
+        else:
+            bgr = cv2.imread(path)
+            if bgr is None:
+                return None
+            gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+
+        if grayscale:
+            processed = preprocess_gray(gray, enhance_contrast, contrast_factor, blur_level)
+        else:
+            processed = bgr
+        entry = TemplateEntry(path, bgr, gray, processed)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self.current_bytes += entry.nbytes
+                self._evict()
+            return self._entries.get(key, entry)
+
+    def _find_decoded(self, path: str, mtime: float) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """同一张图换了预处理参数时复用已解码的数据（调用方需持有锁）"""
+        for (entry_path, entry_mtime, _), entry in self._entries.items():
+            if entry_path == path and entry_mtime == mtime:
+                return entry.bgr, entry.gray
+        return None
+
+    def _evict(self) -> None:
+        """超过内存上限时淘汰最久未使用的模板（调用方需持有锁），至少保留最新的一项"""
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self.current_bytes -= entry.nbytes
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_default_store = TemplateStore()
+
+
+def get_template_store() -> TemplateStore:
+    """获取进程共用的模板缓存"""
+    return _default_store
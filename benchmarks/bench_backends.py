@@ -0,0 +1,123 @@
+"""
+匹配后端对比测试
+模拟多开：每个窗口一个线程，各自从回放截图源读取录制好的截图并匹配模式下的所有模板，分别使用
+1. 线程模式：在窗口线程中调用template_matcher.match_many（默认方式）
+2. 进程模式：交给ProcessMatcher，截图经共享内存发送到工作进程
+统计不同窗口数下的总吞吐量（帧/秒）和单帧耗时。不指定--replay时先把合成截图录制到临时目录再回放。
+多进程模式需要多个CPU核心才能体现优势，单核机器上进程模式会因为额外的拷贝和进程切换而更慢。
+
+用法（在项目根目录运行）:
+    python benchmarks/bench_backends.py [--mode huntu] [--replay 截图目录或zip] [--frames 30]
+                                        [--windows 1 4 8] [--processes N]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_matching import load_mode, make_scenes
+from Onmyoji.tools.frame_source import FrameRecorder, ReplayFrameSource, SyntheticFrameSource
+from Onmyoji.tools.preprocess import FramePreprocessor
+from Onmyoji.tools.process_matcher import DEFAULT_MATCH_PROCESSES, ProcessMatcher
+from Onmyoji.tools.template_matcher import match_many
+
+THRESHOLD = 0.85
+
+
+def record_frames(image_paths, config, directory, loops=3):
+    """把合成截图按场景顺序录制到目录，每轮场景录制一遍"""
+    source = SyntheticFrameSource(image_paths, make_scenes(image_paths, config), noise=2, idle_frames=1)
+    with FrameRecorder(directory) as recorder:
+        for _ in range(loops):
+            for scene in source.scenes:
+                recorder.write(source.grab())
+                for name, (x, y) in scene.items():
+                    source.click(x + 1, y + 1)
+    return recorder.count
+
+
+def run_windows(replay, image_paths, windows, frames, matcher):
+    """
+    windows个线程同时运行，每个线程匹配frames帧
+    :param matcher: match_many或ProcessMatcher.match_many
+    :return: (总耗时, 每帧耗时列表, 命中次数)
+    """
+    timings = []
+    hits = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(windows + 1)
+
+    def window():
+        preprocessor = FramePreprocessor()
+        local = []
+        local_hits = 0
+        with ReplayFrameSource(replay, loop=True) as source:
+            barrier.wait()
+            for _ in range(frames):
+                frame = source.grab()
+                start = time.perf_counter()
+                results = matcher(frame.image, image_paths, threshold=THRESHOLD, preprocessor=preprocessor)
+                local.append(time.perf_counter() - start)
+                local_hits += sum(1 for result in results.values() if result.score >= THRESHOLD)
+        with lock:
+            timings.extend(local)
+            hits[0] += local_hits
+
+    threads = [threading.Thread(target=window, name=f'Window{index + 1}') for index in range(windows)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, timings, hits[0]
+
+
+def report(label, windows, elapsed, timings, hits):
+    timings.sort()
+    print(f"  {label} {windows} 个窗口: {len(timings) / elapsed:.1f} 帧/秒，"
+          f"单帧平均 {sum(timings) / len(timings) * 1000:.1f} ms，"
+          f"中位数 {timings[len(timings) // 2] * 1000:.1f} ms，最慢 {timings[-1] * 1000:.1f} ms，命中 {hits} 次")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', default='huntu', help='source目录下的模式文件夹')
+    parser.add_argument('--replay', help='回放截图目录或zip压缩包，不指定时录制合成截图')
+    parser.add_argument('--frames', type=int, default=30, help='每个窗口匹配的帧数')
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 4, 8], help='模拟的窗口数')
+    parser.add_argument('--processes', type=int, default=DEFAULT_MATCH_PROCESSES, help='进程模式的工作进程数')
+    args = parser.parse_args()
+
+    script_dir, config, image_paths = load_mode(args.mode)
+    temp_dir = None
+    replay = args.replay
+    if not replay:
+        temp_dir = tempfile.mkdtemp()
+        replay = temp_dir
+        print(f"已录制 {record_frames(image_paths, config, temp_dir)} 帧合成截图")
+
+    matcher = ProcessMatcher(args.processes)
+    try:
+        # 预热：加载模板缓存并让每个工作进程都完成一次匹配
+        run_windows(replay, image_paths, 1, 2, match_many)
+        run_windows(replay, image_paths, args.processes, 2, matcher.match_many)
+        print(f"{len(image_paths)} 个模板，每个窗口 {args.frames} 帧，进程模式 {matcher.processes} 个工作进程，"
+              f"CPU核心数 {os.cpu_count()}")
+        for windows in args.windows:
+            report('线程模式', windows, *run_windows(replay, image_paths, windows, args.frames, match_many))
+            report('进程模式', windows, *run_windows(replay, image_paths, windows, args.frames, matcher.match_many))
+    finally:
+        matcher.close()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
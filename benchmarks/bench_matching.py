@@ -0,0 +1,147 @@
+"""
+识别吞吐量测试
+不需要游戏窗口：截图来自回放目录/压缩包（ReplayFrameSource）或用模板合成（SyntheticFrameSource），
+可以在无桌面的Linux机器上运行。分别统计：
+1. 单帧匹配耗时：对每一帧调用match_many匹配模式下的所有模板
+2. 挑战流程吞吐量：用合成截图源完整跑common_challenge，点击后不等待
+3. 多窗口吞吐量（--windows）：多个合成截图源共用一个识别线程池同时运行
+
+用法（在项目根目录运行）:
+    python benchmarks/bench_matching.py [--mode huntu] [--replay 截图目录或zip] [--frames 50] [--times 5]
+                                        [--pyramid 0] [--record 保存合成截图的目录] [--windows 0] [--workers 2]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Onmyoji.source.common_challenge import common_challenge, load_image_specs
+from Onmyoji.source.fleet import run_fleet
+from Onmyoji.tools.frame_source import FrameRecorder, ReplayFrameSource, SyntheticFrameSource
+from Onmyoji.tools.preprocess import FramePreprocessor
+from Onmyoji.tools.template_matcher import match_many
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Onmyoji', 'source')
+
+
+def load_mode(mode):
+    script_dir = os.path.join(SOURCE_DIR, mode)
+    with open(os.path.join(script_dir, 'config.yaml'), 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    image_paths, _, _ = load_image_specs(config, script_dir)
+    return script_dir, config, image_paths
+
+
+def make_scenes(image_paths, config):
+    """
+    每个模板单独一个场景，场景之间插入一个空场景模拟战斗动画
+    配置了场景状态机时按场景顺序排列，每个场景只取第一个模板，之后是不属于任何场景的模板
+    """
+    names = list(image_paths)
+    if config.get('scenes'):
+        specs = [spec or {} for spec in config['scenes'].values()]
+        owned = [t for spec in specs for t in spec.get('templates') or ()]
+        names = [spec['templates'][0] for spec in specs if spec.get('templates')]
+        names += [name for name in image_paths if name not in owned]
+    scenes = []
+    for index, name in enumerate(names):
+        scenes.append({name: (50 + index % 4 * 300, 50 + index // 4 % 3 * 250)})
+        scenes.append({})
+    return scenes
+
+
+def bench_frames(source, image_paths, frames, pyramid_level):
+    preprocessor = FramePreprocessor()
+    timings = []
+    hits = 0
+    for _ in range(frames):
+        frame = source.grab()
+        if frame is None:
+            break
+        start = time.perf_counter()
+        results = match_many(frame.image, image_paths, grayscale=False, enhance_contrast=False,
+                             contrast_factor=1.0, blur_level=0, skip_preprocessing=True,
+                             pyramid_level=pyramid_level, threshold=0.85, preprocessor=preprocessor)
+        timings.append(time.perf_counter() - start)
+        hits += sum(1 for result in results.values() if result.score >= 0.85)
+    if not timings:
+        print("截图源中没有截图")
+        return
+    timings.sort()
+    print(f"单帧匹配: {len(timings)} 帧，{len(image_paths)} 个模板，命中 {hits} 次")
+    print(f"  平均 {sum(timings) / len(timings) * 1000:.1f} ms，"
+          f"中位数 {timings[len(timings) // 2] * 1000:.1f} ms，最慢 {timings[-1] * 1000:.1f} ms")
+
+
+def bench_challenge(script_dir, config, image_paths, times, pyramid_level):
+    # 在临时目录中运行，避免学习到的搜索区域写进源码目录
+    work_dir = tempfile.mkdtemp()
+    try:
+        for name in os.listdir(script_dir):
+            shutil.copy(os.path.join(script_dir, name), work_dir)
+        config = dict(config, pyramid_level=pyramid_level)
+        source = SyntheticFrameSource(image_paths, make_scenes(image_paths, config))
+        start = time.perf_counter()
+        common_challenge(times, config, work_dir, None, frame_source=source)
+        elapsed = time.perf_counter() - start
+        print(f"挑战流程: {times} 次挑战，{source.sequence} 帧，{len(source.clicks)} 次点击，"
+              f"耗时 {elapsed:.2f} s（{source.sequence / elapsed:.1f} 帧/秒）")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_fleet(script_dir, config, image_paths, times, windows, workers):
+    work_dir = tempfile.mkdtemp()
+    try:
+        for name in os.listdir(script_dir):
+            shutil.copy(os.path.join(script_dir, name), work_dir)
+        sources = [SyntheticFrameSource(image_paths, make_scenes(image_paths, config)) for _ in range(windows)]
+        # 每个窗口的统计由run_fleet输出
+        run_fleet(times, config, work_dir, sources, workers=workers)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', default='huntu', help='source目录下的模式文件夹')
+    parser.add_argument('--replay', help='回放截图目录或zip压缩包，不指定时使用合成截图')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--times', type=int, default=5, help='挑战流程测试的挑战次数，0为跳过')
+    parser.add_argument('--pyramid', type=int, default=0)
+    parser.add_argument('--record', help='把合成截图保存到该目录，可用于之后的--replay')
+    parser.add_argument('--windows', type=int, default=0, help='多窗口测试的窗口数，0为跳过')
+    parser.add_argument('--workers', type=int, default=2, help='多窗口测试的识别线程数')
+    args = parser.parse_args()
+
+    script_dir, config, image_paths = load_mode(args.mode)
+    if args.replay:
+        source = ReplayFrameSource(args.replay, loop=True)
+    else:
+        source = SyntheticFrameSource(image_paths, make_scenes(image_paths, config), noise=2, idle_frames=1)
+        if args.record:
+            with FrameRecorder(args.record) as recorder:
+                for scene in source.scenes:
+                    recorder.write(source.grab())
+                    # 点击场景中的模板切换到下一个场景，空场景在grab时已经自动切换
+                    for name, (x, y) in scene.items():
+                        source.click(x + 1, y + 1)
+            print(f"已保存 {recorder.count} 帧合成截图到 {args.record}")
+
+    with source:
+        bench_frames(source, image_paths, args.frames, args.pyramid)
+    if args.times > 0:
+        bench_challenge(script_dir, config, image_paths, args.times, args.pyramid)
+    if args.windows > 0:
+        bench_fleet(script_dir, config, image_paths, max(args.times, 1), args.windows, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+截图预处理性能对比
+旧实现：灰度化后转为PIL Image，用ImageEnhance.Contrast增强对比度再转回numpy，每帧分配多份整图内存
+新实现：查找表增强对比度，结果写入FramePreprocessor复用的缓冲区
+
+用法（在项目根目录运行）:
+    python benchmarks/bench_preprocess.py [--frame 截图.png] [--iterations 200] [--contrast 1.2] [--blur 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from PIL import Image, ImageEnhance
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Onmyoji.tools.preprocess import FramePreprocessor
+
+
+def legacy_preprocess(frame, contrast_factor, blur_level):
+    """改动前find_image_precise中截图一侧的预处理流程"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if contrast_factor > 1.0:
+        enhancer = ImageEnhance.Contrast(Image.fromarray(gray))
+        gray = np.array(enhancer.enhance(contrast_factor))
+    if blur_level > 0:
+        ksize = (blur_level * 2 + 1, blur_level * 2 + 1)
+        gray = cv2.GaussianBlur(gray, ksize, 0)
+    return gray
+
+
+def load_frame(path):
+    if path:
+        frame = cv2.imread(path)
+        if frame is None:
+            raise SystemExit(f"无法读取截图: {path}")
+        return frame
+    # 没有提供截图时生成一张与标准客户区同尺寸的随机图像
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (834, 1404, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(frame, (9, 9), 0)
+
+
+def measure(func, iterations):
+    func()  # 预热
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="截图预处理性能对比")
+    parser.add_argument('--frame', help="用于测试的截图，默认使用1404x834的随机图像")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--contrast', type=float, default=1.2)
+    parser.add_argument('--blur', type=int, default=1)
+    args = parser.parse_args()
+
+    frame = load_frame(args.frame)
+    preprocessor = FramePreprocessor()
+
+    legacy = legacy_preprocess(frame, args.contrast, args.blur)
+    current = preprocessor(frame, True, args.contrast, args.blur)
+    max_diff = int(np.abs(legacy.astype(np.int16) - current.astype(np.int16)).max())
+
+    legacy_ms = measure(lambda: legacy_preprocess(frame, args.contrast, args.blur), args.iterations)
+    current_ms = measure(lambda: preprocessor(frame, True, args.contrast, args.blur), args.iterations)
+
+    print(f"截图尺寸: {frame.shape[1]}x{frame.shape[0]}，对比度: {args.contrast}，模糊: {args.blur}")
+    print(f"旧实现(PIL): {legacy_ms:.3f} ms/帧")
+    print(f"新实现(LUT+复用缓冲区): {current_ms:.3f} ms/帧")
+    print(f"加速比: {legacy_ms / current_ms:.2f}x，最大像素差: {max_diff}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,10 @@
 # 打包： py2exe-gui
 
 import sys
+import multiprocessing
 from Onmyoji.core.app_launcher import launch_app
 
 if __name__ == "__main__":
+    # 打包后多进程匹配的工作进程需要
+    multiprocessing.freeze_support()
     sys.exit(launch_app())
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+WindowFrameSource区域截图的测试，使用替身win32gui模拟最小化窗口，不需要Windows
+运行: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+import numpy as np
+
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Onmyoji.tools import get_DC
+from Onmyoji.tools.frame_source import WindowFrameSource
+
+CLIENT_WIDTH, CLIENT_HEIGHT = 64, 48
+
+
+def make_client_image():
+    """每个像素的值由坐标决定，便于检查截取的位置"""
+    ys, xs = np.mgrid[0:CLIENT_HEIGHT, 0:CLIENT_WIDTH]
+    image = np.zeros((CLIENT_HEIGHT, CLIENT_WIDTH, 3), dtype=np.uint8)
+    image[..., 0] = xs
+    image[..., 1] = ys
+    return image
+
+
+class FakeWin32Gui:
+    """替身win32gui，只实现截图路径用到的函数"""
+
+    def __init__(self, minimized=False, client_rect=(0, 0, CLIENT_WIDTH, CLIENT_HEIGHT)):
+        self.minimized = minimized
+        self.client_rect = client_rect
+
+    def IsIconic(self, hwnd):
+        return self.minimized
+
+    def GetClientRect(self, hwnd):
+        return self.client_rect
+
+
+def make_capture():
+    """不经过__init__创建WindowCapture，避免调用真实的窗口API"""
+    capture = get_DC.WindowCapture.__new__(get_DC.WindowCapture)
+    capture.hwnd = 1
+    capture.client_width, capture.client_height = CLIENT_WIDTH, CLIENT_HEIGHT
+    capture._minimized_manually_restored = False
+    return capture
+
+
+class WindowFrameSourceRegionTest(unittest.TestCase):
+    region = (10, 8, 20, 12)
+
+    def check_region_frame(self, frame):
+        left, top, width, height = self.region
+        self.assertEqual(frame.origin, (left, top))
+        self.assertEqual(frame.image.shape[:2], (height, width))
+        # 左上角像素的值就是它在客户区中的坐标
+        self.assertEqual(tuple(frame.image[0, 0, :2]), (left, top))
+
+    def test_minimized_window_full_frame_is_cropped_to_region(self):
+        capture = make_capture()
+        capture.capture_minimized_window = mock.Mock(return_value=make_client_image())
+        with mock.patch.object(get_DC, 'win32gui', FakeWin32Gui(minimized=True)):
+            frame = WindowFrameSource(1, capture=capture).grab(region=self.region)
+        capture.capture_minimized_window.assert_called_once()
+        self.check_region_frame(frame)
+
+    def test_invalid_client_size_full_frame_is_cropped_to_region(self):
+        capture = make_capture()
+        capture.capture_window = mock.Mock(return_value=make_client_image())
+        with mock.patch.object(get_DC, 'win32gui', FakeWin32Gui(client_rect=(0, 0, 0, 0))):
+            frame = WindowFrameSource(1, capture=capture).grab(region=self.region)
+        capture.capture_window.assert_called_once()
+        self.check_region_frame(frame)
+
+    def test_region_sized_bitblt_frame_keeps_origin(self):
+        left, top, width, height = self.region
+        capture = make_capture()
+        capture.capture_window_bitblt = mock.Mock(
+            return_value=make_client_image()[top:top + height, left:left + width].copy())
+        frame = WindowFrameSource(1, capture=capture).grab(region=self.region)
+        self.check_region_frame(frame)
+
+    def test_full_frame_without_region(self):
+        capture = make_capture()
+        capture.capture_minimized_window = mock.Mock(return_value=make_client_image())
+        with mock.patch.object(get_DC, 'win32gui', FakeWin32Gui(minimized=True)):
+            frame = WindowFrameSource(1, capture=capture).grab()
+        self.assertEqual(frame.origin, (0, 0))
+        self.assertEqual(frame.image.shape[:2], (CLIENT_HEIGHT, CLIENT_WIDTH))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+GdiCaptureContext的测试，使用记录调用的替身GDI层，不需要Windows
+运行: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Onmyoji.tools.gdi_context import MAX_BITMAPS, GdiCaptureContext
+
+
+class FakeBitmap:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.deleted = False
+
+
+class FakeGdi:
+    """替身GDI层，记录acquire/release/create_bitmap等调用，位图内容按坐标生成"""
+
+    def __init__(self):
+        self.window_alive = True
+        self.fail_on = None
+        self.calls = []
+        self.acquired = []
+        self.released = []
+        self.bitmaps = []
+        self.selected = None
+        self.blits = []
+
+    def _call(self, name):
+        self.calls.append(name)
+        if self.fail_on == name:
+            raise OSError(f"{name} 调用失败")
+
+    def is_window(self, hwnd):
+        return self.window_alive
+
+    def acquire(self, hwnd):
+        self._call('acquire')
+        handles = ('dc', len(self.acquired))
+        self.acquired.append(handles)
+        return handles
+
+    def release(self, hwnd, handles):
+        self._call('release')
+        self.released.append(handles)
+
+    def create_bitmap(self, handles, width, height):
+        self._call('create_bitmap')
+        bitmap = FakeBitmap(width, height)
+        self.bitmaps.append(bitmap)
+        return bitmap
+
+    def select_bitmap(self, handles, bitmap):
+        self._call('select_bitmap')
+        self.selected = bitmap
+
+    def delete_bitmap(self, bitmap):
+        self._call('delete_bitmap')
+        bitmap.deleted = True
+
+    def bitblt(self, handles, left, top, width, height):
+        self._call('bitblt')
+        self.blits.append((left, top, width, height))
+
+    def print_window(self, hwnd, handles, flags=0):
+        self._call('print_window')
+        return True
+
+    def bitmap_view(self, bitmap, width, height):
+        self._call('bitmap_view')
+        assert (bitmap.width, bitmap.height) == (width, height)
+        assert bitmap is self.selected and not bitmap.deleted
+        return np.full((height, width, 4), 7, dtype=np.uint8)
+
+    @property
+    def live_handles(self):
+        return [handles for handles in self.acquired if handles not in self.released]
+
+    @property
+    def live_bitmaps(self):
+        return [bitmap for bitmap in self.bitmaps if not bitmap.deleted]
+
+
+class GdiCaptureContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.gdi = FakeGdi()
+        self.context = GdiCaptureContext(1234, self.gdi)
+
+    def test_reuses_dc_and_bitmap_for_same_size(self):
+        for _ in range(5):
+            image = self.context.bitblt(100, 80)
+            self.assertEqual(image.shape, (80, 100, 3))
+        self.assertEqual(self.gdi.calls.count('acquire'), 1)
+        self.assertEqual(self.gdi.calls.count('create_bitmap'), 1)
+        self.assertEqual(self.gdi.calls.count('bitblt'), 5)
+        self.assertEqual(self.context.rebuilds, 1)
+        self.assertEqual(self.context.captures, 5)
+
+    def test_rebuilds_on_resize(self):
+        self.context.bitblt(100, 80)
+        first_handles = self.gdi.acquired[0]
+        first_bitmap = self.gdi.bitmaps[0]
+        image = self.context.bitblt(120, 90)
+        self.assertEqual(image.shape, (90, 120, 3))
+        self.assertEqual(self.gdi.calls.count('acquire'), 2)
+        self.assertIn(first_handles, self.gdi.released)
+        self.assertTrue(first_bitmap.deleted)
+        self.assertEqual(len(self.gdi.live_handles), 1)
+        self.assertEqual(len(self.gdi.live_bitmaps), 1)
+        self.assertEqual(self.context.size, (120, 90))
+
+    def test_releases_when_window_is_gone(self):
+        self.context.bitblt(100, 80)
+        self.gdi.window_alive = False
+        self.assertIsNone(self.context.bitblt(100, 80))
+        self.assertEqual(self.gdi.live_handles, [])
+        self.assertEqual(self.gdi.live_bitmaps, [])
+        self.assertIsNone(self.context.size)
+
+    def test_releases_when_gdi_call_raises(self):
+        self.context.bitblt(100, 80)
+        self.gdi.fail_on = 'bitblt'
+        with self.assertRaises(OSError):
+            self.context.bitblt(100, 80)
+        self.assertEqual(self.gdi.live_handles, [])
+        self.assertEqual(self.gdi.live_bitmaps, [])
+        # 下次截图时重建
+        self.gdi.fail_on = None
+        self.assertIsNotNone(self.context.bitblt(100, 80))
+        self.assertEqual(self.gdi.calls.count('acquire'), 2)
+
+    def test_releases_when_bitmap_creation_raises(self):
+        self.gdi.fail_on = 'create_bitmap'
+        with self.assertRaises(OSError):
+            self.context.bitblt(100, 80)
+        self.assertEqual(self.gdi.live_handles, [])
+
+    def test_region_capture_uses_region_sized_bitmap(self):
+        image = self.context.bitblt(1404, 834, region=(100, 200, 50, 40))
+        self.assertEqual(image.shape, (40, 50, 3))
+        self.assertEqual((self.gdi.bitmaps[0].width, self.gdi.bitmaps[0].height), (50, 40))
+        self.assertEqual(self.gdi.blits[-1], (100, 200, 50, 40))
+        # 区域和整窗交替截取时各自的位图都被复用
+        for _ in range(3):
+            self.context.bitblt(1404, 834)
+            self.context.bitblt(1404, 834, region=(100, 200, 50, 40))
+        self.assertEqual(self.gdi.calls.count('acquire'), 1)
+        self.assertEqual(self.gdi.calls.count('create_bitmap'), 2)
+
+    def test_keeps_limited_number_of_bitmaps(self):
+        for size in range(10, 10 + MAX_BITMAPS + 3):
+            self.context.bitblt(200, 200, region=(0, 0, size, size))
+        self.assertEqual(len(self.gdi.live_bitmaps), MAX_BITMAPS)
+        self.assertFalse(self.gdi.selected.deleted)
+
+    def test_release(self):
+        self.context.bitblt(100, 80)
+        self.context.print_window(100, 80)
+        self.context.release()
+        self.assertEqual(self.gdi.live_handles, [])
+        self.assertEqual(self.gdi.live_bitmaps, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+SearchRegions区域学习的测试
+运行: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Onmyoji.tools.search_region import SearchRegions
+
+FRAME_SIZE = (1404, 834)
+
+
+class SearchRegionsLearnTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'learned_regions.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make(self, confirm_hits=3):
+        return SearchRegions(learned_path=self.path, confirm_hits=confirm_hits)
+
+    def hit(self, regions, x, y, times=1):
+        for _ in range(times):
+            regions.learn('tiaozhan', x, y, 100, 50, FRAME_SIZE)
+
+    def test_single_hit_is_not_learned(self):
+        regions = self.make()
+        self.hit(regions, 1200, 700)
+        self.assertIsNone(regions.region_of('tiaozhan'))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_repeated_hits_are_learned_and_saved(self):
+        regions = self.make()
+        self.hit(regions, 1200, 700, times=2)
+        self.hit(regions, 1203, 698)
+        self.assertEqual(regions.learned['tiaozhan'], (1200, 698, 1303, 750))
+        self.assertEqual(self.make().learned['tiaozhan'], (1200, 698, 1303, 750))
+
+    def test_single_false_positive_does_not_widen_region(self):
+        regions = self.make()
+        self.hit(regions, 1200, 700, times=3)
+        learned = regions.learned['tiaozhan']
+        self.hit(regions, 10, 10)
+        self.assertEqual(regions.learned['tiaozhan'], learned)
+        self.assertEqual(self.make().learned['tiaozhan'], learned)
+
+    def test_scattered_hits_do_not_accumulate(self):
+        regions = self.make()
+        self.hit(regions, 1200, 700, times=3)
+        learned = regions.learned['tiaozhan']
+        for x, y in ((10, 10), (600, 10), (10, 400), (600, 400)):
+            self.hit(regions, x, y)
+        self.assertEqual(regions.learned['tiaozhan'], learned)
+
+    def test_confirmed_move_widens_region(self):
+        regions = self.make()
+        self.hit(regions, 1200, 700, times=3)
+        self.hit(regions, 1000, 700, times=3)
+        self.assertEqual(regions.learned['tiaozhan'], (1000, 700, 1300, 750))
+
+    def test_hits_inside_learned_bounds_keep_region(self):
+        regions = self.make()
+        self.hit(regions, 1200, 700, times=3)
+        self.hit(regions, 1200, 700, times=5)
+        self.assertEqual(regions.learned['tiaozhan'], (1200, 700, 1300, 750))
+        self.assertEqual(regions.candidates, {})
+
+
+if __name__ == '__main__':
+    unittest.main()